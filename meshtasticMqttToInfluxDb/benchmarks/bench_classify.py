@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Benchmark del costo per messaggio della classificazione dei payload MQTT.
+
+Confronta il classificatore attuale (topic + sniff a passata singola) con la
+logica precedente (decode UTF-8 doppio, json.loads su tutto, scansione per carattere).
+Il costo della decodifica protobuf è escluso: si misura solo la classificazione.
+
+Uso:
+    PYTHONPATH=meshtasticMqttToInfluxDb python benchmarks/bench_classify.py [--number N]
+"""
+import argparse
+import json
+import timeit
+
+import proto_decode
+from payload_classifier import classify_payload
+from utils import JSON_BACKEND
+
+JSON_PAYLOAD = json.dumps({
+    "channel": 0, "from": 3121379048, "hop_start": 3, "hops_away": 0, "id": 618060111,
+    "payload": {"air_util_tx": 2.41, "battery_level": 101, "channel_utilization": 3.79,
+                "uptime_seconds": 26899, "voltage": 4.221},
+    "rssi": -5, "sender": "!ba6a665c", "snr": 7.25, "timestamp": 1757432919,
+    "to": 4294967295, "type": "telemetry",
+}).encode()
+PROTOBUF_PAYLOAD = b'\nS\r\xe8v\x0c\xba\x15\xff\xff\xff\xff""\x08C\x12\x1c\r\x13i\x00\x00\x12\x15\x08e\x15o\x12\x87@\x1d\xfa\xc5r@%\x0fy\x1a@(\x93\xd2\x01H\x015O\xd9\xd6$=WL\xc0hE\x00\x00\xe8@H\x03`\xfb\xff\xff\xff\xff\xff\xff\xff\xff\x01x\x03\x98\x01\xe8\x01\xa8\x01\x01\x12\nMeshPodere\x1a\t!ba6a665c'
+TEXT_PAYLOAD = b"online"
+
+CASES = [
+    ("json", "msh/EU_868/2/json/MeshPodere/!ba6a665c", JSON_PAYLOAD),
+    ("protobuf", "msh/EU_868/2/e/MeshPodere/!ba6a665c", PROTOBUF_PAYLOAD),
+    ("stat", "msh/EU_868/2/stat/!ba6a665c", TEXT_PAYLOAD),
+]
+
+
+def legacy_classify(payload_bytes):
+    """Classificazione come faceva parse_mqtt_payload prima del classificatore."""
+    try:
+        return "json", json.loads(payload_bytes.decode('utf-8'))
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        pass
+    try:
+        text = payload_bytes.decode('utf-8')
+        if all(ord(c) < 128 and (c.isprintable() or c.isspace()) for c in text):
+            return "text", text
+    except UnicodeDecodeError:
+        pass
+    if proto_decode.is_likely_protobuf(payload_bytes):
+        return "protobuf", None
+    return "binary", None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=100_000, help="Iterazioni per caso")
+    args = parser.parse_args()
+
+    print(f"Backend JSON: {JSON_BACKEND} | iterazioni: {args.number}")
+    print(f"{'caso':<10} {'legacy µs/msg':>14} {'topic µs/msg':>14} {'sniff µs/msg':>14}")
+    for name, topic, payload in CASES:
+        legacy = timeit.timeit(lambda: legacy_classify(payload), number=args.number)
+        routed = timeit.timeit(lambda: classify_payload(payload, topic), number=args.number)
+        sniffed = timeit.timeit(lambda: classify_payload(payload), number=args.number)
+        print(f"{name:<10} {legacy / args.number * 1e6:>14.2f} {routed / args.number * 1e6:>14.2f} "
+              f"{sniffed / args.number * 1e6:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Benchmark della serializzazione dei punti in line protocol.
+
+Confronta Point.from_dict + to_line_protocol del client InfluxDB (percorso
+precedente, con timestamp datetime) con LineProtocolSerializer (timestamp in
+nanosecondi interi, escaping e tipi dei campi in cache).
+
+Uso:
+    PYTHONPATH=meshtasticMqttToInfluxDb python benchmarks/bench_line_protocol.py [--number N]
+"""
+import argparse
+import timeit
+
+from influxdb_client import Point
+
+from line_protocol import LineProtocolSerializer
+from utils import timestamp_to_ns, timestamp_to_utc_datetime
+
+TIMESTAMP = 1757432919
+TAGS = {'gateway': '!ba6a665c', 'node_id': '!ba6a665c', 'to_node_id': '!ffffffff'}
+
+CASES = [
+    ("telemetry", {
+        'measurement': 'telemetry',
+        'tags': TAGS,
+        'fields': {'air_util_tx': 2.41, 'battery_level': 101.0, 'channel_utilization': 3.79,
+                   'uptime_seconds': 26899.0, 'voltage': 4.221},
+    }),
+    ("nodeinfo", {
+        'measurement': 'nodeinfo',
+        'tags': {**TAGS, 'hardware': '43', 'longname': 'Meshtastic Podere 665c', 'shortname': '665c'},
+        'fields': {'packet_id': 618060111},
+    }),
+    ("position", {
+        'measurement': 'position',
+        'tags': TAGS,
+        'fields': {'altitude': 112.0, 'latitude_i': 437612345.0, 'longitude_i': 112345678.0,
+                   'precision_bits': 13.0, 'sats_in_view': 9.0},
+    }),
+]
+
+
+def legacy_serialize(point_dict):
+    """Percorso precedente: datetime UTC + Point.from_dict."""
+    point_dict = {**point_dict, 'time': timestamp_to_utc_datetime(TIMESTAMP)}
+    return Point.from_dict(point_dict).to_line_protocol().encode('utf-8')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=50_000, help="Iterazioni per caso")
+    args = parser.parse_args()
+
+    serializer = LineProtocolSerializer()
+    print(f"Iterazioni: {args.number}")
+    print(f"{'caso':<10} {'Point µs/pt':>12} {'serializer µs/pt':>17} {'speedup':>8}")
+    for name, point_dict in CASES:
+        assert legacy_serialize(point_dict) == serializer.serialize(
+            {**point_dict, 'time': timestamp_to_ns(TIMESTAMP)}), name
+        legacy = timeit.timeit(lambda: legacy_serialize(point_dict), number=args.number)
+        fast = timeit.timeit(
+            lambda: serializer.serialize({**point_dict, 'time': timestamp_to_ns(TIMESTAMP)}),
+            number=args.number)
+        print(f"{name:<10} {legacy / args.number * 1e6:>12.2f} {fast / args.number * 1e6:>17.2f} "
+              f"{legacy / fast:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
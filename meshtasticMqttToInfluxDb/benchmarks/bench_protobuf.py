@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Benchmark della conversione dei ServiceEnvelope protobuf nei campi dei punti.
+
+Confronta tre percorsi, dal payload MQTT ai campi della measurement:
+- dict ricorsivo: proto_decode.decode_protobuf (MessageToDict su ogni livello,
+  base64 del payload annidato, nuova decodifica), poi i campi dal dizionario;
+- MessageToDict: envelope_to_json_message con i payload convertiti da MessageToDict;
+- tipizzato: envelope_to_json_message con i campi letti direttamente dai messaggi.
+Prima di misurare verifica che i tre percorsi producano lo stesso punto: il dizionario
+ricorsivo viene riportato ai nomi dei campi proto (camelCase ed enum per nome in MessageToDict).
+
+Uso:
+    PYTHONPATH=meshtasticMqttToInfluxDb python benchmarks/bench_protobuf.py [--number N]
+"""
+import argparse
+import timeit
+
+from google.protobuf.json_format import MessageToDict
+from meshtastic.protobuf import mesh_pb2, mqtt_pb2, portnums_pb2, telemetry_pb2
+
+import meshpacket
+import proto_decode
+from measurement_schema import MeasurementSchema
+
+TOPIC = "msh/EU_868/2/e/MeshPodere/!ba6a665c"
+
+
+def make_envelope(portnum, message):
+    envelope = mqtt_pb2.ServiceEnvelope(channel_id="MeshPodere", gateway_id="!ba6a665c")
+    packet = envelope.packet
+    setattr(packet, "from", 0xba0c76e8)
+    packet.to = 0xffffffff
+    packet.id = 618060111
+    packet.rx_time = 1757432919
+    packet.rx_snr = 7.25
+    packet.rx_rssi = -5
+    packet.hop_start = 3
+    packet.hop_limit = 3
+    packet.decoded.portnum = portnum
+    packet.decoded.payload = message.SerializeToString()
+    return envelope.SerializeToString()
+
+
+def telemetry_case():
+    telemetry = telemetry_pb2.Telemetry(time=1757432919)
+    metrics = telemetry.device_metrics
+    metrics.battery_level = 101
+    metrics.voltage = 4.221
+    metrics.channel_utilization = 3.79
+    metrics.air_util_tx = 2.41
+    metrics.uptime_seconds = 26899
+    return make_envelope(portnums_pb2.TELEMETRY_APP, telemetry)
+
+
+def environment_case():
+    telemetry = telemetry_pb2.Telemetry(time=1757432919)
+    metrics = telemetry.environment_metrics
+    metrics.temperature = 21.37
+    metrics.relative_humidity = 54.2
+    metrics.barometric_pressure = 1013.25
+    metrics.gas_resistance = 112.5
+    metrics.iaq = 37
+    return make_envelope(portnums_pb2.TELEMETRY_APP, telemetry)
+
+
+def position_case():
+    position = mesh_pb2.Position(latitude_i=437612345, longitude_i=112345678, altitude=112, time=1757432919,
+                                 location_source=1, precision_bits=13, sats_in_view=9, ground_speed=2)
+    return make_envelope(portnums_pb2.POSITION_APP, position)
+
+
+CASES = [
+    ("telemetry", telemetry_case()),
+    ("environment", environment_case()),
+    ("position", position_case()),
+]
+
+
+def legacy_payload(message):
+    return MessageToDict(message, preserving_proto_field_name=True, use_integers_for_enums=True)
+
+
+def legacy_decode_telemetry(payload):
+    telemetry = telemetry_pb2.Telemetry()
+    telemetry.ParseFromString(payload)
+    variant = telemetry.WhichOneof('variant')
+    return legacy_payload(getattr(telemetry, variant)) if variant is not None else {}
+
+
+def legacy_decode_position(payload):
+    position = mesh_pb2.Position()
+    position.ParseFromString(payload)
+    return legacy_payload(position)
+
+
+LEGACY_DECODERS = {**meshpacket.PAYLOAD_DECODERS,
+                   'telemetry': legacy_decode_telemetry, 'position': legacy_decode_position}
+TYPED_DECODERS = dict(meshpacket.PAYLOAD_DECODERS)
+
+
+def field_names(descriptor, values):
+    """Chiavi camelCase di MessageToDict nei nomi dei campi proto ed enum come interi, come nel payload dei gateway."""
+    payload = {}
+    for key, value in values.items():
+        field = descriptor.fields_by_camelcase_name.get(key)
+        if field is None:  # es. __proto_type__ aggiunto da proto_decode
+            continue
+        if field.enum_type is not None and isinstance(value, str):
+            value = field.enum_type.values_by_name[value].number
+        payload[field.name] = value
+    return payload
+
+
+def recursive_dict_fields(schema, payload_bytes):
+    """Percorso di proto_decode: dizionario ricorsivo dell'envelope, poi i campi del payload decodificato."""
+    decoded = proto_decode.decode_protobuf(payload_bytes, TOPIC)
+    inner = decoded['packet']['decoded']['payload_decoded']
+    if decoded['packet']['decoded']['portnum'] == 'TELEMETRY_APP':
+        # Il dizionario ha la variante come chiave (es. deviceMetrics)
+        variant = next(key for key in inner if key.endswith('Metrics'))
+        descriptor = telemetry_pb2.Telemetry.DESCRIPTOR.fields_by_camelcase_name[variant].message_type
+        return schema.convert('telemetry', field_names(descriptor, inner[variant]))
+    return schema.convert('position', field_names(mesh_pb2.Position.DESCRIPTOR, inner))
+
+
+def envelope_fields(schema, payload_bytes, decoders):
+    meshpacket.PAYLOAD_DECODERS.update(decoders)
+    message = meshpacket.envelope_to_json_message(payload_bytes)
+    return schema.convert(message['type'], message['payload'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=20_000, help="Iterazioni per caso")
+    args = parser.parse_args()
+
+    schema = MeasurementSchema.from_file("")
+    print(f"Iterazioni: {args.number}")
+    print(f"{'caso':<12} {'dict ricorsivo µs':>18} {'MessageToDict µs':>17} {'tipizzato µs':>13} {'speedup':>8}")
+    for name, payload_bytes in CASES:
+        # I tre percorsi devono produrre lo stesso punto, altrimenti il confronto dei tempi non ha senso
+        typed_point = envelope_fields(schema, payload_bytes, TYPED_DECODERS)
+        assert envelope_fields(schema, payload_bytes, LEGACY_DECODERS) == typed_point, name
+        assert recursive_dict_fields(schema, payload_bytes) == typed_point, name
+        recursive = timeit.timeit(lambda: recursive_dict_fields(schema, payload_bytes), number=args.number)
+        meshpacket.PAYLOAD_DECODERS.update(LEGACY_DECODERS)
+        legacy = timeit.timeit(lambda: envelope_fields(schema, payload_bytes, {}), number=args.number)
+        meshpacket.PAYLOAD_DECODERS.update(TYPED_DECODERS)
+        typed = timeit.timeit(lambda: envelope_fields(schema, payload_bytes, {}), number=args.number)
+        print(f"{name:<12} {recursive / args.number * 1e6:>18.2f} {legacy / args.number * 1e6:>17.2f} "
+              f"{typed / args.number * 1e6:>13.2f} {recursive / typed:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
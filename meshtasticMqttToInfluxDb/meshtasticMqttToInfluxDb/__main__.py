@@ -2,7 +2,7 @@
 """
 Script per sottoscriversi al server MQTT Meshtastic e stampare ogni pacchetto ricevuto.
 """
-from config import config
+from config import config, validate_config
 import sys
 
 import json
@@ -10,59 +10,47 @@ import time
 from datetime import datetime, timezone
 import base64
 import argparse
+import functools
+import logging
+import os
+import signal
+import threading
 import proto_decode
 from mqtt import MqttClient
 from influxdb import InfluxdbClient
-from utils import print_json, get_node_id, get_utc_timestamp, timestamp_to_utc_datetime
-from influxdb_client import InfluxDBClient, Point
+from ingest_queue import IngestQueue
+from payload_classifier import classify_payload
+from channel_crypto import ChannelKeyring
+from meshpacket import envelope_to_json_message
+from dedup import SeenPacketCache
+from node_registry import NodeRegistry
+from measurement_schema import MeasurementSchema
+from rollup import RollupAggregator, parse_windows
+from compression import PointCompressor, parse_compression
+from shedding import LoadShedder, parse_priority_classes
+from topic_router import TopicRouter, parse_subscriptions
+from home_assistant import HomeAssistantPublisher
+from sinks import parse_sinks, InfluxSink, HomeAssistantSink, FileSink, LogSink
+from line_protocol import LineProtocolSerializer
+from capture import CaptureWriter
+from log import LazyJson, setup_logging_from_config, shutdown_logging
+import log
+from supervisor import WorkerSupervisor, StatsReporter, run_script_function
+import metrics
+from metrics import MESSAGES, IMPORTED, DECODE_FAILURES, WRITE_ERRORS, STAGE_SECONDS
+from metrics import ROUTE_MESSAGES, ROUTE_BYTES, ROUTE_SECONDS
+from utils import print_json, get_node_id, get_utc_timestamp, timestamp_to_utc_datetime, timestamp_to_ns, json_loads
 
+logger = logging.getLogger("main")
 
-def parse_mqtt_payload(payload_bytes):
-    """
-    Analizza il tipo di payload e restituisce informazioni utili.
-    """
-    info = {
-        "size": len(payload_bytes),
-        "type": "unknown"
-    }
-    
-    # Prova JSON
-    try:
-        text = payload_bytes.decode('utf-8')
-        json_data = json.loads(text)
-        info["type"] = "json"
-        info["content"] = json_data
-        return info
-    except (UnicodeDecodeError, json.JSONDecodeError):
-        pass
-    
-    # Prova testo normale
-    try:
-        text = payload_bytes.decode('utf-8')
-        # Se decodifica senza errori e contiene caratteri stampabili
-        if all(ord(c) < 128 and (c.isprintable() or c.isspace()) for c in text):
-            info["type"] = "text"
-            info["content"] = text
-            return info
-    except UnicodeDecodeError:
-        pass
-    
-    # Controlla se potrebbe essere protobuf
-    if proto_decode.is_likely_protobuf(payload_bytes):
-        result = proto_decode.decode_protobuf(payload_bytes)
-        info["type"] = "protobuf"
-        info["content"] = result
-        return info
-    else:
-        info["type"] = "binary"
-        info["content"] = payload_bytes
-        return info
-    
-    # Informazioni generali sui dati binari
-    info["hex"] = payload_bytes.hex()
-    info["base64"] = base64.b64encode(payload_bytes).decode('ascii')
-    
-    return info
+line_serializer = LineProtocolSerializer()
+# Indice del processo di ingest quando gestito dal supervisore (--workers)
+worker_index = None
+rollup_writer = None
+# Destinazioni dei punti (SINKS) e client InfluxDB dei sink influxdb, per nome
+sinks = []
+influx_clients = {}
+influxdb_client = None
 
 def is_meshtastic_json_mqtt_message_callback(data):
     """
@@ -73,138 +61,357 @@ def is_meshtastic_json_mqtt_message_callback(data):
     return False
 
 def prepare_influxdb_point(data, timestamp=None):
-    point_dict = None
-    # Gestisci i diversi tipi di dati
-    if is_meshtastic_json_mqtt_message_callback(data): 
-        point_dict = {}
-        sender_id = data['sender']
-        from_node_id = get_node_id(data['from'])
-        to_node_id = get_node_id(data['to'])
-
-        # Converte il timestamp in datetime UTC usando la funzione di utilità
-        point_dict['measurement'] = data['type'] 
-        point_dict['time'] = timestamp_to_utc_datetime(data['timestamp'])
-        point_dict['tags'] = {
-            'gateway': sender_id,
-            'node_id': from_node_id,
-            'to_node_id': to_node_id
-        }
-        point_dict['fields'] = {
-        }
-
-        if data['type'] == 'telemetry':
-            point_dict['fields'].update(data['payload'])
-        elif data['type'] == 'nodeinfo':
-            point_dict['tags'].update({
-                'hardware': data['payload']['hardware'],
-                'longname': data['payload']['longname'],
-                'shortname': data['payload']['shortname']
-            })
-        elif data['type'] == 'position':
-            point_dict['fields'].update(data['payload'])
-        elif data['type'] == 'text':
-            if data['payload'] and 'type' in data['payload'] and data['payload']['type'] == 'custom_metrics':
-                point_dict['measurement'] = 'custom_metrics'
-                for metric in data['payload']['metrics']:
-                    point_dict['fields'][metric["name"]] = metric["value"]
-            else:
-                print("📨📨📨 Text Message 📨📨📨")
-                print(f"From: {data['from']} ")
-                print(f"To: {data['to']}")
-                print(f"{data['payload']['text']}")
-                point_dict = None
-                # print(f"Recived text message: {print_json(data)}")
-        else:   
-            print(f"skipping message type: {data['type'] or 'unknown'}")
-            # print(f"💾 Unknown type: {data['type']} \ndata: {json.dumps(data, indent=2, ensure_ascii=False)} \n point_dict: {json.dumps(point_dict, indent=2, ensure_ascii=False)}")
-            point_dict = None
-    else:
-        print(f"❌ try_to_import_message: data non è un messaggio JSON di Meshtastic")
+    """
+    Converte un messaggio JSON Meshtastic nel punto InfluxDB dichiarato dallo schema
+    delle measurement (vedi measurement_schema.py).
+    """
+    if not is_meshtastic_json_mqtt_message_callback(data):
+        logger.warning("❌ try_to_import_message: data non è un messaggio JSON di Meshtastic")
         return
-   
-    # print(f"📨 try_to_import_message: point_dict:{print_json(point_dict)}")
-   
-    # Converti tutti i campi in point_dict['fields'] che sono float o integer in float
-    if point_dict and 'fields' in point_dict:
-        for key, value in point_dict['fields'].items():
-            if isinstance(value, (int, float)):
-                point_dict['fields'][key] = float(value)
-
-                
-    return point_dict
+
+    message_type = data['type']
+    converted = measurement_schema.convert(message_type, data.get('payload'))
+    if converted is None:
+        if message_type == 'text' and isinstance(data['payload'], dict):
+            logger.info("📨 Text Message da %s a %s: %s", data['from'], data['to'], data['payload'].get('text'))
+        else:
+            logger.debug("skipping message type: %s", message_type or 'unknown')
+        return None
+
+    measurement, tags, fields = converted
+    from_node_id = get_node_id(data['from'])
+    tags['gateway'] = data['sender']
+    tags['node_id'] = from_node_id
+    tags['to_node_id'] = get_node_id(data['to'])
+    if message_type == 'nodeinfo':
+        # Solo i valori ammessi dal limite di cardinalità diventano tag
+        tags.update(node_registry.update(from_node_id, data['payload']))
+    else:
+        # Nome e hardware del nodo mittente, se già noti dal suo nodeinfo
+        tags.update(node_registry.tags_for(from_node_id))
+
+    return {
+        'measurement': measurement,
+        # Timestamp in nanosecondi interi, come richiesto dal line protocol
+        'time': timestamp_to_ns(data['timestamp']),
+        'tags': tags,
+        'fields': fields,
+    }
+
+def prepare_reception_point(data):
+    """
+    Punto compatto con la qualità di ricezione di un pacchetto su un gateway.
+    Scritto per ogni copia ricevuta, anche quando il pacchetto è un duplicato.
+    """
+    fields = {}
+    for key in ('snr', 'rssi', 'hops_away', 'hop_start'):
+        if isinstance(data.get(key), (int, float)):
+            fields[key] = float(data[key])
+    fields['packet_id'] = int(data['id'])
+    return {
+        'measurement': 'reception',
+        'time': timestamp_to_ns(data['timestamp']),
+        'tags': {
+            'gateway': data['sender'],
+            'node_id': get_node_id(data['from']),
+            'type': data['type'],
+        },
+        'fields': fields,
+    }
+
+def check_duplicate_packet(data):
+    """
+    Registra la ricezione del pacchetto nell'indice dei pacchetti visti.
+
+    Returns:
+        bool: True se lo stesso pacchetto è già stato importato tramite un altro gateway
+    """
+    if seen_packets is None or not is_meshtastic_json_mqtt_message_callback(data) or not data.get('id'):
+        return False
+    duplicate = seen_packets.check(data['from'], data['id'])
+    if config['DEDUP_MODE'] == 'reception':
+        write_to_sinks(prepare_reception_point(data))
+    return duplicate
 
 def try_to_import_message( data, timestamp=None):
     """
     Scrive i dati decodificati in InfluxDB.
     """
-    point_dict = prepare_influxdb_point(data, timestamp)
-    if point_dict is None:
+    message_type = data.get('type') if isinstance(data, dict) else None
+    IMPORTED.inc(message_type or 'unknown')
+    if check_duplicate_packet(data):
         return
 
-    share_poit_for_home_assistant(point_dict)
-
-    if args.dry_run:
-        print(f"🚀 try_to_import_message dry-run -> point_dict: \n{point_dict}")
+    with STAGE_SECONDS.time('prepare'):
+        point_dict = prepare_influxdb_point(data, timestamp)
+    if point_dict is None:
+        return
+    if not any(value is not None for value in point_dict['fields'].values()):
+        # Es. nodeinfo: aggiorna solo il registro dei nodi, non c'è nulla da scrivere
+        logger.debug("🔍 Punto senza campi, non scritto: %s", point_dict['measurement'])
+        return
+    # Sotto carico o per un nodo che trasmette troppo: scartato prima di rollup e sink
+    if not load_shedder.admit(point_dict, data.get('id')):
         return
-    
-    
-    try:
-        point = Point.from_dict(point_dict)
-        # InfluxDB richiede sempre timestamp in UTC
-        influxdb_client.write_api.write(bucket=config['INFLUXDB_BUCKET'], org=config['INFLUXDB_ORG'], record=point) 
-        print(f"💾 Point written in InfluxDB: {point}")
-    except Exception as e:
-        print(e)
-        print(f"❌ Errore scrittura InfluxDB: {e} ")
-        # Debug: stampa il point per vedere cosa è andato storto
-        print(f"🔍 Debug point: {point} \n data: {print_json(point_dict)}")
 
-    return
+    if rollup is not None:
+        with STAGE_SECONDS.time('rollup'):
+            rollup.add(point_dict)
+    # I rollup aggregano i valori grezzi, i sink ricevono solo quelli che superano la compressione
+    points = (point_dict,)
+    if compressor is not None:
+        with STAGE_SECONDS.time('compress'):
+            points = compressor.compress(point_dict)
+    with STAGE_SECONDS.time('write'):
+        for point in points:
+            write_to_sinks(point)
 
-def share_poit_for_home_assistant(point_dict):
+def write_to_sinks(point_dict):
     """
-    Condividi il punto per Home Assistant.
+    Accoda il punto in tutti i sink: ognuno lo invia dal proprio thread (vedi sinks.py).
     """
-    # print(f"🔍 share_poit_for_home_assistant: {point_dict}")
+    for sink in sinks:
+        try:
+            sink.write(point_dict)
+        except Exception as e:
+            WRITE_ERRORS.inc()
+            # Il punto viene serializzato solo se il record viene scritto
+            logger.error("❌ Errore nell'accodamento al sink %s: %s\n🔍 Debug point: %s", sink.name, e,
+                         LazyJson(point_dict))
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("💾 Point queued: %s", LazyJson(point_dict))
 
-    node_id = point_dict['tags']['node_id']
-
-    if point_dict['measurement'] in ['telemetry', 'custom_metrics']:
-        for key, value in point_dict['fields'].items():
-            topic = f"homeassitant/sensor/{node_id}/{key}"
-            # print(f"🔍 topic: {topic} value: {value}")
-            mqtt_client.publish(topic, value)
-        
+def flush_compressor():
+    """Scrive i valori trattenuti dallo swinging door, prima della chiusura dei sink."""
+    if compressor is None:
+        return
+    for point_dict in compressor.flush():
+        write_to_sinks(point_dict)
+    logger.info("📊 Statistiche compressione: %s", compressor.get_stats())
 
-    return
+def write_rollup_points(points):
+    """
+    Scrive nel bucket dei rollup, in un'unica richiesta accodata, gli aggregati delle finestre chiuse.
+    """
+    if rollup_writer is None:
+        return
+    try:
+        rollup_writer.write(line_serializer.serialize_many(points))
+    except Exception as e:
+        WRITE_ERRORS.inc()
+        logger.error("❌ Errore scrittura rollup: %s", e)
 
-def on_mqtt_message_callback(msg):
-    """Callback chiamata quando viene ricevuto un messaggio."""
-    timestamp = get_utc_timestamp()
-    # print(f"📨 on_mqtt_message_callback: timestamp:{timestamp} ")
+def process_mqtt_message(topic, payload, receive_ts):
+    """
+    Elabora un messaggio ricevuto. Chiamata dai worker della coda di ingest,
+    non dal thread di rete MQTT.
+    """
+    timestamp = timestamp_to_utc_datetime(receive_ts)
+    # print(f"📨 process_mqtt_message: timestamp:{timestamp} ")
     # timestamp_str = timestamp.strftime("%Y-%m-%d %H:%M:%S UTC")
-    # topic = msg.topic
     # print(f"\n📨 [{timestamp_str}] Topic: {topic}")
-    # print(f"📨 msg: {msg}")
 
     # Analizza il tipo di payload
-    msg_parsed = parse_mqtt_payload(msg.payload)
+    with STAGE_SECONDS.time('parse'):
+        payload_type, content = classify_payload(payload, topic)
+    MESSAGES.inc(payload_type)
     
-    if msg_parsed['type'] == 'json':
-        try_to_import_message(msg_parsed['content'], timestamp)
-    elif msg_parsed['type'] == 'text':
-        print(f"📦 skip msg type text {print_json(msg_parsed)}")
+    if payload_type == 'json':
+        try_to_import_message(content, timestamp)
+    elif payload_type == 'text':
+        logger.debug("📦 skip msg type text %s", LazyJson(content))
         pass
         
-    elif msg_parsed['type'] == 'protobuf':
-        print(f"📦 skip msg type protobuf")
-        pass
+    elif payload_type == 'protobuf':
+        import_protobuf_envelope(payload, timestamp)
     else:  # binary
-        print(f"📦 skip msg type binary")
-        pass
-    
-    
-    print("-" * 80)
+        DECODE_FAILURES.inc(payload_type)
+        logger.debug("📦 skip msg type binary")
+
+def import_protobuf_envelope(payload, timestamp):
+    """ServiceEnvelope dai topic /e/ e /c/: decifrato e convertito nel formato JSON dei gateway."""
+    if channel_keyring is None:
+        logger.debug("📦 skip msg type protobuf")
+        return
+    # Stadio a parte: con l'handler "auto" la classificazione è già contata in 'parse'
+    with STAGE_SECONDS.time('decode'):
+        data = envelope_to_json_message(payload, channel_keyring)
+    if data is None:
+        DECODE_FAILURES.inc('protobuf')
+        logger.debug("📦 skip msg type protobuf: non decifrabile o tipo non gestito")
+    else:
+        try_to_import_message(data, timestamp)
+
+def process_json_message(topic, payload, receive_ts):
+    """Handler "json": il payload è un messaggio JSON dei gateway, senza classificazione."""
+    with STAGE_SECONDS.time('parse'):
+        try:
+            data = json_loads(payload)
+        except ValueError:
+            data = None
+    MESSAGES.inc('json')
+    if isinstance(data, dict):
+        try_to_import_message(data, timestamp_to_utc_datetime(receive_ts))
+    else:
+        DECODE_FAILURES.inc('json')
+        logger.debug("📦 skip msg su %s: JSON non valido", topic)
+
+def process_protobuf_message(topic, payload, receive_ts):
+    """Handler "protobuf": il payload è un ServiceEnvelope, senza classificazione."""
+    MESSAGES.inc('protobuf')
+    import_protobuf_envelope(payload, timestamp_to_utc_datetime(receive_ts))
+
+def ignore_mqtt_message(topic, payload, receive_ts):
+    """Handler "ignore": il messaggio è solo contato dal router."""
+
+# Handler utilizzabili in MQTT_SUBSCRIPTIONS
+ROUTE_HANDLERS = {
+    'auto': process_mqtt_message,
+    'json': process_json_message,
+    'protobuf': process_protobuf_message,
+    'ignore': ignore_mqtt_message,
+}
+
+def sync_route_metrics():
+    """
+    Copia i contatori del router nelle metriche meshtastic_route_*: letti al momento
+    dello scrape invece che aggiornati per ogni messaggio.
+    """
+    routes = topic_router.get_stats()['routes']
+    ROUTE_MESSAGES.restore({(topic_filter,): stats['messages'] for topic_filter, stats in routes.items()})
+    ROUTE_BYTES.restore({(topic_filter,): stats['bytes'] for topic_filter, stats in routes.items()})
+    ROUTE_SECONDS.restore({(topic_filter,): stats['seconds'] for topic_filter, stats in routes.items()})
+
+def build_topic_router():
+    """
+    Router dei filtri di MQTT_SUBSCRIPTIONS verso i rispettivi handler.
+    Solleva ValueError se un filtro o un handler non è valido.
+    """
+    router = TopicRouter()
+    for topic_filter, handler_name in parse_subscriptions(config['MQTT_SUBSCRIPTIONS'], config.get('MQTT_ROOT_TOPIC')):
+        if handler_name not in ROUTE_HANDLERS:
+            raise ValueError(f"MQTT_SUBSCRIPTIONS: handler '{handler_name}' non valido per '{topic_filter}' "
+                             f"(ammessi: {', '.join(ROUTE_HANDLERS)})")
+        router.add(topic_filter, ROUTE_HANDLERS[handler_name], handler_name)
+    return router
+
+def log_route_stats():
+    """Costo di ogni filtro sottoscritto, alla chiusura."""
+    stats = topic_router.get_stats()
+    for topic_filter, route_stats in stats['routes'].items():
+        logger.info("📊 Statistiche route %s: %s", topic_filter, route_stats)
+    if stats['unmatched']:
+        logger.info("📊 Messaggi senza route: %d", stats['unmatched'])
+
+def route_mqtt_message(topic, payload, receive_ts):
+    """
+    Handler della coda di ingest: instrada il messaggio in base al filtro che ne
+    corrisponde il topic (i messaggi di filtri non configurati sono solo contati).
+    """
+    topic_router.dispatch(topic, payload, receive_ts)
+
+# Statistiche dei componenti esportate come metriche: (nome, prefisso, chiavi gauge, descrizione)
+STATS_COMPONENTS = (
+    ('ingest', "meshtastic_ingest", ('depth', 'max_depth', 'maxsize'), "Coda di ingest"),
+    ('topic_router', "meshtastic_topic_router", ('cached_topics',),
+     "Instradamento dei topic MQTT (i contatori per filtro sono meshtastic_route_*)"),
+    ('influxdb', "meshtastic_influxdb", (), "Scrittura InfluxDB"),
+    ('spool', "meshtastic_spool", ('segments', 'disk_bytes'), "Spool su disco"),
+    ('home_assistant', "meshtastic_home_assistant", ('nodes', 'pending'), "Publisher Home Assistant"),
+    ('dedup', "meshtastic_dedup", ('size',), "De-duplicazione pacchetti"),
+    ('shedding', "meshtastic_shedding", ('load', 'buckets'), "Punti ammessi e scartati per classe di priorità"),
+    ('schema', "meshtastic_schema", (), "Conversione dei messaggi in punti"),
+    ('compression', "meshtastic_compression", ('series',), "Compressione dei punti prima dei sink"),
+    ('rollup', "meshtastic_rollup", ('series',), "Aggregati per finestra (rollup)"),
+    ('rollup_influxdb', "meshtastic_rollup_influxdb", (), "Scrittura dei rollup su InfluxDB"),
+    ('node_registry', "meshtastic_node_registry", ('nodes', 'values_longname', 'values_shortname', 'values_hardware'),
+     "Registro dei nodi e limite di cardinalità dei tag"),
+    ('logging', "meshtastic_logging", ('queued',), "Record di log scartati, soppressi e in coda"),
+)
+
+def stats_components():
+    """STATS_COMPONENTS più un componente sink_<nome> per ogni sink di SINKS."""
+    return STATS_COMPONENTS + tuple(
+        (f"sink_{name}", f"meshtastic_sink_{name}", ('depth', 'healthy'), f"Sink {name} ({sink_type})")
+        for name, sink_type, _ in parse_sinks(config['SINKS'])
+    )
+
+def stats_sources(ingest_queue):
+    """Funzioni get_stats dei componenti attivi, per nome (vedi stats_components())."""
+    sources = {
+        'ingest': ingest_queue.get_stats,
+        'topic_router': topic_router.get_stats,
+        'home_assistant': ha_publisher.get_stats,
+        'schema': measurement_schema.get_stats,
+        'shedding': load_shedder.get_stats,
+        'node_registry': node_registry.get_stats,
+        'logging': log.get_stats,
+    }
+    for sink in sinks:
+        sources[f"sink_{sink.name}"] = sink.get_stats
+    if influxdb_client is not None:
+        sources['influxdb'] = influxdb_client.get_stats
+        if influxdb_client.spool is not None:
+            sources['spool'] = influxdb_client.spool.get_stats
+    if seen_packets is not None:
+        sources['dedup'] = seen_packets.get_stats
+    if compressor is not None:
+        sources['compression'] = compressor.get_stats
+    if rollup is not None:
+        sources['rollup'] = rollup.get_stats
+    if rollup_writer is not None:
+        sources['rollup_influxdb'] = rollup_writer.get_stats
+    return sources
+
+def start_metrics_endpoint(ingest_queue):
+    """
+    Registra le metriche calcolate al momento dello scrape e avvia l'endpoint HTTP.
+    """
+    registry = metrics.REGISTRY
+    registry.on_render(sync_route_metrics)
+    registry.gauge("meshtastic_ingest_queue_depth", "Messaggi in attesa nella coda di ingest",
+                   function=ingest_queue.depth)
+    registry.gauge("meshtastic_mqtt_connected", "1 se il client è connesso al broker MQTT",
+                   function=lambda: int(mqtt_client.get_status()['connected']))
+    sources = stats_sources(ingest_queue)
+    for name, prefix, gauges, documentation in stats_components():
+        if name in sources:
+            registry.register_stats(prefix, sources[name], gauges=gauges, documentation=documentation)
+    metrics.register_process_metrics(registry)
+    metrics.start_http_server(config['METRICS_PORT'], config['METRICS_HOST'])
+    logger.info("📈 Metriche disponibili su http://%s:%s/metrics", config['METRICS_HOST'], config['METRICS_PORT'])
+
+def collect_worker_stats(ingest_queue):
+    """Report inviato da un processo di ingest al supervisore."""
+    sync_route_metrics()
+    return {
+        'metrics': metrics.REGISTRY.snapshot(),
+        'stats': {name: get_stats() for name, get_stats in stats_sources(ingest_queue).items()},
+        'mqtt_connected': mqtt_client.get_status()['connected'],
+        'rss_bytes': metrics.read_rss_bytes(),
+    }
+
+def start_supervisor_metrics(supervisor):
+    """
+    Endpoint delle metriche del supervisore: contatori e istogrammi sommati su tutti
+    i processi, statistiche dei componenti sommate sui processi attivi.
+    """
+    registry = metrics.REGISTRY
+    # Prima di ogni scrape le metriche locali (a zero) vengono sostituite dalla somma dei processi
+    registry.on_render(lambda: registry.load_snapshot(supervisor.metrics_snapshot()))
+    registry.register_stats("meshtastic_supervisor", supervisor.get_stats,
+                            gauges=('processes', 'alive', 'mqtt_connected'),
+                            documentation="Supervisore dei processi di ingest")
+    registry.gauge("meshtastic_ingest_queue_depth", "Messaggi in attesa nelle code di ingest di tutti i processi",
+                   function=lambda: supervisor.component_stats('ingest').get('depth', 0))
+    registry.gauge("meshtastic_worker_resident_memory_bytes", "Memoria residente dei processi di ingest",
+                   ["worker"], function=lambda: supervisor.worker_values('rss_bytes'))
+    for name, prefix, gauges, documentation in stats_components():
+        registry.register_stats(prefix, lambda name=name: supervisor.component_stats(name),
+                                gauges=gauges, documentation=documentation)
+    metrics.register_process_metrics(registry)
+    metrics.start_http_server(config['METRICS_PORT'], config['METRICS_HOST'])
+    logger.info("📈 Metriche disponibili su http://%s:%s/metrics", config['METRICS_HOST'], config['METRICS_PORT'])
 
 def parse_arguments():
     """
@@ -217,6 +424,11 @@ def parse_arguments():
         Esempi di utilizzo:
         python mqtt_subscriber.py                    # Modalità normale
         python mqtt_subscriber.py --test             # Modalità test InfluxDB
+        python mqtt_subscriber.py --record traffico.cap          # Registra il traffico MQTT
+        python mqtt_subscriber.py --replay traffico.cap --speed max  # Benchmark end-to-end
+        python mqtt_subscriber.py --workers 4        # 4 processi in una sottoscrizione condivisa
+        python mqtt_subscriber.py --backfill 2024-*.jsonl.gz     # Importa archivi storici
+        python mqtt_subscriber.py --profile profilo.txt --profile-seconds 120  # Report di profilazione
         python mqtt_subscriber.py --help             # Mostra questo aiuto
 
         Per più informazioni consulta il README.md
@@ -235,6 +447,68 @@ def parse_arguments():
         help="Modalità dry-run: non salva i dati in InfluxDB"
     )
     
+    parser.add_argument(
+        "--record",
+        metavar="FILE",
+        help="Registra il traffico MQTT grezzo nel file indicato (riproducibile con --replay)"
+    )
+
+    parser.add_argument(
+        "--replay",
+        metavar="FILE",
+        help="Riproduce un file registrato con --record contro sink locali finti e stampa un report"
+    )
+
+    parser.add_argument(
+        "--speed",
+        default="1",
+        help="Velocità del replay: moltiplicatore del ritmo registrato (es. 10) o 'max' (default: 1)"
+    )
+    
+    parser.add_argument(
+        "--backfill",
+        nargs="+",
+        metavar="FILE",
+        help="Importa archivi storici (cattura di --record, JSONL o dump MQTT JSONL, anche .gz) ed esce"
+    )
+
+    parser.add_argument(
+        "--checkpoint",
+        default=config['BACKFILL_CHECKPOINT'],
+        metavar="FILE",
+        help="Checkpoint di --backfill, per riprendere un'importazione interrotta (default: BACKFILL_CHECKPOINT)"
+    )
+
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=config['WORKER_PROCESSES'],
+        metavar="N",
+        help="Processi di ingest in una sottoscrizione MQTT condivisa (default: WORKER_PROCESSES o 1)"
+    )
+
+    parser.add_argument(
+        "--profile",
+        metavar="REPORT",
+        help="Esegue sotto cProfile e tracemalloc e scrive un report (stadi, funzioni, allocazioni) nel file"
+    )
+
+    parser.add_argument(
+        "--profile-seconds",
+        type=float,
+        default=60.0,
+        metavar="S",
+        help="Durata della profilazione del servizio in secondi (default: 60; 0 = fino all'arresto)"
+    )
+
+    parser.add_argument(
+        "--profile-messages",
+        type=int,
+        default=0,
+        metavar="N",
+        help="Termina la profilazione del servizio dopo N messaggi (default: 0 = nessun limite)"
+    )
+
     parser.add_argument(
         "--version",
         action="version", 
@@ -243,29 +517,581 @@ def parse_arguments():
     
     return parser.parse_args()
 
+def setup_processing(publisher):
+    """
+    Crea i componenti di elaborazione comuni ai due runtime: router dei topic, schema delle measurement,
+    keyring dei canali, indice dei pacchetti visti, load shedder, registro dei nodi, aggregatore
+    dei rollup, compressione e publisher Home Assistant (rollup e publisher non ancora avviati).
+
+    Args:
+        publisher: Oggetto con publish(topic, payload, qos, retain), usato per Home Assistant
+    """
+    global topic_router, measurement_schema, channel_keyring, seen_packets, load_shedder, node_registry, rollup
+    global compressor, ha_publisher
+
+    # Senza timer gli stadi costano una chiamata a funzione (vedi metrics.NULL_TIMER)
+    STAGE_SECONDS.enabled = config['STAGE_TIMERS']
+    topic_router = build_topic_router()
+    for route in topic_router.routes:
+        logger.info("🔀 Route %s → %s", route.topic_filter, route.handler_name)
+
+    measurement_schema = MeasurementSchema.from_file(config['MEASUREMENT_SCHEMA_PATH'])
+    logger.info("🧩 Schema delle measurement: %s", ', '.join(measurement_schema.message_types))
+
+    # Ingest dei pacchetti protobuf (cifrati) pubblicati dai gateway su /e/ e /c/
+    channel_keyring = None
+    if config['INGEST_PROTOBUF']:
+        channel_keyring = ChannelKeyring.from_config(config['MESHTASTIC_CHANNEL_KEYS'])
+        logger.info("🔐 Ingest protobuf attivo, canali: %s", ', '.join(channel_keyring.channels) or 'nessuno')
+
+    # Lo stesso pacchetto può arrivare da più gateway: viene importato una volta sola
+    seen_packets = None
+    if config['DEDUP_MODE'] != 'off':
+        seen_packets = SeenPacketCache(max_size=config['DEDUP_CACHE_SIZE'], ttl=config['DEDUP_TTL_S'])
+        logger.info("🧹 De-duplicazione pacchetti: modalità %s", config['DEDUP_MODE'])
+        if config['MQTT_SHARED_GROUP']:
+            logger.warning("⚠️  De-duplicazione con MQTT_SHARED_GROUP: i duplicati consegnati alle altre "
+                           "repliche del gruppo non vengono riconosciuti")
+
+    # Sotto carico passano per primi telemetria e nodeinfo (il carico è collegato alla coda di ingest)
+    class_names, classes, default_class = parse_priority_classes(config['PRIORITY_CLASSES'])
+    load_shedder = LoadShedder(
+        class_names, classes, default_class,
+        shed_start=config['LOAD_SHED_START'],
+        rate_per_minute=config['NODE_RATE_LIMIT_PER_MIN'],
+        burst=config['NODE_RATE_BURST'],
+        max_node_series=config['SHED_MAX_NODE_SERIES'],
+    )
+    logger.info("🚦 Classi di priorità: %s", ' > '.join(class_names))
+
+    # Nomi e hardware dei nodi, salvati tra un riavvio e l'altro e aggiunti agli altri punti
+    node_registry = NodeRegistry(
+        path=config['NODE_REGISTRY_PATH'],
+        enrich_tags=config['NODE_ENRICH_TAGS'],
+        max_values=config['NODE_TAG_MAX_VALUES'],
+        refresh_interval=config['NODE_REGISTRY_REFRESH_S'],
+    ).open()
+
+    # Aggregati per finestra per le dashboard su lunghi periodi
+    rollup = None
+    if config['ROLLUP_BUCKET']:
+        rollup = RollupAggregator(
+            emit=write_rollup_points,
+            windows=parse_windows(config['ROLLUP_WINDOWS']),
+            measurements=config['ROLLUP_MEASUREMENTS'],
+            max_series=config['ROLLUP_MAX_SERIES'],
+            grace=config['ROLLUP_GRACE_S'],
+            # Con più processi ogni nodo è aggregato da tutti: il tag evita che si sovrascrivano
+            extra_tags={'worker': str(worker_index)} if worker_index is not None else None,
+        )
+        logger.info("📉 Rollup %s di %s nel bucket %s", config['ROLLUP_WINDOWS'],
+                    ', '.join(config['ROLLUP_MEASUREMENTS']), config['ROLLUP_BUCKET'])
+
+    # Valori invariati o entro la tolleranza non raggiungono i sink
+    compressor = None
+    if config['COMPRESSION']:
+        compressor = PointCompressor(
+            parse_compression(config['COMPRESSION'], heartbeat=config['COMPRESSION_HEARTBEAT_S']),
+            max_series=config['COMPRESSION_MAX_SERIES'],
+        )
+        logger.info("🗜️  Compressione: %s", config['COMPRESSION'])
+
+    ha_publisher = HomeAssistantPublisher(
+        publish=publisher.publish,
+        discovery_prefix=config['HA_DISCOVERY_PREFIX'],
+        state_prefix=config['HA_STATE_PREFIX'],
+        deadband=config['HA_DEADBAND'],
+        min_interval=config['HA_MIN_INTERVAL_S'],
+    )
+
+def start_pipeline(publisher, handler=route_mqtt_message):
+    """
+    Inizializza InfluxDB, i componenti di elaborazione e la coda di ingest.
+
+    Args:
+        publisher: Oggetto con publish(topic, payload, qos, retain), usato per Home Assistant
+        handler: Funzione eseguita dai worker per ogni messaggio
+
+    Returns:
+        IngestQueue: la coda avviata, da alimentare con i messaggi ricevuti
+    """
+    global rollup_writer
+
+    clients = influx_sink_clients(InfluxdbClient)
+    for client in clients.values():
+        if client.init_influxdb():
+            logger.info("📊 Bucket: %s | Org: %s", client.bucket, client.org)
+    if config['ROLLUP_BUCKET']:
+        rollup_writer = InfluxdbClient(bucket=config['ROLLUP_BUCKET'], spool_dir=rollup_spool_dir())
+        rollup_writer.init_influxdb()
+
+    setup_processing(publisher)
+    build_sinks(clients)
+    ha_publisher.start()
+    if rollup is not None:
+        rollup.start()
+
+    # Il thread di rete MQTT accoda soltanto, l'elaborazione avviene nei worker
+    ingest_queue = IngestQueue(
+        handler=handler,
+        maxsize=config['INGEST_QUEUE_SIZE'],
+        workers=config['INGEST_WORKERS'],
+        stats_interval=config['INGEST_STATS_INTERVAL_S'] or None,
+    )
+    load_shedder.set_load(lambda: ingest_queue.depth() / ingest_queue.maxsize)
+    ingest_queue.start()
+    return ingest_queue
+
+def rollup_spool_dir():
+    """Spool dei rollup, separato da quello dei punti grezzi ("" se lo spool è disabilitato)."""
+    return os.path.join(config['SPOOL_DIR'], "rollup") if config['SPOOL_DIR'] else ""
+
+def sink_policy(options):
+    """Coda, batch e retry di un sink: opzioni di SINKS o default SINK_*."""
+    return {
+        'queue_size': int(options.get('queue', config['SINK_QUEUE_SIZE'])),
+        'batch_size': int(options.get('batch', config['SINK_BATCH_SIZE'])),
+        'flush_interval': int(options.get('flush_ms', config['SINK_FLUSH_INTERVAL_MS'])) / 1000,
+        'max_retries': int(options.get('retries', config['SINK_MAX_RETRIES'])),
+    }
+
+def influx_sink_clients(client_class):
+    """
+    Client InfluxDB (non ancora inizializzati) dei sink influxdb di SINKS, per nome.
+    Il sink "influxdb" usa bucket, server e spool di default; gli altri hanno uno spool proprio.
+    """
+    clients = {}
+    for name, sink_type, options in parse_sinks(config['SINKS']):
+        if sink_type != 'influxdb':
+            continue
+        url = None
+        if 'host' in options or 'port' in options:
+            url = f"{options.get('host', config['INFLUXDB_HOST'])}:{options.get('port', config['INFLUXDB_PORT'])}"
+        spool_dir = None if name == 'influxdb' else (os.path.join(config['SPOOL_DIR'], name) if config['SPOOL_DIR'] else "")
+        clients[name] = client_class(bucket=options.get('bucket'), spool_dir=options.get('spool', spool_dir), url=url,
+                                     token=options.get('token'), org=options.get('org'))
+    return clients
+
+def build_sinks(clients, wrap_write=None):
+    """
+    Crea e avvia i sink di SINKS (dopo setup_processing, che crea il publisher Home Assistant).
+
+    Args:
+        clients: Client InfluxDB inizializzati, per nome (vedi influx_sink_clients())
+        wrap_write: Funzione che adatta la scrittura dei batch al thread del sink (runtime asyncio)
+    """
+    global sinks, influx_clients, influxdb_client
+    influx_clients = clients
+    influxdb_client = clients.get('influxdb')
+    sinks = []
+    for name, sink_type, options in parse_sinks(config['SINKS']):
+        policy = sink_policy(options)
+        if sink_type == 'influxdb':
+            sink = InfluxSink(name, clients[name], line_serializer, wrap_write=wrap_write, **policy)
+        elif sink_type == 'home_assistant':
+            sink = HomeAssistantSink(name, ha_publisher, **policy)
+        elif sink_type == 'file':
+            sink = FileSink(name, options['path'], line_serializer, file_format=options.get('format', 'line'),
+                            max_bytes=int(float(options.get('max_mb', 100)) * 1024 * 1024),
+                            backups=int(options.get('backups', 5)), **policy)
+        else:
+            sink = LogSink(name, **policy)
+        sinks.append(sink.start())
+        logger.info("🚰 Sink %s (%s): coda %d punti, batch %d", name, sink_type, policy['queue_size'],
+                    policy['batch_size'])
+    if not sinks:
+        logger.warning("⚠️  Nessun sink configurato (SINKS): i punti non verranno salvati")
+
+def close_sinks():
+    """Invia i punti rimasti nelle code dei sink."""
+    for sink in sinks:
+        sink.close(timeout=config['INFLUXDB_MAX_CLOSE_WAIT_MS'] / 1000)
+        logger.info("📊 Statistiche sink %s: %s", sink.name, sink.get_stats())
+
+def stop_pipeline(ingest_queue):
+    """Elabora i messaggi in coda, pubblica gli stati in attesa e scrive i batch rimasti."""
+    ingest_queue.stop()
+    log_route_stats()
+    flush_compressor()
+    close_sinks()
+    ha_publisher.close()
+    logger.info("📊 Statistiche Home Assistant: %s", ha_publisher.get_stats())
+    if rollup is not None:
+        # Anche le finestre non ancora terminate: al riavvio ripartirebbero da zero
+        rollup.close()
+        logger.info("📊 Statistiche rollup: %s", rollup.get_stats())
+    if rollup_writer is not None:
+        rollup_writer.close()
+    if seen_packets is not None:
+        logger.info("📊 Statistiche de-duplicazione: %s", seen_packets.get_stats())
+    logger.info("📊 Statistiche load shedding: %s", load_shedder.get_stats())
+    node_registry.close()
+    logger.info("📊 Statistiche registro nodi: %s", node_registry.get_stats())
+    for client in influx_clients.values():
+        client.close()
+
+def replay_capture(path, speed):
+    """
+    Riproduce un file di cattura attraverso la pipeline completa, contro un
+    InfluxDB finto nello stesso processo e un publisher MQTT finto.
+    """
+    global mqtt_client
+    import replay
+
+    speed = replay.parse_speed(speed)
+    influx_server = replay.FakeInfluxServer().start()
+    # La replica non deve toccare l'InfluxDB, lo spool o il registro dei nodi reali
+    config.update({
+        'INFLUXDB_HOST': influx_server.host,
+        'INFLUXDB_PORT': influx_server.port,
+        'INFLUXDB_TOKEN': 'replay',
+        'INFLUXDB_ORG': 'replay',
+        'INFLUXDB_BUCKET': 'replay',
+        'SPOOL_DIR': '',
+        'NODE_REGISTRY_PATH': '',
+        'INGEST_STATS_INTERVAL_S': 0,
+    })
+    mqtt_client = replay.FakeMqttPublisher()
+    recorder = replay.LatencyRecorder(route_mqtt_message)
+    logger.info("⏯️  Replay di %s a velocità %s", path, 'max' if speed is None else f'{speed}x')
+
+    # I log della pipeline falserebbero la misura: durante il replay passano solo gli errori
+    logging.disable(logging.WARNING)
+    try:
+        ingest_queue = start_pipeline(mqtt_client, handler=recorder)
+        start = time.monotonic()
+        messages = replay.feed_capture(path, ingest_queue, speed)
+        stop_pipeline(ingest_queue)
+        elapsed = time.monotonic() - start
+    finally:
+        logging.disable(logging.NOTSET)
+
+    influx_server.stop()
+    print(replay.format_report(messages, elapsed, recorder, influx_server, mqtt_client))
+
+def backfill_files(paths, checkpoint_path):
+    """
+    Importa archivi storici con la stessa elaborazione dei messaggi MQTT, scrivendo
+    in batch grandi e paralleli. Con --dry-run i punti vengono preparati ma non scritti
+    e il checkpoint non viene aggiornato.
+    """
+    global sinks
+    from backfill import BackfillWriter, Checkpoint, NullPublisher, run_backfill
+    from influxdb import INFLUXDB_AVAILABLE
+
+    for path in paths:
+        if not os.path.isfile(path):
+            sys.exit(f"❌ File non trovato: {path}")
+    # I nomi storici restano in memoria: non devono sostituire quelli attuali nel registro
+    config.update({'NODE_REGISTRY_PATH': '', 'ROLLUP_BUCKET': ''})
+
+    client = None
+    checkpoint = None
+    if args.dry_run:
+        write_batch = lambda data: None
+    else:
+        if not INFLUXDB_AVAILABLE:
+            sys.exit("❌ InfluxDB library non disponibile\n💡 Installa con: pipenv install influxdb-client")
+        from influxdb_client import InfluxDBClient
+        from influxdb_client.client.write_api import SYNCHRONOUS
+        url = f"{config['INFLUXDB_HOST']}:{config['INFLUXDB_PORT']}"
+        client = InfluxDBClient(url=url, token=config['INFLUXDB_TOKEN'])
+        health = client.health()
+        if health.status != "pass":
+            sys.exit(f"❌ InfluxDB non disponibile: {health.message}")
+        write_api = client.write_api(write_options=SYNCHRONOUS)
+        write_batch = lambda data: write_api.write(bucket=config['INFLUXDB_BUCKET'], org=config['INFLUXDB_ORG'],
+                                                   record=data)
+        checkpoint = Checkpoint(checkpoint_path)
+
+    writer = BackfillWriter(
+        write_batch,
+        batch_size=config['BACKFILL_BATCH_SIZE'],
+        parallel=config['BACKFILL_PARALLEL'],
+        max_retries=config['INFLUXDB_MAX_RETRIES'],
+        on_checkpoint=checkpoint.update if checkpoint is not None else None,
+    )
+    setup_processing(NullPublisher())
+    # Solo InfluxDB e senza coda: il checkpoint avanza dopo che i punti sono nel writer
+    sinks = [InfluxSink('influxdb', writer, line_serializer, queue_size=0, max_retries=0)]
+    logger.info("📼 Backfill di %d file in %s (batch %d, %d richieste in parallelo)", len(paths),
+                config['INFLUXDB_BUCKET'], config['BACKFILL_BATCH_SIZE'], config['BACKFILL_PARALLEL'])
+    start = time.monotonic()
+    try:
+        records = run_backfill(paths, process_mqtt_message, writer, checkpoint,
+                               progress_interval=config['BACKFILL_PROGRESS_S'], finish=flush_compressor)
+    finally:
+        node_registry.close()
+        if client is not None:
+            client.close()
+    elapsed = time.monotonic() - start
+    logger.info("✅ Backfill completato: %d record in %.1f s, %s", records, elapsed, writer.get_stats())
+
+async def run_asyncio(stats_reporter=None):
+    """
+    Runtime asyncio: MQTT, elaborazione, Home Assistant e scritture InfluxDB
+    concorrenti nello stesso event loop. SIGTERM/SIGINT fermano la ricezione,
+    elaborano i messaggi in coda e scrivono i batch in sospeso prima di uscire.
+
+    Args:
+        stats_reporter: StatsReporter da avviare se il processo è gestito dal supervisore
+    """
+    global rollup_writer, mqtt_client
+    import asyncio
+    from async_runtime import AsyncMqttClient, AsyncIngestQueue, AsyncInfluxWriter, call_in_loop
+
+    loop = asyncio.get_running_loop()
+    clients = influx_sink_clients(AsyncInfluxWriter)
+    for client in clients.values():
+        if await client.init_influxdb():
+            logger.info("📊 Bucket: %s | Org: %s", client.bucket, client.org)
+    if config['ROLLUP_BUCKET']:
+        rollup_writer = AsyncInfluxWriter(bucket=config['ROLLUP_BUCKET'], spool_dir=rollup_spool_dir())
+        await rollup_writer.init_influxdb()
+
+    mqtt_client = AsyncMqttClient(loop)
+    setup_processing(mqtt_client)
+    # I sink inviano dai propri thread: ogni batch è scritto nell'event loop, attendendone
+    # l'esito perché i rifiuti del client arrivino ai tentativi e allo stato del sink
+    build_sinks(clients, wrap_write=lambda write_lines: functools.partial(call_in_loop, loop, write_lines))
+    ingest_queue = AsyncIngestQueue(handler=route_mqtt_message, maxsize=config['INGEST_QUEUE_SIZE'])
+    mqtt_client.on_message_callback = ingest_queue.on_mqtt_message
+    load_shedder.set_load(lambda: ingest_queue.depth() / ingest_queue.maxsize)
+    ingest_queue.start()
+
+    if config['METRICS_PORT']:
+        start_metrics_endpoint(ingest_queue)
+    if stats_reporter is not None:
+        stats_reporter.start(lambda: collect_worker_stats(ingest_queue))
+
+    stop = asyncio.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop.set)
+
+    async def flush_home_assistant():
+        # Al posto del thread di HomeAssistantPublisher.start()
+        interval = max(0.5, min(ha_publisher.min_interval, 5.0))
+        while True:
+            await asyncio.sleep(interval)
+            ha_publisher.flush()
+
+    async def flush_rollup():
+        # Al posto del thread di RollupAggregator.start()
+        while True:
+            await asyncio.sleep(max(1.0, min(rollup.grace, 10.0)))
+            rollup.flush()
+
+    ha_task = loop.create_task(flush_home_assistant())
+    rollup_task = loop.create_task(flush_rollup()) if rollup is not None else None
+    try:
+        if await mqtt_client.connect_async():
+            logger.info("⚡ Runtime asyncio avviato")
+            logger.info("💡 Premi Ctrl+C per interrompere")
+            await stop.wait()
+            logger.info("⏹️  Arresto richiesto")
+    finally:
+        await mqtt_client.disconnect_async()
+        await ingest_queue.stop()
+        log_route_stats()
+        flush_compressor()
+        await asyncio.to_thread(close_sinks)
+        ha_task.cancel()
+        ha_publisher.close()
+        logger.info("📊 Statistiche Home Assistant: %s", ha_publisher.get_stats())
+        if rollup is not None:
+            rollup_task.cancel()
+            rollup.close()
+            logger.info("📊 Statistiche rollup: %s", rollup.get_stats())
+        if rollup_writer is not None:
+            await rollup_writer.close()
+        if seen_packets is not None:
+            logger.info("📊 Statistiche de-duplicazione: %s", seen_packets.get_stats())
+        logger.info("📊 Statistiche load shedding: %s", load_shedder.get_stats())
+        node_registry.close()
+        logger.info("📊 Statistiche registro nodi: %s", node_registry.get_stats())
+        for client in influx_clients.values():
+            await client.close()
+        if stats_reporter is not None:
+            stats_reporter.stop()
+
+def run_threads(stats_reporter=None):
+    """
+    Runtime a thread: loop_forever di paho e worker della coda di ingest.
+
+    Args:
+        stats_reporter: StatsReporter da avviare se il processo è gestito dal supervisore
+    """
+    global mqtt_client
+
+    mqtt_client = MqttClient()
+    ingest_queue = start_pipeline(mqtt_client)
+    mqtt_client.on_message_callback = ingest_queue.on_mqtt_message
+
+    capture_writer = None
+    if args.record:
+        # Registra il traffico grezzo prima di accodarlo, per poterlo riprodurre con --replay
+        capture_writer = CaptureWriter(args.record)
+        def record_and_enqueue(msg):
+            capture_writer.write(time.time(), msg.topic, msg.payload)
+            ingest_queue.on_mqtt_message(msg)
+        mqtt_client.on_message_callback = record_and_enqueue
+        logger.info("⏺️  Registrazione del traffico MQTT in %s", args.record)
+
+    if config['METRICS_PORT']:
+        start_metrics_endpoint(ingest_queue)
+    if stats_reporter is not None:
+        stats_reporter.start(lambda: collect_worker_stats(ingest_queue))
+    # SIGTERM (docker stop) chiude il loop MQTT come Ctrl+C, così i batch vengono scritti
+    signal.signal(signal.SIGTERM, lambda signum, frame: mqtt_client.disconnect())
+    try:
+        mqtt_client.connect()
+        mqtt_client.start_loop()
+    finally:
+        stop_pipeline(ingest_queue)
+        if capture_writer is not None:
+            capture_writer.close()
+            logger.info("⏺️  Registrati %d messaggi in %s", capture_writer.records, args.record)
+        if stats_reporter is not None:
+            stats_reporter.stop()
+
+def run_worker(index, stats_queue, worker_args, overrides):
+    """
+    Processo di ingest avviato dal supervisore (--workers): connessioni MQTT e
+    InfluxDB proprie, statistiche inviate al supervisore su stats_queue.
+    """
+    global args, worker_index
+    args = worker_args
+    worker_index = index
+    config.update(overrides)
+    setup_logging_from_config(config)
+    if config['SPOOL_DIR']:
+        # Ogni processo ha il proprio spool, ritrovato dopo un riavvio grazie all'indice
+        config['SPOOL_DIR'] = os.path.join(config['SPOOL_DIR'], f"worker-{index}")
+    # Ctrl+C arriva a tutto il gruppo di processi: l'arresto lo decide il supervisore con SIGTERM
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    stats_reporter = StatsReporter(stats_queue, index, config['WORKER_STATS_INTERVAL_S'])
+    try:
+        if config['RUNTIME'] == 'asyncio':
+            import asyncio
+            asyncio.run(run_asyncio(stats_reporter))
+        else:
+            run_threads(stats_reporter)
+    finally:
+        shutdown_logging()
+
+def run_supervisor(processes):
+    """
+    Avvia `processes` processi di ingest nello stesso gruppo di sottoscrizione condivisa,
+    li riavvia se terminano e ne espone le metriche aggregate.
+    """
+    group = config['MQTT_SHARED_GROUP'] or 'meshtastic-ingest'
+    logger.info("👥 %d processi di ingest nel gruppo MQTT condiviso '%s'", processes, group)
+    # L'endpoint delle metriche è servito solo dal supervisore
+    # SINKS e ROLLUP_BUCKET possono essere stati cambiati da --dry-run
+    overrides = {'MQTT_SHARED_GROUP': group, 'METRICS_PORT': None,
+                 'SINKS': config['SINKS'], 'ROLLUP_BUCKET': config['ROLLUP_BUCKET']}
+    supervisor = WorkerSupervisor(
+        functools.partial(run_script_function, os.path.abspath(__file__), 'run_worker'),
+        processes, args=(args, overrides),
+        stop_timeout=config['INFLUXDB_MAX_CLOSE_WAIT_MS'] / 1000 + 30,
+    )
+    supervisor.install_signal_handlers()
+    supervisor.start()
+    if config['METRICS_PORT']:
+        start_supervisor_metrics(supervisor)
+    try:
+        supervisor.run()
+    finally:
+        supervisor.shutdown()
+
+def processed_messages():
+    """Messaggi elaborati finora, per classe di payload sommati."""
+    return sum(MESSAGES.snapshot().values())
+
+def start_profile_limits():
+    """
+    Arresta il servizio come SIGTERM (batch scritti, report salvato) dopo --profile-seconds
+    secondi o --profile-messages messaggi.
+    """
+    start = time.monotonic()
+
+    def watch():
+        while True:
+            time.sleep(0.2)
+            if args.profile_seconds and time.monotonic() - start >= args.profile_seconds:
+                break
+            if args.profile_messages and processed_messages() >= args.profile_messages:
+                break
+        logger.info("🔬 Limite di profilazione raggiunto, arresto del servizio")
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    threading.Thread(target=watch, name="profile-limit", daemon=True).start()
+
 def main():
     """Funzione principale."""
-    global args, influxdb_client, mqtt_client
+    global args
 
     args = parse_arguments()
-    # Modalità test
-    if args.test:
-        result = test_influxdb()
-        sys.exit(0 if result else 1)
+    setup_logging_from_config(config)
+    profiler = None
+    if args.profile:
+        if args.workers > 1:
+            sys.exit("❌ --profile non è utilizzabile con più processi (--workers)")
+        from profiling import ServiceProfiler
+        # La quota degli stadi nel report richiede i timer
+        config['STAGE_TIMERS'] = True
+        profiler = ServiceProfiler(args.profile).start()
+        logger.info("🔬 Profilazione attiva, report in %s", args.profile)
+    try:
+        if args.replay:
+            replay_capture(args.replay, args.speed)
+            return
+
+        validate_config()
+        if args.dry_run:
+            # I punti vanno solo nel log: nessun sink reale e nessun rollup
+            config.update({'SINKS': 'log', 'ROLLUP_BUCKET': ''})
+            logger.info("🚀 Modalità dry-run: non salverò i dati in InfluxDB")
+        if args.backfill:
+            backfill_files(args.backfill, args.checkpoint)
+            return
+
+        # Modalità test
+        if args.test:
+            result = test_influxdb()
+            sys.exit(0 if result else 1)
     
-    if args.dry_run:
-        print("🚀 Modalità dry-run: non salverò i dati in InfluxDB")
 
-    influxdb_client = InfluxdbClient()
+        if args.workers < 1:
+            sys.exit("❌ --workers deve essere almeno 1")
+        if args.workers > 1:
+            if args.record:
+                sys.exit("❌ --record non è utilizzabile con più processi (--workers)")
+            if config['DEDUP_MODE'] != 'off':
+                # La cache dei pacchetti visti è per processo e il broker distribuisce le copie
+                # dei gateway tra i processi del gruppo: i duplicati passerebbero senza avviso
+                sys.exit("❌ DEDUP_MODE non è utilizzabile con più processi (--workers): "
+                         "le copie dello stesso pacchetto arrivano a processi diversi\n"
+                         "💡 Usa un solo processo o imposta DEDUP_MODE=off")
+            run_supervisor(args.workers)
+            return
 
-    influx_success = influxdb_client.init_influxdb()
-    if influx_success:
-        print(f"📊 Bucket: {config['INFLUXDB_BUCKET']} | Org: {config['INFLUXDB_ORG']}")
-    print("-" * 80)
+        if profiler is not None and (args.profile_seconds or args.profile_messages):
+            start_profile_limits()
+        if config['RUNTIME'] == 'asyncio':
+            import asyncio
+            asyncio.run(run_asyncio())
+            return
 
-    mqtt_client = MqttClient(on_message_callback=on_mqtt_message_callback)
-    mqtt_client.connect()
-    mqtt_client.start_loop()
+        run_threads()
+    finally:
+        if profiler is not None:
+            profiler.stop()
+            profiler.write_report(STAGE_SECONDS.snapshot(), processed_messages())
+            logger.info("🔬 Report di profilazione scritto in %s (%s)", args.profile, profiler.stats_path)
+        # I record ancora in coda vengono scritti prima dell'uscita
+        shutdown_logging()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,472 @@
+#!/usr/bin/env python3
+"""
+Runtime asyncio alternativo (RUNTIME=asyncio).
+
+Un solo event loop gestisce il socket MQTT (paho integrato nel loop tramite le
+callback dei socket, senza loop_forever), l'elaborazione dei messaggi e molte
+scritture HTTP concorrenti verso InfluxDB con il client asincrono (aiohttp).
+La preparazione dei punti è la stessa del runtime a thread: cambia solo il trasporto.
+"""
+import asyncio
+import concurrent.futures
+import importlib.util
+import logging
+import time
+from collections import deque
+
+from config import config
+from mqtt import MqttClient
+from spool import DiskSpool
+
+logger = logging.getLogger(__name__)
+
+AIOHTTP_AVAILABLE = importlib.util.find_spec("aiohttp") is not None
+
+# Attesa massima di una chiamata eseguita nell'event loop da un altro thread
+LOOP_CALL_TIMEOUT = 30.0
+
+
+def call_in_loop(loop, function, *args, timeout=LOOP_CALL_TIMEOUT):
+    """
+    Esegue function(*args) nell'event loop da un altro thread (es. il thread di un sink)
+    e ne restituisce il risultato; le eccezioni vengono rilanciate al chiamante.
+    Allo scadere del timeout la chiamata, se non ancora partita, viene annullata.
+    """
+    future = concurrent.futures.Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(function(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    loop.call_soon_threadsafe(run)
+    try:
+        return future.result(timeout)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise
+
+
+class AsyncMqttClient(MqttClient):
+    """
+    MqttClient pilotato dall'event loop asyncio invece che da loop_forever.
+
+    Le letture e scritture sul socket sono registrate come reader/writer del loop,
+    le operazioni periodiche (keepalive) girano in un task; callback e sottoscrizione
+    sono quelle di MqttClient, publish chiamata da altri thread viene eseguita nel
+    loop. Connessione e riconnessione (DNS e TCP bloccanti) avvengono in un thread
+    dell'executor: le callback dei socket che paho chiama da lì vengono eseguite nel loop.
+    """
+
+    def __init__(self, loop, on_message_callback=None):
+        self.loop = loop
+        self._misc_task = None
+        self._reconnect_task = None
+        self._closing = False
+        self._disconnected = asyncio.Event()
+        super().__init__(on_message_callback=on_message_callback)
+
+    def _setup_client(self):
+        super()._setup_client()
+        self.client.on_socket_open = self._on_socket_open
+        self.client.on_socket_close = self._on_socket_close
+        self.client.on_socket_register_write = self._on_socket_register_write
+        self.client.on_socket_unregister_write = self._on_socket_unregister_write
+
+    def _in_loop(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+    def _call_in_loop(self, callback, *args):
+        # add_reader/add_writer non sono thread-safe: da un altro thread passano da call_soon_threadsafe
+        if self._in_loop():
+            callback(*args)
+        else:
+            self.loop.call_soon_threadsafe(callback, *args)
+
+    def _on_socket_open(self, client, userdata, sock):
+        self._call_in_loop(self._watch_socket, sock)
+
+    def _watch_socket(self, sock):
+        self.loop.add_reader(sock, self.client.loop_read)
+        self._misc_task = self.loop.create_task(self._misc_loop())
+
+    def _on_socket_close(self, client, userdata, sock):
+        self._call_in_loop(self._unwatch_socket, sock)
+
+    def _unwatch_socket(self, sock):
+        self.loop.remove_reader(sock)
+        if self._misc_task is not None:
+            self._misc_task.cancel()
+            self._misc_task = None
+
+    def _on_socket_register_write(self, client, userdata, sock):
+        self._call_in_loop(self.loop.add_writer, sock, client.loop_write)
+
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        self._call_in_loop(self.loop.remove_writer, sock)
+
+    def publish(self, topic: str, payload: str, qos: int = 0, retain: bool = False) -> bool:
+        """Come MqttClient.publish; da un altro thread (es. sink Home Assistant) passa dall'event loop."""
+        if self._in_loop():
+            return super().publish(topic, payload, qos, retain)
+        try:
+            return call_in_loop(self.loop, super().publish, topic, payload, qos, retain)
+        except (RuntimeError, concurrent.futures.TimeoutError) as e:
+            logger.error("❌ Pubblicazione MQTT non eseguita nell'event loop: %s", str(e) or "timeout")
+            return False
+
+    async def _misc_loop(self):
+        import paho.mqtt.client as mqtt
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                break
+
+    def _on_disconnect(self, client, userdata, rc):
+        super()._on_disconnect(client, userdata, rc)
+        self._call_in_loop(self._after_disconnect)
+
+    def _after_disconnect(self):
+        if self._closing:
+            self._disconnected.set()
+        elif self._reconnect_task is None:
+            self._reconnect_task = self.loop.create_task(self._reconnect_loop())
+
+    async def _reconnect_loop(self):
+        delay = 1
+        try:
+            while not self._closing and not self.is_connected:
+                await asyncio.sleep(delay)
+                try:
+                    # Fuori dal loop: con il broker irraggiungibile il tentativo attende il timeout TCP
+                    await self.loop.run_in_executor(None, self.client.reconnect)
+                    return
+                except OSError as e:
+                    logger.warning("⚠️  Riconnessione MQTT fallita: %s, nuovo tentativo tra %s s", e, delay)
+                    delay = min(delay * 2, 60)
+        finally:
+            self._reconnect_task = None
+
+    async def connect_async(self) -> bool:
+        """Connette al broker; il socket viene poi servito dall'event loop."""
+        # connect() risolve il nome e apre il socket in modo bloccante: eseguita nell'executor
+        return await self.loop.run_in_executor(None, self.connect)
+
+    async def disconnect_async(self, timeout: float = 5.0):
+        """Disconnette in modo pulito e attende la chiusura del socket."""
+        self._closing = True
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+        if self.is_connected:
+            self.disconnect()
+            try:
+                await asyncio.wait_for(self._disconnected.wait(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning("⚠️  Timeout nella disconnessione dal broker MQTT")
+
+
+class AsyncIngestQueue:
+    """
+    Coda di ingest per l'event loop, con la stessa politica di IngestQueue:
+    limitata, scarta il messaggio più vecchio quando è piena.
+    """
+
+    def __init__(self, handler, maxsize: int = 10000, yield_every: int = 50):
+        """
+        Args:
+            handler: Funzione sincrona (topic, payload, receive_ts) eseguita per ogni messaggio
+            maxsize: Numero massimo di messaggi in attesa
+            yield_every: Messaggi elaborati prima di cedere il controllo agli altri task
+        """
+        self.handler = handler
+        self.maxsize = maxsize
+        self.yield_every = yield_every
+        self._buffer = deque()
+        self._ready = asyncio.Event()
+        self._running = False
+        self._task = None
+        self.enqueued = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.worker_stats = [{'processed': 0, 'errors': 0}]
+
+    def put(self, topic, payload, receive_ts=None) -> bool:
+        dropped = False
+        if len(self._buffer) >= self.maxsize:
+            self._buffer.popleft()
+            self.dropped += 1
+            dropped = True
+        self._buffer.append((topic, payload, receive_ts if receive_ts is not None else time.time()))
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, len(self._buffer))
+        self._ready.set()
+        return not dropped
+
+    def on_mqtt_message(self, msg):
+        """Callback per AsyncMqttClient (eseguita nel thread dell'event loop)."""
+        self.put(msg.topic, msg.payload, time.time())
+
+    def start(self):
+        self._running = True
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Elabora i messaggi rimasti e ferma il task."""
+        self._running = False
+        self._ready.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        logger.info("📊 Statistiche coda di ingest: %s", self.get_stats())
+
+    def depth(self) -> int:
+        return len(self._buffer)
+
+    def get_stats(self) -> dict:
+        return {
+            'depth': len(self._buffer),
+            'max_depth': self.max_depth,
+            'maxsize': self.maxsize,
+            'enqueued': self.enqueued,
+            'dropped': self.dropped,
+            'workers': [dict(stats) for stats in self.worker_stats],
+        }
+
+    async def _run(self):
+        stats = self.worker_stats[0]
+        while True:
+            if not self._buffer:
+                if not self._running:
+                    return
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            item = self._buffer.popleft()
+            try:
+                self.handler(*item)
+                stats['processed'] += 1
+            except Exception as e:
+                stats['errors'] += 1
+                logger.error("❌ Errore nell'elaborazione del messaggio su %s: %s", item[0], e)
+            if (stats['processed'] + stats['errors']) % self.yield_every == 0:
+                # Lascia avanzare socket MQTT, flush e scritture HTTP
+                await asyncio.sleep(0)
+
+
+class AsyncInfluxWriter:
+    """
+    Scrittura batch su InfluxDB con il client asincrono.
+
+    write() è sincrona e non blocca: accoda la riga nel batch corrente. I batch
+    pieni (o scaduti dopo il flush interval) vengono inviati come task separati,
+    fino a INFLUXDB_MAX_IN_FLIGHT richieste HTTP contemporanee. Interfaccia e
+    contatori sono quelli di InfluxdbClient, spool su disco compreso.
+    """
+
+    def __init__(self, bucket=None, spool_dir=None, url=None, token=None, org=None):
+        """
+        Args:
+            bucket: Bucket di destinazione (default INFLUXDB_BUCKET)
+            spool_dir: Directory dello spool (default SPOOL_DIR, "" = disabilitato)
+            url: Indirizzo del server (default INFLUXDB_HOST:INFLUXDB_PORT), per una seconda istanza
+            token: Token di accesso (default INFLUXDB_TOKEN)
+            org: Organizzazione (default INFLUXDB_ORG)
+        """
+        self.bucket = bucket or config['INFLUXDB_BUCKET']
+        self.url = url or f"{config['INFLUXDB_HOST']}:{config['INFLUXDB_PORT']}"
+        self.token = token or config['INFLUXDB_TOKEN']
+        self.org = org or config['INFLUXDB_ORG']
+        self.spool_dir = config['SPOOL_DIR'] if spool_dir is None else spool_dir
+        self.influx_client = None
+        self.write_api = None
+        self.healthy = False
+        self.stats = {
+            'batches_written': 0,
+            'batches_failed': 0,
+            'batches_retried': 0,
+            'points_written': 0,
+            'points_failed': 0,
+            'points_spooled': 0,
+        }
+        self.batch_size = config['INFLUXDB_BATCH_SIZE']
+        self.flush_interval = config['INFLUXDB_FLUSH_INTERVAL_MS'] / 1000
+        self.max_retries = config['INFLUXDB_MAX_RETRIES']
+        self._buffer = []
+        # Task di scrittura non ancora conclusi -> (batch, punti), per non perderli se la chiusura scade
+        self._pending = {}
+        self._semaphore = None
+        self._flush_task = None
+        self._replay_task = None
+        self.spool = None
+        if self.spool_dir:
+            self.spool = DiskSpool(
+                self.spool_dir,
+                segment_bytes=config['SPOOL_SEGMENT_MB'] * 1024 * 1024,
+                max_bytes=config['SPOOL_MAX_MB'] * 1024 * 1024,
+                compress=config['SPOOL_COMPRESS'],
+            )
+
+    async def init_influxdb(self) -> bool:
+        if not AIOHTTP_AVAILABLE:
+            logger.warning("⚠️  Libreria aiohttp non disponibile, il runtime asyncio non può scrivere in InfluxDB")
+            logger.warning("💡 Installa con: pipenv install aiohttp")
+            return False
+
+        from influxdb_client.client.influxdb_client_async import InfluxDBClientAsync
+
+        self.influx_client = InfluxDBClientAsync(url=self.url, token=self.token, org=self.org)
+        self.healthy = await self._ping()
+        if self.healthy:
+            logger.info("✅ Connesso a InfluxDB (asyncio): %s", self.url)
+        elif self.spool is not None:
+            logger.warning("⚠️  InfluxDB non disponibile, i punti verranno salvati in %s", self.spool_dir)
+        else:
+            await self.influx_client.close()
+            raise Exception(f"❌ InfluxDB non disponibile: {self.url}")
+
+        self.write_api = self.influx_client.write_api()
+        self._semaphore = asyncio.Semaphore(config['INFLUXDB_MAX_IN_FLIGHT'])
+        self._flush_task = asyncio.get_running_loop().create_task(self._flush_loop())
+        if self.spool is not None:
+            self._replay_task = asyncio.get_running_loop().create_task(self._replay_loop())
+        logger.info("📦 Scrittura batch asincrona: %d punti, flush ogni %d ms, %d richieste in parallelo",
+                    self.batch_size, config['INFLUXDB_FLUSH_INTERVAL_MS'], config['INFLUXDB_MAX_IN_FLIGHT'])
+        return True
+
+    async def _ping(self) -> bool:
+        try:
+            return await self.influx_client.ping()
+        except Exception:
+            return False
+
+    def write(self, record):
+        """Accoda una riga line protocol (bytes o str) nel batch corrente."""
+        if self.write_api is None:
+            logger.error("❌ InfluxDB non inizializzato, record scartato")
+            return False
+        if isinstance(record, str):
+            record = record.encode("utf-8")
+        self._buffer.append(record)
+        if len(self._buffer) >= self.batch_size:
+            self._flush()
+        return True
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        lines, self._buffer = self._buffer, []
+        data = b"\n".join(lines)
+        task = asyncio.get_running_loop().create_task(self._send(data, len(lines)))
+        self._pending[task] = (data, len(lines))
+        task.add_done_callback(self._forget_pending)
+
+    def _forget_pending(self, task):
+        self._pending.pop(task, None)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self._flush()
+
+    async def _send(self, data, points):
+        async with self._semaphore:
+            if self.spool is not None and not self.healthy:
+                await self._spool(data, points)
+                return
+            for attempt in range(self.max_retries + 1):
+                try:
+                    await self.write_api.write(bucket=self.bucket, org=self.org,
+                                               record=data)
+                    self.healthy = True
+                    self.stats['batches_written'] += 1
+                    self.stats['points_written'] += points
+                    return
+                except Exception as e:
+                    if attempt < self.max_retries:
+                        self.stats['batches_retried'] += 1
+                        logger.warning("⚠️  Nuovo tentativo di scrittura batch InfluxDB: %s", e)
+                        await asyncio.sleep(min(2 ** attempt, 30))
+                        continue
+                    self.stats['batches_failed'] += 1
+                    self.stats['points_failed'] += points
+                    logger.error("❌ Errore scrittura batch InfluxDB (%d punti): %s", points, e)
+            if self.spool is not None:
+                self.healthy = False
+                await self._spool(data, points)
+
+    async def _spool(self, data, points):
+        # append fa fsync: eseguito fuori dal loop per non fermare gli altri task
+        await asyncio.to_thread(self.spool.append, data)
+        self.stats['points_spooled'] += points
+        logger.warning("💾 %d punti salvati nello spool", points)
+
+    async def _replay_loop(self):
+        interval = config['SPOOL_REPLAY_INTERVAL_S']
+        while True:
+            await asyncio.sleep(interval)
+            if not self.healthy:
+                if not await self._ping():
+                    continue
+                logger.info("✅ InfluxDB di nuovo disponibile, riprendo le scritture")
+                self.healthy = True
+            while True:
+                data, position = await asyncio.to_thread(self.spool.read_batch, config['SPOOL_REPLAY_BATCH'])
+                if data is None:
+                    break
+                points = data.count(b"\n") + 1
+                try:
+                    await self.write_api.write(bucket=self.bucket, org=self.org,
+                                               record=data)
+                except Exception as e:
+                    logger.error("❌ Errore nella rilettura dello spool (%d punti): %s", points, e)
+                    self.healthy = False
+                    break
+                await asyncio.to_thread(self.spool.commit, position, points)
+                logger.info("💾 Riscritti %d punti dallo spool", points)
+
+    async def close(self):
+        """Invia il batch corrente, attende le scritture in corso e chiude la connessione."""
+        for task in (self._flush_task, self._replay_task):
+            if task is not None:
+                task.cancel()
+        if self.write_api is not None:
+            logger.info("⏳ Flush dei batch InfluxDB in sospeso...")
+            self._flush()
+            if self._pending:
+                pending = dict(self._pending)
+                _, not_done = await asyncio.wait(set(pending), timeout=config['INFLUXDB_MAX_CLOSE_WAIT_MS'] / 1000)
+                if not_done:
+                    logger.warning("⚠️  %d batch non scritti entro il tempo massimo di chiusura", len(not_done))
+                    await self._abandon(not_done, pending)
+            self.write_api = None
+        if self.spool is not None:
+            self.spool.close()
+            logger.info("📊 Statistiche spool: %s", self.spool.get_stats())
+        if self.influx_client is not None:
+            await self.influx_client.close()
+            self.influx_client = None
+        logger.info("📊 Statistiche InfluxDB: %s", self.get_stats())
+
+    async def _abandon(self, tasks, pending):
+        # Come InfluxdbClient._wait_writers: i batch interrotti sono contati come falliti e,
+        # se configurato, salvati nello spool (ancora aperto) per la rilettura al riavvio
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for task in tasks:
+            data, points = pending[task]
+            self.stats['batches_failed'] += 1
+            self.stats['points_failed'] += points
+            if self.spool is not None:
+                await self._spool(data, points)
+
+    def get_stats(self) -> dict:
+        """Restituisce una copia dei contatori di scrittura."""
+        return dict(self.stats)
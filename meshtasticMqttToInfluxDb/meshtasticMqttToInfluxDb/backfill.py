@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Importazione in blocco di archivi storici (--backfill).
+
+I file vengono letti in streaming, un record alla volta, e ogni record passa
+dalla stessa elaborazione dei messaggi ricevuti via MQTT; i punti usano il
+timestamp originale del pacchetto. Le righe line protocol sono raccolte in
+batch grandi, scritti in parallelo con un numero limitato di batch in volo,
+così la memoria resta costante qualunque sia la dimensione dei file.
+
+Formati accettati (anche compressi con gzip, estensione .gz):
+- file di cattura registrati con --record
+- JSONL con un messaggio JSON Meshtastic per riga
+- JSONL di dump MQTT con un oggetto {"topic": ..., "payload": ...} per riga
+  (payload stringa o oggetto JSON, timestamp di ricezione opzionale in "tst")
+
+Il checkpoint salva, per ogni file, quanti record sono già stati scritti in
+InfluxDB: viene aggiornato solo quando tutti i batch precedenti sono andati a
+buon fine, quindi una nuova esecuzione riprende senza perdere punti.
+"""
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from capture import MAGIC, iter_capture
+from utils import json_loads
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def open_records(path: str):
+    """
+    Apre un file di archivio.
+
+    Yields:
+        tuple: (file grezzo, per la posizione in byte; iteratore dei record
+            (receive_ts, topic, payload) o None per le righe vuote o non valide)
+    """
+    raw = open(path, "rb")
+    try:
+        f = gzip.GzipFile(fileobj=raw, mode="rb") if path.endswith(".gz") else raw
+        is_capture = f.read(len(MAGIC)) == MAGIC
+        f.seek(0)
+        yield raw, (iter_capture(f, path) if is_capture else _iter_jsonl(f))
+    finally:
+        raw.close()
+
+
+def _iter_jsonl(f):
+    for line in f:
+        line = line.strip()
+        if not line:
+            yield None
+            continue
+        try:
+            record = json_loads(line)
+        except ValueError:
+            yield None
+            continue
+        if isinstance(record, dict) and 'topic' in record and 'payload' in record:
+            # Dump MQTT: il payload può essere già un oggetto JSON
+            payload = record['payload']
+            if isinstance(payload, str):
+                payload = payload.encode("utf-8")
+            elif not isinstance(payload, bytes):
+                payload = json.dumps(payload).encode("utf-8")
+            receive_ts = record.get('tst')
+            if not isinstance(receive_ts, (int, float)):
+                receive_ts = time.time()
+            yield receive_ts, record['topic'], payload
+        else:
+            yield time.time(), "", line
+
+
+class Checkpoint:
+    """
+    Record già scritti per ogni file, salvati in JSON (scrittura atomica con rename).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.files = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.files = json.load(f).get('files', {})
+
+    def get(self, source: str) -> dict:
+        return self.files.get(os.path.abspath(source), {'records': 0, 'done': False})
+
+    def update(self, position):
+        source, records, done = position
+        with self._lock:
+            self.files[os.path.abspath(source)] = {'records': records, 'done': done}
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({'files': self.files}, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+
+class BackfillWriter:
+    """
+    Raccoglie le righe line protocol in batch e li scrive in parallelo.
+
+    Ogni batch porta con sé la posizione (file, record, completato) dell'ultimo record
+    elaborato: on_checkpoint viene chiamata con la posizione più avanzata per cui
+    tutti i batch precedenti sono stati scritti. Espone write() come InfluxdbClient,
+    così l'elaborazione dei messaggi non cambia.
+    """
+
+    def __init__(self, write_batch, batch_size: int = 10000, parallel: int = 4, max_retries: int = 5,
+                 on_checkpoint=None):
+        """
+        Args:
+            write_batch: Funzione che scrive un blocco line protocol (bytes), solleva un'eccezione se fallisce
+            batch_size: Righe per batch
+            parallel: Batch scritti contemporaneamente
+            max_retries: Tentativi aggiuntivi per ogni batch
+            on_checkpoint: Funzione chiamata con la posizione fino a cui tutto è stato scritto
+        """
+        self._write_batch = write_batch
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self._on_checkpoint = on_checkpoint
+        self._executor = ThreadPoolExecutor(max_workers=parallel, thread_name_prefix="backfill-write")
+        # Al massimo `parallel` batch in scrittura e `parallel` in attesa: la lettura si ferma se InfluxDB rallenta
+        self._slots = threading.BoundedSemaphore(parallel * 2)
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._position = None
+        self._next_seq = 0
+        self._pending = {}  # seq -> [posizione, completato]
+        self.error = None
+        self.stats = {
+            'batches_written': 0,
+            'batches_retried': 0,
+            'points_written': 0,
+        }
+
+    def write(self, record):
+        if isinstance(record, str):
+            record = record.encode("utf-8")
+        self._buffer.append(record)
+        return True
+
+    def mark(self, position):
+        """Registra la posizione dell'ultimo record elaborato e invia il batch se è pieno."""
+        self._position = position
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Invia il batch corrente (anche vuoto, per far avanzare il checkpoint)."""
+        if self.error is not None:
+            raise self.error
+        batch, self._buffer = self._buffer, []
+        self._slots.acquire()
+        with self._lock:
+            seq = self._next_seq
+            self._next_seq += 1
+            self._pending[seq] = [self._position, False]
+        self._executor.submit(self._run, seq, b"\n".join(batch), len(batch))
+
+    def _run(self, seq, data, points):
+        try:
+            if points:
+                self._write_with_retries(data)
+            with self._lock:
+                self.stats['batches_written'] += 1
+                self.stats['points_written'] += points
+                self._pending[seq][1] = True
+                # Avanza il checkpoint fino al primo batch non ancora scritto
+                position = None
+                while self._pending:
+                    first = min(self._pending)
+                    if not self._pending[first][1]:
+                        break
+                    position = self._pending.pop(first)[0]
+                if position is not None and self._on_checkpoint is not None:
+                    self._on_checkpoint(position)
+        except Exception as e:
+            logger.error("❌ Batch di backfill non scritto (%d punti): %s", points, e)
+            self.error = e
+        finally:
+            self._slots.release()
+
+    def _write_with_retries(self, data):
+        for attempt in range(self.max_retries + 1):
+            try:
+                self._write_batch(data)
+                return
+            except Exception as e:
+                if attempt == self.max_retries or self.error is not None:
+                    raise
+                with self._lock:
+                    self.stats['batches_retried'] += 1
+                logger.warning("⚠️  Nuovo tentativo di scrittura batch di backfill: %s", e)
+                time.sleep(min(2 ** attempt, 30))
+
+    def close(self):
+        """Scrive il batch rimasto e attende tutte le scritture; solleva l'errore se un batch è fallito."""
+        try:
+            if self.error is None:
+                self.flush()
+        finally:
+            self._executor.shutdown(wait=True)
+        if self.error is not None:
+            raise self.error
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {**self.stats, 'in_flight': len(self._pending)}
+
+
+class NullPublisher:
+    """Publisher Home Assistant che non pubblica: i dati storici non devono diventare stati attuali."""
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        return True
+
+
+def _format_duration(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    return f"{seconds // 60}m{seconds % 60:02d}s"
+
+
+def run_backfill(paths, handler, writer: BackfillWriter, checkpoint=None, progress_interval: float = 10.0,
+                 finish=None):
+    """
+    Elabora i file in ordine, riprendendo dal checkpoint.
+
+    Args:
+        paths: File da importare
+        handler: Funzione handler(topic, payload, receive_ts) che elabora un messaggio
+        writer: BackfillWriter che riceve le righe prodotte da handler
+        checkpoint: Checkpoint da cui riprendere e da aggiornare (None = nessuno)
+        progress_interval: Secondi tra due messaggi di avanzamento
+        finish: Funzione chiamata prima della chiusura del writer (es. per scrivere i valori trattenuti)
+
+    Returns:
+        int: Record elaborati in questa esecuzione
+    """
+    sizes = {path: os.path.getsize(path) for path in paths}
+    total_bytes = sum(sizes.values()) or 1
+    completed_bytes = 0
+    processed = 0
+    start = last_report = time.monotonic()
+
+    try:
+        for path in paths:
+            state = checkpoint.get(path) if checkpoint is not None else {'records': 0, 'done': False}
+            if state['done']:
+                logger.info("⏭️  %s già importato, saltato", path)
+                completed_bytes += sizes[path]
+                continue
+            skip = state['records']
+            if skip:
+                logger.info("⏩ %s: ripresa dopo %d record", path, skip)
+            records = 0
+            with open_records(path) as (raw, reader):
+                for record in reader:
+                    records += 1
+                    if records <= skip:
+                        continue
+                    if record is not None:
+                        receive_ts, topic, payload = record
+                        handler(topic, payload, receive_ts)
+                    processed += 1
+                    writer.mark((path, records, False))
+
+                    now = time.monotonic()
+                    if now - last_report >= progress_interval:
+                        last_report = now
+                        done_bytes = completed_bytes + raw.tell()
+                        elapsed = now - start
+                        fraction = done_bytes / total_bytes
+                        eta = elapsed / fraction - elapsed if fraction > 0 else 0
+                        logger.info("⏩ Backfill %.1f%% (%.1f/%.1f MiB), %d record, %.0f record/s, ETA %s",
+                                    fraction * 100, done_bytes / 2 ** 20, total_bytes / 2 ** 20, processed,
+                                    processed / elapsed, _format_duration(eta))
+            writer.mark((path, records, True))
+            writer.flush()
+            completed_bytes += sizes[path]
+            logger.info("✅ %s: %d record", path, records)
+    finally:
+        # Anche se interrotto: il batch parziale viene scritto e il checkpoint aggiornato
+        if finish is not None:
+            finish()
+        writer.close()
+    return processed
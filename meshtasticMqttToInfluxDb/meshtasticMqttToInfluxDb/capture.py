@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Registrazione del traffico MQTT grezzo su file, per riprodurlo in seguito (--replay).
+
+Formato append-only: intestazione MAGIC, poi un record per messaggio
+    <d  timestamp di ricezione (secondi Unix, float64)
+    <H  lunghezza del topic
+    <I  lunghezza del payload
+    topic (UTF-8) + payload
+Con estensione .gz il file è scritto in gzip. Un record troncato in coda (processo
+interrotto durante la scrittura) viene ignorato in lettura.
+"""
+import gzip
+import os
+import struct
+import threading
+
+MAGIC = b"MSHCAP1\n"
+RECORD_HEADER = struct.Struct("<dHI")
+
+
+def _open(path, mode):
+    return gzip.open(path, mode) if path.endswith(".gz") else open(path, mode)
+
+
+class CaptureWriter:
+    """
+    Scrive i messaggi ricevuti in un file di cattura. Thread-safe: viene chiamato dal thread MQTT.
+    """
+
+    def __init__(self, path: str, flush_every: int = 100):
+        """
+        Args:
+            path: File di cattura (creato o esteso)
+            flush_every: Numero di messaggi tra due flush su disco
+        """
+        self.path = path
+        self.flush_every = flush_every
+        self._lock = threading.Lock()
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = _open(path, "ab")
+        if new_file:
+            self._file.write(MAGIC)
+        self.records = 0
+
+    def write(self, timestamp: float, topic: str, payload: bytes):
+        topic_bytes = topic.encode("utf-8")
+        record = RECORD_HEADER.pack(timestamp, len(topic_bytes), len(payload)) + topic_bytes + payload
+        with self._lock:
+            self._file.write(record)
+            self.records += 1
+            if self.records % self.flush_every == 0:
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def read_capture(path: str):
+    """
+    Legge un file di cattura.
+
+    Yields:
+        tuple: (timestamp, topic, payload) in ordine di registrazione
+    """
+    with _open(path, "rb") as f:
+        yield from iter_capture(f, path)
+
+
+def iter_capture(f, name: str = "capture"):
+    """
+    Legge i record da un file di cattura già aperto (posizionato all'inizio).
+
+    Yields:
+        tuple: (timestamp, topic, payload) in ordine di registrazione
+    """
+    magic = f.read(len(MAGIC))
+    if magic != MAGIC:
+        raise ValueError(f"{name} non è un file di cattura valido")
+    while True:
+        header = f.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            return
+        timestamp, topic_len, payload_len = RECORD_HEADER.unpack(header)
+        body = f.read(topic_len + payload_len)
+        if len(body) < topic_len + payload_len:
+            return
+        yield timestamp, body[:topic_len].decode("utf-8", errors="replace"), body[topic_len:]
+
+
+def is_capture_file(path: str) -> bool:
+    """True se il file inizia con l'intestazione di un file di cattura."""
+    try:
+        with _open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except (OSError, EOFError):
+        return False
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Decifratura dei pacchetti Meshtastic cifrati con la PSK del canale.
+
+Meshtastic usa AES-CTR (128 o 256 bit) con nonce di 16 byte:
+packet id (8 byte little endian) + nodo mittente (4 byte little endian) + 4 byte a zero.
+Il campo `channel` di un MeshPacket cifrato contiene l'hash del canale
+(XOR dei byte del nome XOR i byte della chiave), usato per scegliere la chiave.
+"""
+import base64
+import importlib.util
+import logging
+import struct
+import threading
+
+logger = logging.getLogger(__name__)
+
+CRYPTO_AVAILABLE = importlib.util.find_spec("cryptography") is not None
+
+# Chiave di default di Meshtastic, usata dalle PSK di un solo byte ("AQ==" = indice 1)
+DEFAULT_KEY = bytes([0xd4, 0xf1, 0xbb, 0x3a, 0x20, 0x29, 0x07, 0x59,
+                     0xf0, 0xbc, 0xff, 0xab, 0xcf, 0x4e, 0x69, 0x01])
+
+
+def expand_psk(psk_b64):
+    """
+    Converte una PSK base64 nella chiave AES effettiva.
+
+    Returns:
+        bytes: Chiave di 16 o 32 byte, oppure b"" se il canale non è cifrato
+    """
+    psk = base64.b64decode(psk_b64)
+    if len(psk) == 0:
+        return b""
+    if len(psk) == 1:
+        index = psk[0]
+        if index == 0:
+            return b""
+        # Le PSK "semplici" 1..N modificano l'ultimo byte della chiave di default
+        return DEFAULT_KEY[:-1] + bytes([(DEFAULT_KEY[-1] + index - 1) & 0xff])
+    # Come il firmware: chiavi di lunghezza intermedia completate con zeri fino a 128 o 256 bit
+    if len(psk) < 16:
+        return psk.ljust(16, b"\x00")
+    if 16 < len(psk) < 32:
+        return psk.ljust(32, b"\x00")
+    return psk
+
+
+def xor_hash(data):
+    """XOR di tutti i byte."""
+    result = 0
+    for byte in data:
+        result ^= byte
+    return result
+
+
+def channel_hash(name, key):
+    """Hash del canale come calcolato dal firmware Meshtastic."""
+    return xor_hash(name.encode('utf-8')) ^ xor_hash(key)
+
+
+def build_nonce(packet_id, from_node):
+    """Nonce AES-CTR per un pacchetto."""
+    return struct.pack("<QI", packet_id, from_node) + b"\x00" * 4
+
+
+def parse_channel_keys(value):
+    """
+    Legge la configurazione dei canali nel formato "Nome:psk_base64;Nome2:psk_base64".
+
+    Returns:
+        list: Lista di tuple (nome, psk_base64)
+    """
+    channels = []
+    for item in (value or "").split(";"):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, psk = item.partition(":")
+        channels.append((name.strip(), psk.strip()))
+    return channels
+
+
+class ChannelKeyring:
+    """
+    Chiavi dei canali configurati, indicizzate per hash del canale.
+
+    Per ogni hash viene tenuta in cache la lista degli algoritmi AES già costruiti,
+    così la PSK viene espansa e validata una volta sola.
+    """
+
+    def __init__(self, channels):
+        """
+        Args:
+            channels: Lista di tuple (nome_canale, psk_base64)
+        """
+        if channels and not CRYPTO_AVAILABLE:
+            logger.warning("⚠️  Libreria cryptography non disponibile, i pacchetti cifrati verranno ignorati")
+            logger.warning("💡 Installa con: pipenv install cryptography")
+        self._lock = threading.Lock()
+        self._by_hash = {}
+        self._algorithms = {}
+        self.channels = []
+        for name, psk_b64 in channels:
+            key = expand_psk(psk_b64)
+            self.channels.append(name)
+            self._by_hash.setdefault(channel_hash(name, key), []).append((name, key))
+
+    @classmethod
+    def from_config(cls, value):
+        """Crea il keyring dalla stringa di configurazione MESHTASTIC_CHANNEL_KEYS."""
+        return cls(parse_channel_keys(value))
+
+    def get_channels(self, hash_value):
+        """Restituisce i (nome, chiave) dei canali con l'hash indicato."""
+        return self._by_hash.get(hash_value, [])
+
+    def _get_algorithm(self, key):
+        algorithm = self._algorithms.get(key)
+        if algorithm is None:
+            from cryptography.hazmat.primitives.ciphers import algorithms
+            with self._lock:
+                algorithm = self._algorithms.setdefault(key, algorithms.AES(key))
+        return algorithm
+
+    def decrypt(self, key, packet_id, from_node, encrypted):
+        """
+        Decifra (o cifra: in CTR è la stessa operazione) il payload di un pacchetto.
+
+        Returns:
+            bytes: Payload in chiaro; se la chiave è vuota il payload è restituito invariato
+        """
+        if not key:
+            return bytes(encrypted)
+        from cryptography.hazmat.primitives.ciphers import Cipher, modes
+        cipher = Cipher(self._get_algorithm(key), modes.CTR(build_nonce(packet_id, from_node)))
+        decryptor = cipher.decryptor()
+        return decryptor.update(encrypted) + decryptor.finalize()
+
+    def decrypt_packet(self, packet_id, from_node, channel_hash_value, encrypted):
+        """
+        Prova le chiavi dei canali con l'hash del pacchetto.
+
+        Returns:
+            list: Possibili payload in chiaro come (nome_canale, bytes), in ordine di configurazione
+        """
+        if not CRYPTO_AVAILABLE:
+            return []
+        return [(name, self.decrypt(key, packet_id, from_node, encrypted))
+                for name, key in self.get_channels(channel_hash_value)]
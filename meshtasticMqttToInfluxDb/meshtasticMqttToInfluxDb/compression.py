@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+Compressione dei punti prima dei sink: deadband, swinging door e distanza minima.
+
+I nodi inviano telemetria e posizioni a intervalli fissi e la maggior parte dei
+valori consecutivi è identica o entro il rumore del sensore. Le regole di
+COMPRESSION indicano, per measurement o per singolo campo, quali valori scrivere:
+
+    "telemetry=deadband:abs=0.01; telemetry.uptime_seconds=swinging_door:abs=300;
+     position=distance:meters=25"
+
+- deadband: un campo viene scritto solo se si discosta dall'ultimo valore scritto
+  più di max(abs, rel * |ultimo valore|);
+- swinging_door: un campo viene scritto solo quando la retta dall'ultimo valore
+  scritto non passa più entro la tolleranza da tutti i valori successivi; viene
+  allora scritto l'ultimo valore trattenuto, con il suo timestamp, così la forma
+  della serie resta ricostruibile per interpolazione lineare;
+- distance: una posizione viene scritta solo se il nodo si è spostato di almeno
+  `meters` metri;
+- off: il campo viene sempre scritto (per escluderlo da una regola di measurement).
+
+Ogni campo viene comunque scritto se dall'ultima scrittura sono passati
+`heartbeat` secondi (tempo del pacchetto). Un punto senza più campi non viene
+scritto. Lo stato è tenuto per (measurement, nodo, campo) in una mappa limitata
+a `max_series` voci: oltre il limite si eliminano le serie ferme da più di un
+heartbeat, e se non basta i punti delle nuove serie passano senza compressione.
+"""
+import math
+import threading
+
+MODES = ('deadband', 'swinging_door', 'distance', 'off')
+MODE_OPTIONS = {
+    'deadband': ('abs', 'rel', 'heartbeat'),
+    'swinging_door': ('abs', 'rel', 'heartbeat'),
+    'distance': ('meters', 'heartbeat'),
+    'off': (),
+}
+EARTH_RADIUS_M = 6371008.8
+
+
+class Rule:
+    __slots__ = ('mode', 'absolute', 'relative', 'meters', 'heartbeat')
+
+    def __init__(self, mode, absolute=0.0, relative=0.0, meters=0.0, heartbeat=None):
+        self.mode = mode
+        self.absolute = absolute
+        self.relative = relative
+        self.meters = meters
+        self.heartbeat = heartbeat
+
+    def tolerance(self, reference):
+        return max(self.absolute, self.relative * abs(reference))
+
+
+def parse_compression(value: str, heartbeat: float = 3600.0):
+    """
+    Interpreta COMPRESSION: "measurement[.campo]=modo[:opzione=valore,...]; ...".
+
+    Args:
+        value: Regole separate da `;`
+        heartbeat: Secondi massimi senza scritture, se la regola non indica `heartbeat`
+
+    Returns:
+        dict: {(measurement, campo o None): Rule}
+    """
+    rules = {}
+    for item in value.split(';'):
+        item = item.strip()
+        if not item:
+            continue
+        target, separator, spec = item.partition('=')
+        measurement, _, field = target.strip().partition('.')
+        mode, _, raw_options = spec.partition(':')
+        mode = mode.strip().lower()
+        if not separator or not measurement or mode not in MODES:
+            raise ValueError(f"COMPRESSION: regola non valida '{item}' (es. telemetry=deadband:abs=0.01)")
+        if mode == 'distance' and field:
+            raise ValueError(f"COMPRESSION: distance si applica a tutta la measurement '{item}'")
+        options = {}
+        for option in raw_options.split(','):
+            if not option.strip():
+                continue
+            key, separator, option_value = option.partition('=')
+            key = key.strip().lower()
+            if not separator or key not in MODE_OPTIONS[mode]:
+                raise ValueError(f"COMPRESSION: opzione '{option.strip()}' non valida per {mode}")
+            try:
+                options[key] = float(option_value)
+            except ValueError:
+                raise ValueError(f"COMPRESSION: valore non numerico in '{option.strip()}'") from None
+            if options[key] < 0:
+                raise ValueError(f"COMPRESSION: valore negativo in '{option.strip()}'")
+        key = (measurement, field.strip() or None)
+        if key in rules:
+            raise ValueError(f"COMPRESSION: regola duplicata per '{target.strip()}'")
+        rules[key] = Rule(mode, absolute=options.get('abs', 0.0), relative=options.get('rel', 0.0),
+                          meters=options.get('meters', 0.0), heartbeat=options.get('heartbeat', heartbeat))
+    return rules
+
+
+def distance_m(lat1, lon1, lat2, lon2):
+    """Distanza in metri tra due coordinate in gradi (formula dell'emisenoverso)."""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+class PointCompressor:
+    """
+    Filtra i campi dei punti secondo le regole di compressione, con stato per serie.
+    """
+
+    def __init__(self, rules, max_series: int = 50000):
+        """
+        Args:
+            rules: {(measurement, campo o None): Rule}, vedi parse_compression()
+            max_series: Serie (measurement, nodo, campo) di cui tenere lo stato
+        """
+        self.rules = dict(rules)
+        self.measurements = frozenset(measurement for measurement, _ in self.rules)
+        self.max_series = max_series
+
+        self._lock = threading.Lock()
+        # (measurement, node_id, campo) -> stato, vedi _keep() e _distance()
+        self._series = {}
+        self._field_rules = {}  # (measurement, campo) -> Rule o None, risolto una volta sola
+        self.stats = {
+            'points_in': 0,
+            'points_out': 0,
+            'points_dropped': 0,
+            'fields_in': 0,
+            'fields_out': 0,
+            'held_written': 0,
+            'series_pruned': 0,
+            'series_uncompressed': 0,
+        }
+
+    def rule_for(self, measurement, field):
+        key = (measurement, field)
+        try:
+            return self._field_rules[key]
+        except KeyError:
+            rule = self.rules.get(key) or self.rules.get((measurement, None))
+            if rule is not None and rule.mode == 'off':
+                rule = None
+            self._field_rules[key] = rule
+            return rule
+
+    def compress(self, point_dict):
+        """
+        Returns:
+            list: Punti da scrivere: eventuali valori trattenuti dallo swinging door, poi il
+            punto con i soli campi da scrivere (assente se non ne resta nessuno)
+        """
+        measurement = point_dict['measurement']
+        if measurement not in self.measurements:
+            return [point_dict]
+        node_id = point_dict['tags'].get('node_id')
+        fields = point_dict['fields']
+        timestamp = point_dict['time'] / 1_000_000_000
+        held = {}  # (timestamp ns, measurement, tag) -> punto con i valori trattenuti da scrivere
+
+        with self._lock:
+            self.stats['points_in'] += 1
+            self.stats['fields_in'] += len(fields)
+            position_rule = self.rule_for(measurement, None)
+            if position_rule is not None and position_rule.mode == 'distance':
+                keep = self._distance(position_rule, (measurement, node_id, None), timestamp, fields, held)
+                kept = fields if keep else {}
+            else:
+                kept = {}
+                for field, value in fields.items():
+                    rule = self.rule_for(measurement, field)
+                    if rule is None or self._keep(rule, (measurement, node_id, field), timestamp, value,
+                                                  point_dict, held):
+                        kept[field] = value
+            self.stats['fields_out'] += len(kept)
+            if kept:
+                self.stats['points_out'] += 1
+            else:
+                self.stats['points_dropped'] += 1
+            self.stats['held_written'] += len(held)
+
+        points = [held[series] for series in sorted(held)]
+        if kept:
+            points.append(point_dict if len(kept) == len(fields) else {**point_dict, 'fields': kept})
+        return points
+
+    def _state(self, key, timestamp, heartbeat, held):
+        # Chiamata con il lock. None = nessuno stato disponibile (mappa piena): il valore va scritto
+        state = self._series.get(key)
+        if state is None and len(self._series) >= self.max_series:
+            self._prune(timestamp, heartbeat, held)
+            if len(self._series) >= self.max_series:
+                self.stats['series_uncompressed'] += 1
+        return state
+
+    def _prune(self, timestamp, heartbeat, held):
+        # Le serie ferme da più di un heartbeat sarebbero comunque riscritte al prossimo valore
+        stale = [key for key, state in self._series.items() if timestamp - state[0] >= heartbeat]
+        for key in stale:
+            state = self._series.pop(key)
+            if len(state) > 4 and state[4] is not None:
+                self._emit_held(key, state, held)
+        self.stats['series_pruned'] += len(stale)
+
+    def _keep(self, rule, key, timestamp, value, point_dict, held):
+        state = self._state(key, timestamp, rule.heartbeat, held)
+        numeric = value.__class__ is not bool and isinstance(value, (int, float))
+        if state is None:
+            if len(self._series) < self.max_series:
+                # [ultimo timestamp scritto, ultimo valore scritto, ...]
+                if rule.mode == 'swinging_door' and numeric:
+                    # ..., pendenza minima, pendenza massima, valore trattenuto (timestamp, valore, ns, tag)
+                    self._series[key] = [timestamp, value, -math.inf, math.inf, None]
+                else:
+                    self._series[key] = [timestamp, value]
+            return True
+
+        if timestamp - state[0] >= rule.heartbeat:
+            self._archive(key, state, timestamp, value, held)
+            return True
+        if not numeric or state[1].__class__ is bool or not isinstance(state[1], (int, float)):
+            # Valori non numerici: scritti solo quando cambiano
+            if value == state[1]:
+                return False
+            self._archive(key, state, timestamp, value, held)
+            return True
+        if rule.mode == 'deadband' or len(state) == 2:
+            if abs(value - state[1]) <= rule.tolerance(state[1]):
+                return False
+            self._archive(key, state, timestamp, value, held)
+            return True
+        return self._swinging_door(rule, key, state, timestamp, value, point_dict, held)
+
+    def _archive(self, key, state, timestamp, value, held):
+        """Il valore corrente viene scritto e diventa il riferimento (prima l'eventuale valore trattenuto)."""
+        if len(state) > 2:
+            if state[4] is not None:
+                self._emit_held(key, state, held)
+            state[2] = -math.inf
+            state[3] = math.inf
+        state[0] = timestamp
+        state[1] = value
+
+    def _swinging_door(self, rule, key, state, timestamp, value, point_dict, held):
+        archived_ts, archived = state[0], state[1]
+        elapsed = timestamp - archived_ts
+        tolerance = rule.tolerance(archived)
+        if elapsed <= 0:
+            # Stesso timestamp (o in ritardo): nessuna pendenza, si confronta solo il valore
+            if abs(value - archived) <= tolerance:
+                return False
+            self._archive(key, state, timestamp, value, held)
+            return True
+        low = max(state[2], (value - tolerance - archived) / elapsed)
+        high = min(state[3], (value + tolerance - archived) / elapsed)
+        if low <= high:
+            # Il valore è dentro la porta: viene trattenuto al posto del precedente
+            state[2], state[3] = low, high
+            state[4] = (timestamp, value, point_dict['time'], point_dict['tags'])
+            return False
+        if state[4] is None:
+            self._archive(key, state, timestamp, value, held)
+            return True
+
+        # Porta chiusa: si scrive il valore trattenuto e la nuova porta parte da lì
+        self._emit_held(key, state, held)
+        state[2], state[3] = -math.inf, math.inf
+        return self._swinging_door(rule, key, state, timestamp, value, point_dict, held)
+
+    def _emit_held(self, key, state, held):
+        # Chiamata con il lock: il valore trattenuto diventa il nuovo riferimento della porta
+        hold_ts, hold_value, time_ns, tags = state[4]
+        state[0], state[1], state[4] = hold_ts, hold_value, None
+        # Un punto per serie e timestamp: i campi trattenuti di nodi diversi non si mescolano
+        series = (time_ns, key[0], tuple(sorted(tags.items())))
+        point = held.get(series)
+        if point is None:
+            point = held[series] = {'measurement': key[0], 'time': time_ns, 'tags': tags, 'fields': {}}
+        point['fields'][key[2]] = hold_value
+
+    def _distance(self, rule, key, timestamp, fields, held):
+        latitude = fields.get('latitude')
+        longitude = fields.get('longitude')
+        if not isinstance(latitude, (int, float)) or not isinstance(longitude, (int, float)):
+            return True
+        state = self._state(key, timestamp, rule.heartbeat, held)
+        if state is None:
+            if len(self._series) < self.max_series:
+                self._series[key] = [timestamp, (latitude, longitude)]
+            return True
+        if (timestamp - state[0] < rule.heartbeat
+                and distance_m(state[1][0], state[1][1], latitude, longitude) < rule.meters):
+            return False
+        state[0] = timestamp
+        state[1] = (latitude, longitude)
+        return True
+
+    def flush(self):
+        """
+        Returns:
+            list: Punti con i valori trattenuti dallo swinging door (in chiusura, per non perderli)
+        """
+        held = {}
+        with self._lock:
+            for key, state in self._series.items():
+                if len(state) > 4 and state[4] is not None:
+                    self._emit_held(key, state, held)
+                    state[2], state[3] = -math.inf, math.inf
+            self.stats['held_written'] += len(held)
+        return [held[series] for series in sorted(held)]
+
+    def get_stats(self) -> dict:
+        """Punti e campi in ingresso e in uscita, e serie tenute in memoria."""
+        with self._lock:
+            return {**self.stats, 'series': len(self._series)}
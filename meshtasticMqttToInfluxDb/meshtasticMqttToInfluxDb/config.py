@@ -3,27 +3,146 @@ import sys
 import os
 
 
+# Valori di default per le impostazioni opzionali
+DEFAULTS = {
+    # Scrittura batch su InfluxDB
+    'INFLUXDB_BATCH_SIZE': '1000',  # punti per batch
+    'INFLUXDB_FLUSH_INTERVAL_MS': '1000',  # flush del batch anche se non pieno
+    'INFLUXDB_JITTER_INTERVAL_MS': '0',  # ritardo casuale prima di ogni scrittura
+    'INFLUXDB_MAX_IN_FLIGHT': '2',  # richieste HTTP di scrittura concorrenti
+    'INFLUXDB_MAX_RETRIES': '5',
+    'INFLUXDB_MAX_CLOSE_WAIT_MS': '30000',  # attesa massima del flush in chiusura
+    # Spool su disco quando InfluxDB non è raggiungibile (vuoto = disabilitato)
+    'SPOOL_DIR': '',
+    'SPOOL_SEGMENT_MB': '16',
+    'SPOOL_MAX_MB': '1024',  # oltre questo limite vengono eliminati i segmenti più vecchi
+    'SPOOL_COMPRESS': '0',
+    'SPOOL_REPLAY_BATCH': '5000',  # punti per richiesta durante la rilettura
+    'SPOOL_REPLAY_INTERVAL_S': '5',
+    # Coda di ingest tra thread MQTT e worker
+    'INGEST_QUEUE_SIZE': '10000',  # messaggi in attesa prima di scartare i più vecchi
+    'INGEST_WORKERS': '2',
+    'INGEST_STATS_INTERVAL_S': '60',  # 0 disabilita la stampa periodica delle statistiche
+    # Ingest dei ServiceEnvelope protobuf (topic /e/ e /c/)
+    'INGEST_PROTOBUF': '0',
+    'MESHTASTIC_CHANNEL_KEYS': 'LongFast:AQ==',  # "Nome:psk_base64;Nome2:psk_base64"
+    # De-duplicazione dei pacchetti ricevuti da più gateway
+    'DEDUP_MODE': 'off',  # off | drop | reception
+    'DEDUP_CACHE_SIZE': '10000',
+    'DEDUP_TTL_S': '600',
+    # Schema JSON delle measurement (vuoto = measurement_schema.json incluso)
+    'MEASUREMENT_SCHEMA_PATH': '',
+    # Registro dei nodi (nodeinfo) e arricchimento dei punti
+    'NODE_REGISTRY_PATH': '',  # file SQLite, es. in un volume (vuoto = solo in memoria)
+    'NODE_ENRICH_TAGS': '',  # tag aggiunti a telemetria e posizioni, es. longname,hardware (vuoto = nessuno)
+    'NODE_TAG_MAX_VALUES': '1000',  # valori distinti per chiave di tag, oltre vengono omessi
+    'NODE_REGISTRY_REFRESH_S': '30',  # rilettura del file scritto dagli altri processi (0 = solo all'avvio)
+    # Aggregati per finestra (rollup) scritti in un bucket separato (vuoto = disabilitato)
+    'ROLLUP_BUCKET': '',
+    'ROLLUP_WINDOWS': '1m,15m,1h',
+    'ROLLUP_MEASUREMENTS': 'telemetry,custom_metrics',
+    'ROLLUP_MAX_SERIES': '10000',  # coppie measurement/nodo aggregate contemporaneamente
+    'ROLLUP_GRACE_S': '60',  # attesa dopo la fine di una finestra prima di scriverla
+    # Compressione dei punti prima dei sink: "telemetry=deadband:abs=0.01;position=distance:meters=25" (vuoto = disabilitata)
+    'COMPRESSION': '',
+    'COMPRESSION_HEARTBEAT_S': '3600',  # scrittura comunque dopo questo intervallo, se la regola non indica heartbeat=
+    'COMPRESSION_MAX_SERIES': '50000',  # serie (measurement, nodo, campo) di cui tenere lo stato
+    # Pubblicazione verso Home Assistant
+    'HA_DISCOVERY_PREFIX': 'homeassistant',
+    'HA_STATE_PREFIX': 'homeassitant/sensor',  # topic di stato: {prefisso}/{node_id}/state
+    'HA_DEADBAND': '0',  # variazione minima per ripubblicare un valore
+    'HA_MIN_INTERVAL_S': '30',  # intervallo minimo tra due stati dello stesso nodo
+    # Classi di priorità e load shedding (vedi shedding.py), dalla classe più importante
+    'PRIORITY_CLASSES': 'high=telemetry,custom_metrics,nodeinfo;normal=*;low=position,mapreport',
+    'LOAD_SHED_START': '0.5',  # riempimento della coda di ingest oltre il quale si campiona la classe più bassa
+    'NODE_RATE_LIMIT_PER_MIN': '6',  # punti al minuto per nodo e classe sotto carico (0 = nessun limite)
+    'NODE_RATE_BURST': '10',
+    'SHED_MAX_NODE_SERIES': '500',  # nodi distinti nella metrica degli scarti per nodo
+    # Destinazioni dei punti: "influxdb;home_assistant;file:path=points.lp" (vedi sinks.py)
+    'SINKS': 'influxdb;home_assistant',
+    'SINK_QUEUE_SIZE': '10000',  # punti in attesa per sink prima di scartare i più vecchi
+    'SINK_BATCH_SIZE': '500',
+    'SINK_FLUSH_INTERVAL_MS': '1000',
+    'SINK_MAX_RETRIES': '5',
+    # Importazione di archivi storici (--backfill)
+    'BACKFILL_BATCH_SIZE': '10000',  # righe line protocol per richiesta
+    'BACKFILL_PARALLEL': '4',  # richieste di scrittura concorrenti
+    'BACKFILL_CHECKPOINT': 'backfill_checkpoint.json',  # default di --checkpoint
+    'BACKFILL_PROGRESS_S': '10',  # intervallo dei messaggi di avanzamento
+    # Runtime del servizio: threads (paho loop_forever + worker) o asyncio
+    'RUNTIME': 'threads',
+    # Più processi con sottoscrizione condivisa MQTT ($share/<gruppo>/...)
+    'WORKER_PROCESSES': '1',  # default di --workers
+    'MQTT_SHARED_GROUP': '',  # vuoto = sottoscrizione normale (con più processi: meshtastic-ingest)
+    # Filtri sottoscritti e relativo handler: "{root}/+/2/json/#=json;{root}/+/2/e/#=protobuf" (vuoto = {root}/#=auto)
+    'MQTT_SUBSCRIPTIONS': '',
+    'WORKER_STATS_INTERVAL_S': '5',  # invio delle statistiche dei processi al supervisore
+    # Logging
+    'LOG_LEVEL': 'INFO',
+    'LOG_LEVELS': '',  # livelli per modulo: "mqtt=DEBUG,influxdb=WARNING"
+    'LOG_FORMAT': 'text',  # text | json
+    'LOG_RATE_LIMIT': '20',  # record per modello di messaggio ogni LOG_RATE_INTERVAL_S (0 = nessun limite)
+    'LOG_RATE_INTERVAL_S': '10',
+    'LOG_QUEUE_SIZE': '10000',  # record in attesa di scrittura prima di scartare
+    # Endpoint OpenMetrics/Prometheus (vuoto = disabilitato)
+    'METRICS_PORT': '',
+    'METRICS_HOST': '0.0.0.0',
+    'STAGE_TIMERS': '1',  # durata degli stadi nell'istogramma meshtastic_stage_seconds (0 = timer disattivati)
+}
+
 config = {
+    **DEFAULTS,
     **dotenv_values(),  # load shared development variables
     **os.environ,  # override loaded values with environment variables
 }
 
 
 
-assert config['MQTT_HOST'] is not None, "MQTT_HOST is not set"
-assert config['MQTT_PORT'] is not None, "MQTT_PORT is not set"
-assert config['MQTT_USERNAME'] is not None, "MQTT_USERNAME is not set"
-assert config['MQTT_PASSWORD'] is not None, "MQTT_PASSWORD is not set"
-assert config['MQTT_ROOT_TOPIC'] is not None, "MQTT_ROOT_TOPIC is not set"
-assert config['INFLUXDB_HOST'] is not None, "INFLUXDB_HOST is not set"
-assert config['INFLUXDB_PORT'] is not None, "INFLUXDB_PORT is not set"
-assert config['INFLUXDB_TOKEN'] is not None, "INFLUXDB_TOKEN is not set"
-assert config['INFLUXDB_ORG'] is not None, "INFLUXDB_ORG is not set"
-assert config['INFLUXDB_BUCKET'] is not None, "INFLUXDB_BUCKET is not set"
-
-
-config['MQTT_PORT'] = int(config['MQTT_PORT'])
+REQUIRED = (
+    'MQTT_HOST', 'MQTT_PORT', 'MQTT_USERNAME', 'MQTT_PASSWORD', 'MQTT_ROOT_TOPIC',
+    'INFLUXDB_HOST', 'INFLUXDB_PORT', 'INFLUXDB_TOKEN', 'INFLUXDB_ORG', 'INFLUXDB_BUCKET',
+)
 
 
+def validate_config():
+    """
+    Verifica che le variabili obbligatorie siano impostate.
+    Chiamata da main() invece che all'import, così i test e --help non richiedono un .env completo.
+    """
+    for key in REQUIRED:
+        assert config.get(key) is not None, f"{key} is not set"
 
 
+if config.get('MQTT_PORT') is not None:
+    config['MQTT_PORT'] = int(config['MQTT_PORT'])
+for key in ('INFLUXDB_BATCH_SIZE', 'INFLUXDB_FLUSH_INTERVAL_MS', 'INFLUXDB_JITTER_INTERVAL_MS',
+            'INFLUXDB_MAX_IN_FLIGHT', 'INFLUXDB_MAX_RETRIES', 'INFLUXDB_MAX_CLOSE_WAIT_MS',
+            'SPOOL_SEGMENT_MB', 'SPOOL_MAX_MB', 'SPOOL_REPLAY_BATCH', 'SPOOL_REPLAY_INTERVAL_S',
+            'INGEST_QUEUE_SIZE', 'INGEST_WORKERS', 'INGEST_STATS_INTERVAL_S',
+            'DEDUP_CACHE_SIZE', 'DEDUP_TTL_S', 'NODE_TAG_MAX_VALUES', 'ROLLUP_MAX_SERIES', 'COMPRESSION_MAX_SERIES',
+            'SINK_QUEUE_SIZE', 'SINK_BATCH_SIZE', 'SINK_FLUSH_INTERVAL_MS', 'SINK_MAX_RETRIES',
+            'NODE_RATE_BURST', 'SHED_MAX_NODE_SERIES',
+            'WORKER_PROCESSES', 'WORKER_STATS_INTERVAL_S', 'LOG_RATE_LIMIT', 'LOG_QUEUE_SIZE',
+            'BACKFILL_BATCH_SIZE', 'BACKFILL_PARALLEL'):
+    config[key] = int(config[key])
+config['INGEST_PROTOBUF'] = config['INGEST_PROTOBUF'].lower() in ('1', 'true', 'yes')
+config['SPOOL_COMPRESS'] = config['SPOOL_COMPRESS'].lower() in ('1', 'true', 'yes')
+config['STAGE_TIMERS'] = config['STAGE_TIMERS'].lower() in ('1', 'true', 'yes')
+config['HA_DEADBAND'] = float(config['HA_DEADBAND'])
+config['HA_MIN_INTERVAL_S'] = float(config['HA_MIN_INTERVAL_S'])
+config['LOG_RATE_INTERVAL_S'] = float(config['LOG_RATE_INTERVAL_S'])
+config['NODE_REGISTRY_REFRESH_S'] = float(config['NODE_REGISTRY_REFRESH_S'])
+config['BACKFILL_PROGRESS_S'] = float(config['BACKFILL_PROGRESS_S'])
+config['ROLLUP_GRACE_S'] = float(config['ROLLUP_GRACE_S'])
+config['COMPRESSION_HEARTBEAT_S'] = float(config['COMPRESSION_HEARTBEAT_S'])
+config['LOAD_SHED_START'] = float(config['LOAD_SHED_START'])
+config['NODE_RATE_LIMIT_PER_MIN'] = float(config['NODE_RATE_LIMIT_PER_MIN'])
+config['ROLLUP_MEASUREMENTS'] = tuple(m.strip() for m in config['ROLLUP_MEASUREMENTS'].split(',') if m.strip())
+config['NODE_ENRICH_TAGS'] = tuple(tag.strip().lower() for tag in config['NODE_ENRICH_TAGS'].split(',') if tag.strip())
+config['LOG_FORMAT'] = config['LOG_FORMAT'].lower()
+assert config['LOG_FORMAT'] in ('text', 'json'), "LOG_FORMAT must be text or json"
+config['METRICS_PORT'] = int(config['METRICS_PORT']) if config['METRICS_PORT'] else None
+config['DEDUP_MODE'] = config['DEDUP_MODE'].lower()
+assert config['DEDUP_MODE'] in ('off', 'drop', 'reception'), "DEDUP_MODE must be off, drop or reception"
+config['RUNTIME'] = config['RUNTIME'].lower()
+assert config['RUNTIME'] in ('threads', 'asyncio'), "RUNTIME must be threads or asyncio"
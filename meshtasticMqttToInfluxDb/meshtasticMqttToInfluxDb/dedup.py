@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Indice dei pacchetti già visti, per non importare più volte lo stesso pacchetto
+ricevuto da più gateway.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class SeenPacketCache:
+    """
+    Cache limitata dei pacchetti visti, identificati da (nodo mittente, packet id).
+
+    Le voci scadono dopo `ttl` secondi dalla prima ricezione e, se la cache è piena,
+    viene rimossa la più vecchia. L'ordine di inserimento coincide con l'ordine di
+    scadenza, quindi pulizia ed eviction avvengono sempre in testa in O(1).
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 600.0, clock=time.monotonic):
+        """
+        Args:
+            max_size: Numero massimo di pacchetti ricordati
+            ttl: Secondi dopo i quali un pacchetto viene dimenticato
+            clock: Funzione che restituisce il tempo corrente (per i test)
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._seen = OrderedDict()
+        self.stats = {
+            'unique': 0,
+            'duplicates': 0,
+            'expired': 0,
+            'evicted': 0,
+        }
+
+    def check(self, from_node, packet_id) -> bool:
+        """
+        Registra la ricezione di un pacchetto.
+
+        Returns:
+            bool: True se il pacchetto era già stato visto (duplicato)
+        """
+        key = (from_node, packet_id)
+        now = self._clock()
+        with self._lock:
+            self._expire(now)
+            if key in self._seen:
+                self.stats['duplicates'] += 1
+                return True
+            self._seen[key] = now
+            self.stats['unique'] += 1
+            if len(self._seen) > self.max_size:
+                self._seen.popitem(last=False)
+                self.stats['evicted'] += 1
+            return False
+
+    def _expire(self, now):
+        deadline = now - self.ttl
+        while self._seen:
+            key, first_seen = next(iter(self._seen.items()))
+            if first_seen > deadline:
+                break
+            self._seen.popitem(last=False)
+            self.stats['expired'] += 1
+
+    def __len__(self):
+        with self._lock:
+            return len(self._seen)
+
+    def get_stats(self) -> dict:
+        """Restituisce i contatori, incluso il numero di pacchetti in cache."""
+        with self._lock:
+            return {**self.stats, 'size': len(self._seen)}
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Pubblicazione dei sensori dei nodi Meshtastic verso Home Assistant via MQTT.
+
+Per ogni nodo viene pubblicato un unico messaggio JSON di stato con tutti i campi,
+solo quando almeno un valore cambia oltre la deadband e al massimo una volta ogni
+`min_interval` secondi. La configurazione MQTT discovery di ogni sensore viene
+pubblicata (retained) una sola volta.
+"""
+import json
+import re
+import threading
+import time
+from typing import Callable
+
+# Unità e device class dei campi noti, usate nella configurazione discovery
+FIELD_SENSORS = {
+    'battery_level': {'unit_of_measurement': '%', 'device_class': 'battery'},
+    'voltage': {'unit_of_measurement': 'V', 'device_class': 'voltage'},
+    'channel_utilization': {'unit_of_measurement': '%'},
+    'air_util_tx': {'unit_of_measurement': '%'},
+    'uptime_seconds': {'unit_of_measurement': 's', 'device_class': 'duration'},
+    'temperature': {'unit_of_measurement': '°C', 'device_class': 'temperature'},
+    'relative_humidity': {'unit_of_measurement': '%', 'device_class': 'humidity'},
+    'barometric_pressure': {'unit_of_measurement': 'hPa', 'device_class': 'atmospheric_pressure'},
+}
+
+
+class HomeAssistantPublisher:
+    """
+    Publisher con cache dell'ultimo valore pubblicato per nodo/campo.
+    """
+
+    def __init__(self, publish: Callable, discovery_prefix: str = "homeassistant",
+                 state_prefix: str = "homeassitant/sensor", deadband: float = 0.0,
+                 min_interval: float = 30.0, clock=time.monotonic):
+        """
+        Args:
+            publish: Funzione publish(topic, payload, qos, retain), es. MqttClient.publish
+            discovery_prefix: Prefisso MQTT discovery di Home Assistant
+            state_prefix: Prefisso dei topic di stato, il topic è {state_prefix}/{node_id}/state
+            deadband: Variazione minima (assoluta) di un valore numerico per ripubblicarlo
+            min_interval: Secondi minimi tra due messaggi di stato dello stesso nodo
+            clock: Funzione che restituisce il tempo corrente (per i test)
+        """
+        self._publish = publish
+        self.discovery_prefix = discovery_prefix
+        self.state_prefix = state_prefix
+        self.deadband = deadband
+        self.min_interval = min_interval
+        self._clock = clock
+
+        self._lock = threading.Lock()
+        self._state = {}  # node_id -> {campo: ultimo valore ricevuto}
+        self._published = {}  # node_id -> {campo: ultimo valore pubblicato}
+        self._last_publish = {}  # node_id -> istante dell'ultimo messaggio di stato
+        self._pending = set()  # nodi con modifiche non ancora pubblicate
+        self._discovered = set()  # (node_id, campo) con configurazione discovery già inviata
+        self._flush_thread = None
+        self._running = False
+
+        self.stats = {
+            'updates': 0,
+            'suppressed': 0,
+            'state_messages': 0,
+            'discovery_messages': 0,
+        }
+
+    def state_topic(self, node_id):
+        return f"{self.state_prefix}/{node_id}/state"
+
+    def _changed(self, old, new):
+        if old is None:
+            return True
+        if isinstance(old, (int, float)) and isinstance(new, (int, float)):
+            return abs(new - old) > self.deadband
+        return old != new
+
+    def update(self, node_id, fields: dict):
+        """
+        Registra i nuovi valori di un nodo e pubblica lo stato se necessario.
+        """
+        now = self._clock()
+        to_publish = []
+        with self._lock:
+            self.stats['updates'] += 1
+            state = self._state.setdefault(node_id, {})
+            published = self._published.setdefault(node_id, {})
+            changed = False
+            for key, value in fields.items():
+                state[key] = value
+                if self._changed(published.get(key), value):
+                    changed = True
+                if (node_id, key) not in self._discovered:
+                    self._discovered.add((node_id, key))
+                    to_publish.append(self._discovery_message(node_id, key))
+            if changed:
+                self._pending.add(node_id)
+            else:
+                self.stats['suppressed'] += 1
+            to_publish.extend(self._collect_due(now))
+
+        self._send(to_publish)
+
+    def _send(self, messages):
+        for topic, payload, retain, discovery_key in messages:
+            if self._publish(topic, payload, 0, retain) is False and discovery_key is not None:
+                # Discovery non inviata (es. broker disconnesso): verrà ritentata al prossimo valore
+                with self._lock:
+                    self._discovered.discard(discovery_key)
+
+    def flush(self, force: bool = False):
+        """Pubblica lo stato dei nodi in attesa il cui intervallo minimo è trascorso (tutti se force)."""
+        with self._lock:
+            to_publish = self._collect_due(None if force else self._clock())
+        self._send(to_publish)
+
+    def _collect_due(self, now):
+        # Messaggi di stato dei nodi in attesa pronti per la pubblicazione (chiamata con il lock)
+        messages = []
+        for node_id in list(self._pending):
+            last = self._last_publish.get(node_id)
+            if now is not None and last is not None and now - last < self.min_interval:
+                continue
+            self._pending.discard(node_id)
+            self._last_publish[node_id] = self._clock()
+            state = dict(self._state[node_id])
+            self._published[node_id] = state
+            self.stats['state_messages'] += 1
+            messages.append((self.state_topic(node_id), json.dumps(state), False, None))
+        return messages
+
+    def _discovery_message(self, node_id, key):
+        # L'object_id nel topic discovery ammette solo [a-zA-Z0-9_-]
+        object_id = re.sub(r'[^a-zA-Z0-9_-]', '_', f"{node_id.lstrip('!')}_{key}")
+        config = {
+            'name': key,
+            'unique_id': f"meshtastic_{object_id}",
+            'object_id': f"meshtastic_{object_id}",
+            'state_topic': self.state_topic(node_id),
+            'value_template': f"{{{{ value_json['{key}'] }}}}",
+            'state_class': 'measurement',
+            'device': {
+                'identifiers': [f"meshtastic_{node_id.lstrip('!')}"],
+                'name': f"Meshtastic {node_id}",
+                'manufacturer': 'Meshtastic',
+            },
+            **FIELD_SENSORS.get(key, {}),
+        }
+        self.stats['discovery_messages'] += 1
+        return (f"{self.discovery_prefix}/sensor/{object_id}/config", json.dumps(config), True, (node_id, key))
+
+    def start(self):
+        """Avvia il thread che pubblica gli stati rimasti in attesa per il rate limit."""
+        if self._running:
+            return
+        self._running = True
+        self._flush_thread = threading.Thread(target=self._flush_loop, name="ha-publisher", daemon=True)
+        self._flush_thread.start()
+
+    def close(self):
+        """Ferma il thread e pubblica gli stati in attesa."""
+        self._running = False
+        self.flush(force=True)
+
+    def _flush_loop(self):
+        interval = max(0.5, min(self.min_interval, 5.0))
+        while self._running:
+            time.sleep(interval)
+            self.flush()
+
+    def get_stats(self) -> dict:
+        """Restituisce i contatori del publisher."""
+        with self._lock:
+            return {**self.stats, 'nodes': len(self._state), 'pending': len(self._pending)}
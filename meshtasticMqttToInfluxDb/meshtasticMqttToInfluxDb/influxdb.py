@@ -1,37 +1,297 @@
 from config import config
+import importlib.util
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from spool import DiskSpool
 
-try:
-    from influxdb_client import InfluxDBClient, Point
-    from influxdb_client.client.write_api import SYNCHRONOUS
-    INFLUXDB_AVAILABLE = True
-    print("✅ InfluxDB library disponibile!")
-except ImportError as e:
-    INFLUXDB_AVAILABLE = False
-    print(f"⚠️  InfluxDB library non disponibile: {e}")
-    print("💡 Installa con: pipenv install influxdb-client")
+logger = logging.getLogger(__name__)
+
+# influxdb_client viene importato solo quando serve (init_influxdb):
+# il solo import costa quasi 200 ms all'avvio del processo.
+INFLUXDB_AVAILABLE = importlib.util.find_spec("influxdb_client") is not None
 
 
 
 class InfluxdbClient:
-    def __init__(self):
+    def __init__(self, bucket=None, spool_dir=None, url=None, token=None, org=None):
+        """
+        Args:
+            bucket: Bucket di destinazione (default INFLUXDB_BUCKET)
+            spool_dir: Directory dello spool (default SPOOL_DIR, "" = disabilitato)
+            url: Indirizzo del server (default INFLUXDB_HOST:INFLUXDB_PORT), per una seconda istanza
+            token: Token di accesso (default INFLUXDB_TOKEN)
+            org: Organizzazione (default INFLUXDB_ORG)
+        """
+        self.bucket = bucket or config['INFLUXDB_BUCKET']
+        self.url = url or f"{config['INFLUXDB_HOST']}:{config['INFLUXDB_PORT']}"
+        self.token = token or config['INFLUXDB_TOKEN']
+        self.org = org or config['INFLUXDB_ORG']
+        self.spool_dir = config['SPOOL_DIR'] if spool_dir is None else spool_dir
         self.influx_client = None
         self.write_api = None
+        self._stats_lock = threading.Lock()
+        # Batch corrente, riempito dai worker e svuotato dal thread di flush
+        self._buffer = []
+        self._buffer_lock = threading.Lock()
+        self._executor = None
+        # Batch inviati all'executor e non ancora conclusi, per non perderli se la chiusura scade
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._flush_thread = None
+        self._flush_stop = threading.Event()
+        self._abort_retries = threading.Event()
+        self.stats = {
+            'batches_written': 0,
+            'batches_failed': 0,
+            'batches_retried': 0,
+            'points_written': 0,
+            'points_failed': 0,
+            'points_spooled': 0,
+        }
+        # Spool su disco per le interruzioni di InfluxDB (disabilitato se spool_dir è vuota)
+        self.spool = None
+        self.healthy = False
+        self._replay_thread = None
+        self._replay_stop = threading.Event()
+        if self.spool_dir:
+            self.spool = DiskSpool(
+                self.spool_dir,
+                segment_bytes=config['SPOOL_SEGMENT_MB'] * 1024 * 1024,
+                max_bytes=config['SPOOL_MAX_MB'] * 1024 * 1024,
+                compress=config['SPOOL_COMPRESS'],
+            )
 
     def init_influxdb(self):
         if not INFLUXDB_AVAILABLE:
-            print("⚠️  InfluxDB non disponibile, i dati non verranno salvati")
+            logger.warning("⚠️  InfluxDB library non disponibile, i dati non verranno salvati")
+            logger.warning("💡 Installa con: pipenv install influxdb-client")
             return False
 
-        url = f"{config['INFLUXDB_HOST']}:{config['INFLUXDB_PORT']}"
-        self.influx_client = InfluxDBClient(url=url, token=config['INFLUXDB_TOKEN'])
+        from influxdb_client import InfluxDBClient
+
+        self.influx_client = InfluxDBClient(url=self.url, token=self.token)
         # Testa la connessione
         health = self.influx_client.health()
-        if health.status == "pass":
-            print(f"✅ Connesso a InfluxDB: {url}")
-            self.write_api = self.influx_client.write_api(write_options=SYNCHRONOUS)
-            return True
+        self.healthy = health.status == "pass"
+        if self.healthy:
+            logger.info("✅ Connesso a InfluxDB: %s", self.url)
+        elif self.spool is not None:
+            # Con lo spool si parte comunque: i punti vengono salvati su disco fino al ripristino
+            logger.warning("⚠️  InfluxDB non disponibile: %s, i punti verranno salvati in %s",
+                           health.message, self.spool_dir)
         else:
-            print(f"❌ InfluxDB non disponibile: {health.message}")
+            logger.error("❌ InfluxDB non disponibile: %s", health.message)
             raise Exception(f"❌ InfluxDB non disponibile: {health.message}")
             return False
 
+        from influxdb_client.client.write_api import SYNCHRONOUS
+        self.write_api = self.influx_client.write_api(write_options=SYNCHRONOUS)
+        self._executor = ThreadPoolExecutor(max_workers=config['INFLUXDB_MAX_IN_FLIGHT'],
+                                            thread_name_prefix="influxdb-write")
+        self._flush_thread = threading.Thread(target=self._flush_loop, name="influxdb-flush", daemon=True)
+        self._flush_thread.start()
+        logger.info("📦 Scrittura batch: %d punti, flush ogni %d ms, %d richieste in parallelo",
+                    config['INFLUXDB_BATCH_SIZE'], config['INFLUXDB_FLUSH_INTERVAL_MS'],
+                    config['INFLUXDB_MAX_IN_FLIGHT'])
+
+        if self.spool is not None:
+            self._replay_thread = threading.Thread(target=self._replay_loop, name="influxdb-spool-replay", daemon=True)
+            self._replay_thread.start()
+        return True
+
+    def write(self, record):
+        """
+        Accoda uno o più record (Point, dict o line protocol) nel batch corrente.
+        La scrittura effettiva avviene in background.
+        """
+        if self.write_api is None:
+            logger.error("❌ InfluxDB non inizializzato, record scartato")
+            return False
+        data = self._to_line_protocol(record)
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        # Anche con InfluxDB non raggiungibile i punti passano dal batch: è _write_batch,
+        # nel thread di scrittura, a salvarlo su disco con un solo fsync
+        with self._buffer_lock:
+            self._buffer.append(data)
+            if len(self._buffer) < config['INFLUXDB_BATCH_SIZE']:
+                return True
+            batch, self._buffer = self._buffer, []
+        self._submit(batch)
+        return True
+
+    def flush(self):
+        """Invia subito il batch corrente, anche se non è pieno."""
+        with self._buffer_lock:
+            batch, self._buffer = self._buffer, []
+        if batch:
+            self._submit(batch)
+
+    def _submit(self, batch):
+        # Al massimo INFLUXDB_MAX_IN_FLIGHT richieste contemporanee: gli altri batch attendono nell'executor
+        data = b"\n".join(batch)
+        with self._pending_lock:
+            future = self._executor.submit(self._write_batch, data)
+            self._pending[future] = data
+        future.add_done_callback(self._forget_pending)
+
+    def _forget_pending(self, future):
+        with self._pending_lock:
+            self._pending.pop(future, None)
+
+    def _flush_loop(self):
+        interval = config['INFLUXDB_FLUSH_INTERVAL_MS'] / 1000
+        while not self._flush_stop.wait(interval):
+            self.flush()
+
+    def _write_batch(self, data):
+        """
+        Scrive un batch con retry a backoff esponenziale; se tutti i tentativi falliscono
+        il batch viene passato a _on_batch_error (e allo spool, se configurato).
+        """
+        conf = (self.bucket, self.org)
+        jitter = config['INFLUXDB_JITTER_INTERVAL_MS'] / 1000
+        if jitter:
+            time.sleep(random.uniform(0, jitter))
+        for attempt in range(config['INFLUXDB_MAX_RETRIES'] + 1):
+            if self.spool is not None and not self.healthy and attempt == 0:
+                # Già in errore: niente richiesta né timeout, il batch va direttamente su disco
+                self._spool(data)
+                return
+            try:
+                self.write_api.write(bucket=self.bucket, org=self.org, record=data)
+                self._on_batch_success(conf, data)
+                return
+            except Exception as e:
+                if attempt < config['INFLUXDB_MAX_RETRIES'] and not self._abort_retries.is_set():
+                    self._on_batch_retry(conf, data, e)
+                    self._abort_retries.wait(min(2 ** attempt, 30))
+                    continue
+                self._on_batch_error(conf, data, e)
+                return
+
+    @staticmethod
+    def _to_line_protocol(record):
+        from influxdb_client import Point
+        if isinstance(record, (bytes, str)):
+            return record
+        if isinstance(record, dict):
+            record = Point.from_dict(record)
+        return record.to_line_protocol()
+
+    def _spool(self, data):
+        points = self.spool.append(data)
+        with self._stats_lock:
+            self.stats['points_spooled'] += points
+
+    def _replay_loop(self):
+        """Rilegge lo spool in batch grandi quando InfluxDB è di nuovo disponibile."""
+        interval = config['SPOOL_REPLAY_INTERVAL_S']
+        while not self._replay_stop.wait(interval):
+            if not self.healthy:
+                health = self.influx_client.health()
+                if health.status != "pass":
+                    continue
+                logger.info("✅ InfluxDB di nuovo disponibile, riprendo le scritture")
+                self.healthy = True
+            self._replay_spool()
+
+    def _replay_spool(self):
+        while not self._replay_stop.is_set():
+            data, position = self.spool.read_batch(config['SPOOL_REPLAY_BATCH'])
+            if data is None:
+                return
+            points = self._count_points(data)
+            try:
+                self.write_api.write(bucket=self.bucket, org=self.org, record=data)
+            except Exception as e:
+                logger.error("❌ Errore nella rilettura dello spool (%d punti): %s", points, e)
+                self.healthy = False
+                return
+            self.spool.commit(position, points)
+            logger.info("💾 Riscritti %d punti dallo spool", points)
+
+    def close(self):
+        """Scrive i batch in sospeso e chiude la connessione."""
+        if self.write_api is not None:
+            logger.info("⏳ Flush dei batch InfluxDB in sospeso...")
+            self._flush_stop.set()
+            self._flush_thread.join()
+            self.flush()
+            self._wait_writers(config['INFLUXDB_MAX_CLOSE_WAIT_MS'] / 1000)
+            self.write_api = None
+        if self._replay_thread is not None:
+            self._replay_stop.set()
+            self._replay_thread.join()
+            self._replay_thread = None
+        if self.spool is not None:
+            self.spool.close()
+            logger.info("📊 Statistiche spool: %s", self.spool.get_stats())
+        if self.influx_client is not None:
+            self.influx_client.close()
+            self.influx_client = None
+        logger.info("📊 Statistiche InfluxDB: %s", self.get_stats())
+
+    def _wait_writers(self, timeout):
+        # Attende i batch in coda o in corso, al massimo `timeout` secondi
+        done = threading.Event()
+        waiter = threading.Thread(target=lambda: (self._executor.shutdown(wait=True), done.set()), daemon=True)
+        waiter.start()
+        if done.wait(timeout):
+            return
+        logger.warning("⚠️  Batch InfluxDB non scritti entro il tempo massimo di chiusura")
+        # I retry in corso rinunciano al prossimo tentativo
+        self._abort_retries.set()
+        with self._pending_lock:
+            pending = dict(self._pending)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        # I batch mai partiti passano dallo stesso percorso di un errore: contati come falliti e,
+        # se configurato, salvati nello spool (ancora aperto) per la rilettura al riavvio
+        conf = (self.bucket, self.org)
+        for future, data in pending.items():
+            if future.cancelled():
+                self._on_batch_error(conf, data, "chiusura scaduta prima dell'invio")
+        # Le richieste già partite concludono l'ultimo tentativo e finiscono nello stesso percorso
+        running = [future for future in pending if not future.cancelled()]
+        unfinished = wait(running, timeout).not_done if running else ()
+        if unfinished:
+            logger.warning("⚠️  %d batch InfluxDB ancora in scrittura alla chiusura", len(unfinished))
+
+    def get_stats(self) -> dict:
+        """Restituisce una copia dei contatori di scrittura."""
+        with self._stats_lock:
+            return dict(self.stats)
+
+    @staticmethod
+    def _count_points(data):
+        # Il batch è line protocol: un punto per riga
+        if not data:
+            return 0
+        newline = b"\n" if isinstance(data, bytes) else "\n"
+        return data.count(newline) + 1
+
+    def _on_batch_success(self, conf, data):
+        self.healthy = True
+        with self._stats_lock:
+            self.stats['batches_written'] += 1
+            self.stats['points_written'] += self._count_points(data)
+
+    def _on_batch_error(self, conf, data, exception):
+        points = self._count_points(data)
+        with self._stats_lock:
+            self.stats['batches_failed'] += 1
+            self.stats['points_failed'] += points
+        logger.error("❌ Errore scrittura batch InfluxDB (%d punti): %s", points, exception)
+        if self.spool is not None:
+            # Il batch non è perso: viene salvato su disco e riscritto al ripristino
+            self.healthy = False
+            self._spool(data)
+            logger.warning("💾 %d punti salvati nello spool", points)
+
+    def _on_batch_retry(self, conf, data, exception):
+        with self._stats_lock:
+            self.stats['batches_retried'] += 1
+        logger.warning("⚠️  Nuovo tentativo di scrittura batch InfluxDB: %s", exception)
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Coda di ingest tra il thread di rete MQTT e l'elaborazione dei messaggi.
+
+Il thread di paho si limita ad accodare (topic, payload, receive_ts) in un
+buffer circolare limitato; un pool di worker svuota il buffer ed esegue
+parsing, preparazione dei punti e scrittura sui sink.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class IngestQueue:
+    """
+    Buffer circolare limitato con un pool di worker.
+
+    Quando il buffer è pieno il messaggio più vecchio viene scartato per far posto
+    al nuovo (i dati più recenti sono i più utili) e il contatore `dropped` viene
+    incrementato.
+    """
+
+    def __init__(self, handler: Callable, maxsize: int = 10000, workers: int = 2,
+                 stats_interval: Optional[float] = None):
+        """
+        Args:
+            handler: Funzione chiamata con (topic, payload, receive_ts) per ogni messaggio
+            maxsize: Numero massimo di messaggi in attesa
+            workers: Numero di thread worker
+            stats_interval: Se impostato, stampa le statistiche ogni N secondi
+        """
+        if maxsize < 1:
+            raise ValueError("maxsize deve essere almeno 1")
+        if workers < 1:
+            raise ValueError("workers deve essere almeno 1")
+
+        self.handler = handler
+        self.maxsize = maxsize
+        self.workers = workers
+        self.stats_interval = stats_interval
+
+        self._buffer = deque()
+        self._cond = threading.Condition()
+        self._running = False
+        self._threads = []
+        self._stats_thread = None
+
+        self.enqueued = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.worker_stats = [{'processed': 0, 'errors': 0} for _ in range(workers)]
+
+    def put(self, topic: str, payload: bytes, receive_ts: Optional[float] = None) -> bool:
+        """
+        Accoda un messaggio senza mai bloccare il chiamante.
+
+        Returns:
+            bool: False se per fare spazio è stato scartato un messaggio
+        """
+        if receive_ts is None:
+            receive_ts = time.time()
+        with self._cond:
+            dropped = len(self._buffer) >= self.maxsize
+            if dropped:
+                self._buffer.popleft()
+                self.dropped += 1
+            self._buffer.append((topic, payload, receive_ts))
+            self.enqueued += 1
+            depth = len(self._buffer)
+            if depth > self.max_depth:
+                self.max_depth = depth
+            self._cond.notify()
+        return not dropped
+
+    def on_mqtt_message(self, msg):
+        """Callback per MqttClient: accoda il messaggio paho ricevuto."""
+        self.put(msg.topic, msg.payload, time.time())
+
+    def start(self):
+        """Avvia i worker."""
+        if self._running:
+            return
+        self._running = True
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._worker, args=(index,),
+                                      name=f"ingest-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        if self.stats_interval:
+            self._stats_thread = threading.Thread(target=self._stats_loop,
+                                                  name="ingest-stats", daemon=True)
+            self._stats_thread.start()
+        logger.info("🧵 Avviati %d worker di ingest (coda max %d messaggi)", self.workers, self.maxsize)
+
+    def stop(self, timeout: Optional[float] = 10.0):
+        """
+        Ferma i worker dopo aver elaborato i messaggi ancora in coda.
+
+        Args:
+            timeout: Attesa massima in secondi per lo svuotamento della coda
+        """
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in self._threads:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            thread.join(remaining)
+        self._threads = []
+        pending = self.depth()
+        if pending:
+            logger.warning("⚠️  %d messaggi non elaborati alla chiusura della coda", pending)
+        logger.info("📊 Statistiche coda di ingest: %s", self.get_stats())
+
+    def depth(self) -> int:
+        """Numero di messaggi in attesa."""
+        with self._cond:
+            return len(self._buffer)
+
+    def get_stats(self) -> dict:
+        """
+        Restituisce lo stato della coda e il throughput per worker.
+
+        Returns:
+            dict: Dizionario con profondità, messaggi accodati/scartati e contatori per worker
+        """
+        with self._cond:
+            return {
+                'depth': len(self._buffer),
+                'max_depth': self.max_depth,
+                'maxsize': self.maxsize,
+                'enqueued': self.enqueued,
+                'dropped': self.dropped,
+                'workers': [dict(stats) for stats in self.worker_stats],
+            }
+
+    def _next(self):
+        # Restituisce il prossimo messaggio, o None quando la coda è ferma e vuota
+        with self._cond:
+            while not self._buffer:
+                if not self._running:
+                    return None
+                self._cond.wait()
+            return self._buffer.popleft()
+
+    def _worker(self, index: int):
+        stats = self.worker_stats[index]
+        while True:
+            item = self._next()
+            if item is None:
+                return
+            try:
+                self.handler(*item)
+                stats['processed'] += 1
+            except Exception as e:
+                stats['errors'] += 1
+                logger.error("❌ Errore nell'elaborazione del messaggio su %s: %s", item[0], e)
+
+    def _stats_loop(self):
+        last_processed = 0
+        while self._running:
+            time.sleep(self.stats_interval)
+            stats = self.get_stats()
+            processed = sum(worker['processed'] for worker in stats['workers'])
+            rate = (processed - last_processed) / self.stats_interval
+            last_processed = processed
+            logger.info("📊 Coda ingest: depth=%d max=%d dropped=%d elaborati=%d (%.1f msg/s)",
+                        stats['depth'], stats['max_depth'], stats['dropped'], processed, rate)
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Serializzazione diretta dei punti preparati in line protocol InfluxDB.
+
+Sostituisce Point.from_dict + serializzazione del client producendo le stesse
+righe: l'escaping di measurement, chiavi e valori dei tag è in cache (node id,
+gateway e nomi dei nodi si ripetono di continuo), i timestamp sono già interi in
+nanosecondi e il formato di ogni campo viene deciso una sola volta per
+(measurement, campo, tipo).
+"""
+import math
+from functools import lru_cache
+
+from utils import timestamp_to_ns
+
+_ESCAPE_MEASUREMENT = str.maketrans({',': r'\,', ' ': r'\ ', '\n': r'\n', '\t': r'\t', '\r': r'\r'})
+_ESCAPE_KEY = str.maketrans({',': r'\,', '=': r'\=', ' ': r'\ ', '\n': r'\n', '\t': r'\t', '\r': r'\r'})
+_ESCAPE_STRING = str.maketrans({'"': r'\"', '\\': r'\\'})
+
+
+@lru_cache(maxsize=1024)
+def escape_measurement(name):
+    return str(name).translate(_ESCAPE_MEASUREMENT)
+
+
+@lru_cache(maxsize=16384)
+def escape_key(key):
+    """Escaping di chiavi dei tag e dei campi."""
+    return str(key).translate(_ESCAPE_KEY)
+
+
+@lru_cache(maxsize=16384)
+def escape_tag_value(value):
+    escaped = str(value).translate(_ESCAPE_KEY)
+    # Un backslash finale farebbe l'escape dello spazio che separa i campi
+    if escaped.endswith('\\'):
+        escaped += ' '
+    return escaped
+
+
+def _format_float(value):
+    if not math.isfinite(value):
+        return None
+    text = str(value)
+    # Come il client: i numeri interi rappresentati come float perdono il ".0"
+    return text[:-2] if text.endswith('.0') else text
+
+
+def _format_int(value):
+    return f"{value}i"
+
+
+def _format_bool(value):
+    return "true" if value else "false"
+
+
+def _format_str(value):
+    return f'"{value.translate(_ESCAPE_STRING)}"'
+
+
+FIELD_FORMATTERS = {
+    float: _format_float,
+    int: _format_int,
+    bool: _format_bool,
+    str: _format_str,
+}
+
+
+def _resolve_formatter(value_type):
+    formatter = FIELD_FORMATTERS.get(value_type)
+    if formatter is not None:
+        return formatter
+    # Sottoclassi (es. numpy.float64, IntEnum)
+    for base in (bool, float, int, str):
+        if issubclass(value_type, base):
+            return FIELD_FORMATTERS[base]
+    return None
+
+
+class LineProtocolSerializer:
+    """
+    Converte i point_dict di prepare_influxdb_point in bytes line protocol.
+    """
+
+    def __init__(self):
+        # (measurement, campo, tipo) -> (prefisso "campo=", formatter)
+        self._fields = {}
+
+    def _field(self, measurement, key, value_type):
+        cache_key = (measurement, key, value_type)
+        field = self._fields.get(cache_key)
+        if field is None:
+            formatter = _resolve_formatter(value_type)
+            if formatter is None:
+                raise ValueError(f'Type: "{value_type}" of field: "{key}" is not supported.')
+            field = (f"{escape_key(key)}=", formatter)
+            self._fields[cache_key] = field
+        return field
+
+    def serialize_line(self, point_dict):
+        """
+        Restituisce la riga line protocol (str) del punto, o None se non ha campi validi.
+        """
+        measurement = point_dict['measurement']
+        fields = []
+        values = point_dict['fields']
+        for key in sorted(values):
+            value = values[key]
+            if value is None:
+                continue
+            prefix, formatter = self._field(measurement, key, type(value))
+            formatted = formatter(value)
+            if formatted is not None:
+                fields.append(prefix + formatted)
+        if not fields:
+            return None
+
+        parts = [escape_measurement(measurement)]
+        tags = point_dict.get('tags')
+        if tags:
+            for key in sorted(tags):
+                value = tags[key]
+                if value is None:
+                    continue
+                tag_key = escape_key(key)
+                tag_value = escape_tag_value(value)
+                if tag_key and tag_value:
+                    parts.append(f",{tag_key}={tag_value}")
+        parts.append(" ")
+        parts.append(",".join(fields))
+
+        timestamp = point_dict.get('time')
+        if timestamp is not None:
+            if not isinstance(timestamp, int):
+                timestamp = timestamp_to_ns(timestamp)
+            parts.append(f" {timestamp}")
+        return "".join(parts)
+
+    def serialize(self, point_dict):
+        """Restituisce il punto come bytes line protocol, o None se non ha campi validi."""
+        line = self.serialize_line(point_dict)
+        return line.encode('utf-8') if line is not None else None
+
+    def serialize_many(self, point_dicts):
+        """Serializza più punti in un unico blocco bytes separato da newline."""
+        lines = [line for line in map(self.serialize_line, point_dicts) if line is not None]
+        return "\n".join(lines).encode('utf-8')
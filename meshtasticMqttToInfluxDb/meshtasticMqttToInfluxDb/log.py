@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Logging strutturato a basso costo per il servizio di ingest.
+
+I moduli usano logging.getLogger(<nome modulo>) con messaggi in stile %
+(argomenti separati): il chiamante accoda soltanto il record in una coda
+limitata e un thread (QueueListener) formatta e scrive su stdout, così i
+worker non si bloccano sulle scritture della console. Se la coda è piena il
+record viene scartato e contato.
+
+Gli eventi ripetuti per ogni messaggio vengono limitati per modello di
+messaggio: al massimo LOG_RATE_LIMIT record per LOG_RATE_INTERVAL_S secondi,
+il numero dei record soppressi viene riportato nel primo record successivo.
+"""
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+from utils import print_json
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s [%(name)s] %(message)s"
+
+# Attributi standard di LogRecord: gli altri (extra=...) finiscono nell'output JSON
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Un oggetto JSON per riga: ts, level, logger, msg, eventuali campi extra ed eccezione."""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lascia passare al massimo `limit` record per modello di messaggio (logger, livello,
+    msg non formattato) in ogni finestra di `interval` secondi.
+    """
+
+    def __init__(self, limit: int = 20, interval: float = 10.0, clock=time.monotonic):
+        super().__init__()
+        self.limit = limit
+        self.interval = interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._windows = {}  # chiave -> [inizio finestra, record emessi, record soppressi]
+        self.suppressed = 0
+
+    def filter(self, record):
+        if self.limit <= 0:
+            return True
+        key = (record.name, record.levelno, record.msg)
+        now = self._clock()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window is not None else 0
+                self._windows[key] = [now, 1, 0]
+                if len(self._windows) > 10000:
+                    # Modelli generati dinamicamente: si riparte invece di crescere senza limite
+                    self._windows = {key: self._windows[key]}
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+            if window[1] < self.limit:
+                window[1] += 1
+                return True
+            window[2] += 1
+            self.suppressed += 1
+            return False
+
+
+class _SuppressedFormatter(logging.Formatter):
+    """Formato testo che segnala i record soppressi dal rate limit."""
+
+    def format(self, record):
+        text = super().format(record)
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            text += f" (+{suppressed} messaggi simili soppressi)"
+        return text
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler che non blocca mai il chiamante: con la coda piena il record viene scartato.
+
+    La formattazione del messaggio è lasciata al thread del listener; nel thread chiamante
+    viene solo catturato il traceback, che non sarebbe più disponibile dopo.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_state = {'listener': None, 'handler': None, 'rate_limit': None}
+
+
+def parse_levels(value: str) -> dict:
+    """
+    Interpreta LOG_LEVELS: "mqtt=DEBUG,influxdb=WARNING".
+
+    Returns:
+        dict: {nome logger: livello}
+    """
+    levels = {}
+    for item in value.replace(';', ',').split(','):
+        if not item.strip():
+            continue
+        name, sep, level = item.partition('=')
+        if not sep or not name.strip():
+            raise ValueError(f"LOG_LEVELS: voce non valida '{item.strip()}' (atteso logger=LIVELLO)")
+        level = level.strip().upper()
+        if not isinstance(logging.getLevelName(level), int):
+            raise ValueError(f"LOG_LEVELS: livello sconosciuto '{level}'")
+        levels[name.strip()] = level
+    return levels
+
+
+def setup_logging(level: str = "INFO", levels: str = "", fmt: str = "text", rate_limit: int = 20,
+                  rate_interval: float = 10.0, queue_size: int = 10000, stream=None):
+    """
+    Configura il logger radice con una coda limitata e un thread di scrittura.
+    Chiamata più volte sostituisce la configurazione precedente.
+
+    Args:
+        level: Livello di default
+        levels: Livelli per modulo, es. "mqtt=DEBUG,influxdb=WARNING"
+        fmt: "text" o "json"
+        rate_limit: Record per modello di messaggio in ogni finestra (0 = nessun limite)
+        rate_interval: Durata della finestra del rate limit in secondi
+        queue_size: Record in attesa di scrittura prima di scartare
+        stream: Destinazione (default sys.stdout)
+    """
+    shutdown_logging()
+    root = logging.getLogger()
+    root.setLevel(level.upper())
+    for name, module_level in parse_levels(levels).items():
+        logging.getLogger(name).setLevel(module_level)
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter() if fmt == "json" else _SuppressedFormatter(TEXT_FORMAT))
+    log_queue = queue.Queue(maxsize=queue_size)
+    handler = NonBlockingQueueHandler(log_queue)
+    rate_limit_filter = RateLimitFilter(rate_limit, rate_interval)
+    handler.addFilter(rate_limit_filter)
+    root.handlers = [handler]
+
+    listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    listener.start()
+    _state.update(listener=listener, handler=handler, rate_limit=rate_limit_filter)
+
+
+def setup_logging_from_config(config):
+    """setup_logging() con le variabili LOG_* della configurazione."""
+    setup_logging(
+        level=config['LOG_LEVEL'],
+        levels=config['LOG_LEVELS'],
+        fmt=config['LOG_FORMAT'],
+        rate_limit=config['LOG_RATE_LIMIT'],
+        rate_interval=config['LOG_RATE_INTERVAL_S'],
+        queue_size=config['LOG_QUEUE_SIZE'],
+    )
+
+
+def shutdown_logging():
+    """Scrive i record ancora in coda e ferma il thread di scrittura."""
+    listener = _state['listener']
+    if listener is not None:
+        listener.stop()
+        logging.getLogger().removeHandler(_state['handler'])
+        _state.update(listener=None, handler=None, rate_limit=None)
+
+
+def get_stats() -> dict:
+    """Record scartati per coda piena e soppressi dal rate limit."""
+    handler = _state['handler']
+    rate_limit = _state['rate_limit']
+    return {
+        'dropped': handler.dropped if handler is not None else 0,
+        'suppressed': rate_limit.suppressed if rate_limit is not None else 0,
+        'queued': handler.queue.qsize() if handler is not None else 0,
+    }
+
+
+class LazyJson:
+    """Serializza `data` in JSON solo se il record viene effettivamente scritto."""
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        self.data = data
+
+    def __str__(self):
+        return print_json(self.data)
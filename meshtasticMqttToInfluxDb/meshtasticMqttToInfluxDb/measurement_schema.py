@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Schema dichiarativo delle measurement InfluxDB.
+
+Un file JSON associa a ogni tipo di messaggio Meshtastic (`type` del messaggio
+JSON dei gateway) la measurement, i tag e i campi da scrivere, con tipo,
+rinomina e scala. All'avvio lo schema viene compilato in una funzione di
+conversione per tipo: la scelta è una lookup nel dizionario dei convertitori
+e vengono copiati solo i campi dichiarati.
+
+Formato di una voce:
+
+    "position": {
+        "measurement": "position",              # default: il tipo del messaggio
+        "tags": {"source": "location_source"},  # tag -> campo del payload (sempre stringa)
+        "fields": {
+            "altitude": "float",                 # campo -> tipo (float, int, bool, string)
+            "latitude": {"source": "latitude_i", "type": "float", "scale": 1e-7}
+        },
+        "extra_fields": "float",                 # campi numerici non dichiarati (default: scartati)
+        "metric_list": {"source": "metrics", "name": "name", "value": "value", "type": "float"},
+        "payload_types": {"custom_metrics": {...}}  # voce scelta in base a payload['type']
+    }
+
+Con `payload_types` la voce vale solo per i payload il cui campo `type` è una
+delle chiavi: gli altri messaggi di quel tipo non producono punti.
+"""
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "measurement_schema.json")
+
+ENTRY_KEYS = frozenset(('description', 'measurement', 'tags', 'fields', 'extra_fields', 'metric_list',
+                        'payload_types'))
+
+
+def _to_bool(value):
+    if isinstance(value, str):
+        if value.lower() in ('1', 'true', 'yes'):
+            return True
+        if value.lower() in ('0', 'false', 'no'):
+            return False
+        raise ValueError(f"valore booleano non valido: {value!r}")
+    return bool(value)
+
+
+def _to_int(value):
+    # I protobuf convertiti con MessageToDict rappresentano gli interi a 64 bit come stringhe
+    return int(value) if not isinstance(value, str) else int(float(value))
+
+
+FIELD_TYPES = {
+    'float': float,
+    'int': _to_int,
+    'bool': _to_bool,
+    'string': str,
+}
+
+
+def _field_spec(name, spec, where):
+    """Normalizza la dichiarazione di un campo in (nome, sorgente, conversione)."""
+    if isinstance(spec, str):
+        spec = {'type': spec}
+    if not isinstance(spec, dict):
+        raise ValueError(f"{where}.{name}: atteso un tipo o un oggetto")
+    unknown = set(spec) - {'source', 'type', 'scale'}
+    if unknown:
+        raise ValueError(f"{where}.{name}: chiavi sconosciute {', '.join(sorted(unknown))}")
+    type_name = spec.get('type', 'float')
+    if type_name not in FIELD_TYPES:
+        raise ValueError(f"{where}.{name}: tipo '{type_name}' non supportato ({', '.join(FIELD_TYPES)})")
+    cast = FIELD_TYPES[type_name]
+    scale = spec.get('scale')
+    if scale is not None:
+        if type_name not in ('float', 'int') or not isinstance(scale, (int, float)):
+            raise ValueError(f"{where}.{name}: scale richiede un numero e un campo float o int")
+        if type_name == 'int':
+            cast = lambda value, scale=scale: int(round(float(value) * scale))
+        else:
+            cast = lambda value, scale=scale: float(value) * scale
+    return name, spec.get('source', name), cast
+
+
+def _compile_entry(message_type, entry, where):
+    """Compila una voce dello schema in convert(payload) -> (measurement, tags, fields) | None."""
+    if not isinstance(entry, dict):
+        raise ValueError(f"{where}: atteso un oggetto")
+    unknown = set(entry) - ENTRY_KEYS
+    if unknown:
+        raise ValueError(f"{where}: chiavi sconosciute {', '.join(sorted(unknown))}")
+
+    if 'payload_types' in entry:
+        if set(entry) - {'description', 'payload_types'}:
+            raise ValueError(f"{where}: payload_types non si combina con altre chiavi")
+        by_payload_type = {
+            payload_type: _compile_entry(payload_type, sub_entry, f"{where}.payload_types.{payload_type}")
+            for payload_type, sub_entry in entry['payload_types'].items()
+        }
+
+        def convert(payload):
+            converter = by_payload_type.get(payload.get('type'))
+            return converter(payload) if converter is not None else None
+        return convert
+
+    measurement = entry.get('measurement', message_type)
+    tags = tuple((name, source if isinstance(source, str) else _field_spec(name, source, f"{where}.tags")[1])
+                 for name, source in entry.get('tags', {}).items())
+    fields = tuple(_field_spec(name, spec, f"{where}.fields") for name, spec in entry.get('fields', {}).items())
+
+    extra_fields = entry.get('extra_fields')
+    if extra_fields not in (None, 'float'):
+        raise ValueError(f"{where}.extra_fields: unico valore ammesso 'float'")
+    declared = frozenset(source for _, source, _ in fields)
+
+    metric_list = entry.get('metric_list')
+    if metric_list is not None:
+        list_source = metric_list.get('source', 'metrics')
+        metric_name = metric_list.get('name', 'name')
+        metric_value = metric_list.get('value', 'value')
+        metric_cast = _field_spec('metric_list', {'type': metric_list.get('type', 'float')}, where)[2]
+
+    def convert(payload):
+        point_tags = {}
+        for name, source in tags:
+            value = payload.get(source)
+            if value is not None and value != '':
+                point_tags[name] = str(value)
+        point_fields = {}
+        invalid = 0
+        for name, source, cast in fields:
+            value = payload.get(source)
+            if value is None:
+                continue
+            try:
+                point_fields[name] = cast(value)
+            except (TypeError, ValueError):
+                invalid += 1
+        if extra_fields is not None:
+            for key, value in payload.items():
+                if key not in declared and isinstance(value, (int, float)):
+                    point_fields[key] = float(value)
+        if metric_list is not None:
+            for metric in payload.get(list_source) or ():
+                try:
+                    point_fields[metric[metric_name]] = metric_cast(metric[metric_value])
+                except (KeyError, TypeError, ValueError):
+                    invalid += 1
+        return measurement, point_tags, point_fields, invalid
+    return convert
+
+
+class MeasurementSchema:
+    """
+    Convertitori compilati dallo schema, uno per tipo di messaggio.
+    """
+
+    def __init__(self, schema: dict):
+        if not isinstance(schema, dict):
+            raise ValueError("Lo schema delle measurement deve essere un oggetto JSON")
+        self.converters = {
+            message_type: _compile_entry(message_type, entry, message_type)
+            for message_type, entry in schema.items()
+        }
+        self.stats = {'converted': 0, 'skipped': 0, 'invalid_values': 0}
+
+    @classmethod
+    def from_file(cls, path: str = ""):
+        """Carica lo schema da `path` ("" = schema predefinito incluso nel pacchetto)."""
+        with open(path or DEFAULT_SCHEMA_PATH, encoding='utf-8') as f:
+            schema = json.load(f)
+        return cls(schema)
+
+    @property
+    def message_types(self):
+        return tuple(self.converters)
+
+    def convert(self, message_type, payload):
+        """
+        Returns:
+            tuple: (measurement, tag, campi) o None se il tipo non è nello schema
+        """
+        converter = self.converters.get(message_type)
+        result = converter(payload) if converter is not None and isinstance(payload, dict) else None
+        if result is None:
+            self.stats['skipped'] += 1
+            return None
+        measurement, tags, fields, invalid = result
+        if invalid:
+            self.stats['invalid_values'] += invalid
+            logger.debug("⚠️  %d valori non convertibili in un messaggio %s", invalid, message_type)
+        self.stats['converted'] += 1
+        return measurement, tags, fields
+
+    def get_stats(self) -> dict:
+        return dict(self.stats)
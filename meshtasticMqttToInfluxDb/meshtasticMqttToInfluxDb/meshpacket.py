@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Conversione dei ServiceEnvelope protobuf (topic /e/ e /c/) nello stesso formato
+dei messaggi JSON pubblicati dai gateway, così da usare lo stesso percorso di
+preparazione dei punti InfluxDB.
+
+I payload sono letti direttamente dai messaggi protobuf (message_to_payload),
+senza MessageToDict: nessuna copia base64 dei byte annidati e nessuna visita
+ricorsiva di un dizionario intermedio.
+"""
+import base64
+import logging
+import math
+import struct
+import time
+
+from utils import get_node_id, json_loads
+
+logger = logging.getLogger(__name__)
+
+# Tipo del messaggio JSON per ogni portnum, come nel serializer JSON del firmware
+PORTNUM_TYPES = {
+    'TEXT_MESSAGE_APP': 'text',
+    'TELEMETRY_APP': 'telemetry',
+    'NODEINFO_APP': 'nodeinfo',
+    'POSITION_APP': 'position',
+}
+
+
+# Conversione del valore di ogni campo protobuf, decisa una volta per descrittore
+_FIELD_CONVERTERS = {}
+_FLOAT32 = struct.Struct('<f')
+# I valori dei sensori si ripetono: la rappresentazione più corta di ogni float32 viene calcolata una volta
+_SHORT_FLOATS = {}
+SHORT_FLOAT_CACHE_SIZE = 65536
+
+
+def _shortest_float(value):
+    if not math.isfinite(value):
+        return value
+    for precision in range(6, 10):
+        rounded = float(f'{value:.{precision}g}')
+        if _FLOAT32.unpack(_FLOAT32.pack(rounded))[0] == value:
+            return rounded
+    return value
+
+
+def _short_float(value):
+    """Come MessageToDict: il decimale più corto che rappresenta il float32 (4.221, non 4.2210001945495605)."""
+    rounded = _SHORT_FLOATS.get(value)
+    if rounded is None:
+        if len(_SHORT_FLOATS) >= SHORT_FLOAT_CACHE_SIZE:
+            _SHORT_FLOATS.clear()
+        rounded = _SHORT_FLOATS[value] = _shortest_float(value)
+    return rounded
+
+
+def _bytes_to_base64(value):
+    return base64.b64encode(value).decode('ascii')
+
+
+def _field_converter(field):
+    if field.cpp_type == field.CPPTYPE_MESSAGE:
+        convert = message_to_payload
+    elif field.cpp_type == field.CPPTYPE_FLOAT:
+        convert = _short_float
+    elif field.type == field.TYPE_BYTES:
+        convert = _bytes_to_base64
+    else:
+        # Interi (anche a 64 bit, che MessageToDict renderebbe stringhe), enum come interi, double, bool e stringhe
+        convert = None
+    # protobuf < 5 non ha is_repeated
+    repeated = field.is_repeated if hasattr(field, 'is_repeated') else field.label == field.LABEL_REPEATED
+    if repeated:
+        convert = (lambda values, item=convert: [item(value) for value in values]) if convert else list
+    return field.name, convert
+
+
+def message_to_payload(message):
+    """
+    Campi valorizzati di un messaggio protobuf come dizionario, letti direttamente con ListFields
+    invece che con MessageToDict: stessi nomi (quelli del .proto) e stessi valori del payload JSON.
+    """
+    payload = {}
+    for field, value in message.ListFields():
+        converter = _FIELD_CONVERTERS.get(field)
+        if converter is None:
+            converter = _FIELD_CONVERTERS[field] = _field_converter(field)
+        name, convert = converter
+        payload[name] = convert(value) if convert is not None else value
+    return payload
+
+
+def _decode_text(payload):
+    text = payload.decode('utf-8', errors='replace')
+    # Come il firmware: un testo che contiene un oggetto JSON diventa il payload (es. custom_metrics)
+    if text.startswith('{'):
+        try:
+            parsed = json_loads(text)
+            if isinstance(parsed, dict):
+                return parsed
+        except ValueError:
+            pass
+    return {'text': text}
+
+
+def _decode_telemetry(payload):
+    from meshtastic.protobuf import telemetry_pb2
+    telemetry = telemetry_pb2.Telemetry()
+    telemetry.ParseFromString(payload)
+    variant = telemetry.WhichOneof('variant')
+    if variant is None:
+        return {}
+    return message_to_payload(getattr(telemetry, variant))
+
+
+def _decode_nodeinfo(payload):
+    from meshtastic.protobuf import mesh_pb2
+    user = mesh_pb2.User()
+    user.ParseFromString(payload)
+    return {
+        'id': user.id,
+        'longname': user.long_name,
+        'shortname': user.short_name,
+        'hardware': user.hw_model,
+        'role': user.role,
+    }
+
+
+def _decode_position(payload):
+    from meshtastic.protobuf import mesh_pb2
+    position = mesh_pb2.Position()
+    position.ParseFromString(payload)
+    return message_to_payload(position)
+
+
+PAYLOAD_DECODERS = {
+    'text': _decode_text,
+    'telemetry': _decode_telemetry,
+    'nodeinfo': _decode_nodeinfo,
+    'position': _decode_position,
+}
+
+
+def parse_data(payload):
+    """
+    Decodifica un messaggio Data in chiaro.
+
+    Returns:
+        Data o None se i byte non sono un Data valido (es. chiave sbagliata)
+    """
+    from google.protobuf.message import DecodeError
+    from meshtastic.protobuf import mesh_pb2
+    data = mesh_pb2.Data()
+    try:
+        data.ParseFromString(payload)
+    except DecodeError:
+        return None
+    if data.portnum == 0:
+        return None
+    return data
+
+
+def decrypt_packet_data(packet, keyring):
+    """
+    Restituisce il Data di un MeshPacket, decifrandolo se necessario.
+
+    Returns:
+        Data o None se il pacchetto non è decifrabile con le chiavi configurate
+    """
+    if packet.HasField('decoded'):
+        return packet.decoded
+    if not packet.encrypted or keyring is None:
+        return None
+    for channel_name, plaintext in keyring.decrypt_packet(packet.id, getattr(packet, 'from'),
+                                                          packet.channel, packet.encrypted):
+        data = parse_data(plaintext)
+        if data is not None:
+            return data
+    return None
+
+
+def envelope_to_json_message(payload_bytes, keyring=None):
+    """
+    Converte un ServiceEnvelope nel formato dei messaggi JSON dei gateway.
+
+    Args:
+        payload_bytes: ServiceEnvelope serializzato
+        keyring: ChannelKeyring per decifrare i pacchetti cifrati
+
+    Returns:
+        dict con type/from/to/sender/timestamp/payload, o None se il pacchetto
+        non è decifrabile o il portnum non è gestito
+    """
+    from google.protobuf.message import DecodeError
+    from meshtastic.protobuf import mqtt_pb2, portnums_pb2
+
+    envelope = mqtt_pb2.ServiceEnvelope()
+    try:
+        envelope.ParseFromString(payload_bytes)
+    except DecodeError:
+        return None
+    if not envelope.HasField('packet'):
+        return None
+    packet = envelope.packet
+
+    data = decrypt_packet_data(packet, keyring)
+    if data is None:
+        return None
+
+    try:
+        portnum = portnums_pb2.PortNum.Name(data.portnum)
+    except ValueError:
+        return None
+    message_type = PORTNUM_TYPES.get(portnum)
+    if message_type is None:
+        return None
+
+    try:
+        payload = PAYLOAD_DECODERS[message_type](data.payload)
+    except Exception as e:
+        logger.error("❌ Errore nella decodifica del payload %s: %s", portnum, e)
+        return None
+
+    hops_away = packet.hop_start - packet.hop_limit if packet.hop_start else None
+    message = {
+        'channel': packet.channel,
+        'from': getattr(packet, 'from'),
+        'to': packet.to,
+        'id': packet.id,
+        'sender': envelope.gateway_id or get_node_id(getattr(packet, 'from')),
+        'timestamp': packet.rx_time or int(time.time()),
+        'type': message_type,
+        'payload': payload,
+        'rssi': packet.rx_rssi,
+        'snr': packet.rx_snr,
+        'hop_start': packet.hop_start,
+    }
+    if hops_away is not None:
+        message['hops_away'] = hops_away
+    return message
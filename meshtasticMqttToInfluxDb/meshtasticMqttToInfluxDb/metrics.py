@@ -0,0 +1,443 @@
+#!/usr/bin/env python3
+"""
+Metriche della pipeline di ingest esposte in formato OpenMetrics (Prometheus).
+
+Registro minimale senza dipendenze esterne: contatori e istogrammi aggiornati
+dal codice di elaborazione, gauge calcolati al momento dello scrape tramite
+funzioni (profondità della coda, stato MQTT, memoria del processo) e le
+statistiche già raccolte dai vari componenti (get_stats) esportate come metriche.
+L'endpoint HTTP viene avviato solo se METRICS_PORT è impostata.
+"""
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from time import perf_counter
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+# Bucket (secondi) pensati per stadi che durano da decine di µs a qualche centinaio di ms
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape_label(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label(value)}"' for name, value in pairs) + "}"
+
+
+class _Metric:
+    type_name = "unknown"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name}: attese le label {self.labelnames}, ricevute {labels}")
+        return tuple(str(value) for value in labels)
+
+    def header(self):
+        return [f"# TYPE {self.name} {self.type_name}", f"# HELP {self.name} {self.documentation}"]
+
+
+class Counter(_Metric):
+    """Contatore monotono, una serie per combinazione di label."""
+    type_name = "counter"
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, *labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def restore(self, values):
+        with self._lock:
+            self._values = dict(values)
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+        lines = self.header()
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}_total{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Valore istantaneo, impostato con set() o letto da una funzione al momento dello scrape."""
+    type_name = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames)
+        self._function = function
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, function):
+        """function() restituisce un numero, o un dict {tuple_label: valore} se il gauge ha label."""
+        self._function = function
+
+    def render(self):
+        if self._function is not None:
+            result = self._function()
+            values = result if isinstance(result, dict) else {(): result}
+        else:
+            with self._lock:
+                values = dict(self._values)
+        lines = self.header()
+        for key, value in sorted(values.items()):
+            if value is None:
+                continue
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class _FunctionCounter(Counter):
+    """Contatore cumulativo letto da una funzione al momento dello scrape (es. tempo CPU)."""
+
+    def __init__(self, name, documentation, function):
+        super().__init__(name, documentation)
+        self._function = function
+
+    def render(self):
+        return self.header() + [f"{self.name}_total {_format_value(self._function())}"]
+
+    def snapshot(self):
+        # Valore letto dal processo corrente: non va sommato tra processi
+        return None
+
+
+class _Timer:
+    __slots__ = ("_histogram", "_key", "_start")
+
+    def __init__(self, histogram, key):
+        self._histogram = histogram
+        self._key = key
+
+    def __enter__(self):
+        self._start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._histogram._observe_key(perf_counter() - self._start, self._key)
+
+
+class _NullTimer:
+    """Timer degli istogrammi disabilitati: nessuna lettura dell'orologio e nessun lock."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+NULL_TIMER = _NullTimer()
+
+
+class Histogram(_Metric):
+    """Istogramma cumulativo a bucket fissi."""
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Con enabled=False time() restituisce NULL_TIMER (es. STAGE_TIMERS=0)
+        self.enabled = True
+        self._timer_keys = {}
+
+    def observe(self, value, *labels):
+        self._observe_key(value, self._key(labels))
+
+    def _observe_key(self, value, key):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                # [conteggi per bucket (+ overflow), somma, numero di osservazioni]
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, *labels):
+        """Context manager che osserva la durata del blocco (orologio monotono)."""
+        if not self.enabled:
+            return NULL_TIMER
+        key = self._timer_keys.get(labels)
+        if key is None:
+            key = self._timer_keys[labels] = self._key(labels)
+        return _Timer(self, key)
+
+    def snapshot(self):
+        with self._lock:
+            return {key: [list(series[0]), series[1], series[2]] for key, series in self._values.items()}
+
+    def restore(self, values):
+        with self._lock:
+            self._values = {key: [list(series[0]), series[1], series[2]] for key, series in values.items()}
+
+    def render(self):
+        with self._lock:
+            values = {key: (list(series[0]), series[1], series[2]) for key, series in self._values.items()}
+        lines = self.header()
+        for key, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(float(bound))))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class _StatsCollector:
+    """Esporta le statistiche numeriche di un componente (get_stats) come metriche."""
+
+    def __init__(self, prefix, get_stats, gauges=(), documentation=""):
+        self.prefix = prefix
+        self.get_stats = get_stats
+        self.gauges = set(gauges)
+        self.documentation = documentation
+
+    def render(self):
+        try:
+            stats = self.get_stats()
+        except Exception as e:
+            logger.error("❌ Errore nella lettura delle statistiche %s: %s", self.prefix, e)
+            return []
+        lines = []
+        for key, value in stats.items():
+            if isinstance(value, list):
+                # Liste di dict (es. contatori per worker): una serie per elemento
+                samples = [(i, item) for i, item in enumerate(value) if isinstance(item, dict)]
+                for sub_key in sorted({k for _, item in samples for k in item}):
+                    name = f"{self.prefix}_{key}_{sub_key}"
+                    lines.extend(self._header(name, f"{key}_{sub_key}"))
+                    suffix = "" if f"{key}_{sub_key}" in self.gauges else "_total"
+                    for index, item in samples:
+                        if isinstance(item.get(sub_key), (int, float)):
+                            lines.append(f'{name}{suffix}{{index="{index}"}} {_format_value(item[sub_key])}')
+                continue
+            if isinstance(value, bool):
+                value = int(value)
+            if not isinstance(value, (int, float)):
+                continue
+            name = f"{self.prefix}_{key}"
+            lines.extend(self._header(name, key))
+            suffix = "" if key in self.gauges else "_total"
+            lines.append(f"{name}{suffix} {_format_value(value)}")
+        return lines
+
+    def _header(self, name, key):
+        type_name = "gauge" if key in self.gauges else "counter"
+        return [f"# TYPE {name} {type_name}", f"# HELP {name} {self.documentation} ({key})"]
+
+
+class MetricsRegistry:
+    """Insieme delle metriche esposte dall'endpoint."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._collectors = []
+        self._render_hooks = []
+
+    def register(self, metric):
+        with self._lock:
+            self._collectors.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), function=None):
+        return self.register(Gauge(name, documentation, labelnames, function))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def register_stats(self, prefix, get_stats, gauges=(), documentation=""):
+        """
+        Esporta il dict restituito da get_stats: le chiavi in `gauges` come gauge,
+        le altre come contatori cumulativi.
+        """
+        return self.register(_StatsCollector(prefix, get_stats, gauges, documentation))
+
+    def on_render(self, function):
+        """Registra una funzione chiamata prima di ogni render (es. per caricare valori da altri processi)."""
+        with self._lock:
+            self._render_hooks.append(function)
+
+    def snapshot(self) -> dict:
+        """
+        Valori di contatori e istogrammi, serializzabili con pickle, da inviare a un altro
+        processo e sommare con merge_snapshots().
+        """
+        with self._lock:
+            collectors = list(self._collectors)
+        result = {}
+        for collector in collectors:
+            values = collector.snapshot() if isinstance(collector, (Counter, Histogram)) else None
+            if values is not None:
+                result[collector.name] = values
+        return result
+
+    def load_snapshot(self, snapshot: dict):
+        """Sostituisce i valori delle metriche presenti nello snapshot."""
+        with self._lock:
+            collectors = list(self._collectors)
+        for collector in collectors:
+            if isinstance(collector, (Counter, Histogram)) and collector.name in snapshot:
+                collector.restore(snapshot[collector.name])
+
+    def render(self) -> str:
+        """Testo OpenMetrics di tutte le metriche registrate."""
+        with self._lock:
+            hooks = list(self._render_hooks)
+            collectors = list(self._collectors)
+        for hook in hooks:
+            hook()
+        lines = []
+        for collector in collectors:
+            lines.extend(collector.render())
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+def merge_snapshots(snapshots) -> dict:
+    """
+    Somma gli snapshot di più processi: i contatori serie per serie, gli istogrammi
+    bucket per bucket (gli stessi bucket in tutti i processi).
+    """
+    merged = {}
+    for snapshot in snapshots:
+        for name, values in snapshot.items():
+            target = merged.setdefault(name, {})
+            for key, value in values.items():
+                if isinstance(value, list):
+                    current = target.get(key)
+                    if current is None:
+                        target[key] = [list(value[0]), value[1], value[2]]
+                    else:
+                        current[0] = [a + b for a, b in zip(current[0], value[0])]
+                        current[1] += value[1]
+                        current[2] += value[2]
+                else:
+                    target[key] = target.get(key, 0) + value
+    return merged
+
+
+def read_rss_bytes():
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        # ru_maxrss è il picco (KiB su Linux): meglio di niente fuori da Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def register_process_metrics(registry):
+    """Memoria, CPU e istante di avvio del processo."""
+    start_time = time.time()
+    registry.gauge("process_resident_memory_bytes", "Memoria residente del processo in byte",
+                   function=read_rss_bytes)
+    registry.register(_FunctionCounter("process_cpu_seconds", "Tempo CPU utente+sistema del processo in secondi",
+                                       lambda: sum(os.times()[:2])))
+    registry.gauge("process_start_time_seconds", "Istante di avvio del processo (Unix)",
+                   function=lambda: start_time)
+    registry.gauge("process_threads", "Thread attivi nel processo", function=threading.active_count)
+
+
+def start_http_server(port, host="0.0.0.0", registry=None):
+    """
+    Avvia l'endpoint /metrics in un thread daemon.
+
+    Returns:
+        ThreadingHTTPServer: il server avviato (server.shutdown() per fermarlo)
+    """
+    # Import ritardato: http.server serve solo se l'endpoint è abilitato
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    registry = registry or REGISTRY
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Gli scrape periodici non devono riempire i log
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True)
+    thread.start()
+    return server
+
+
+REGISTRY = MetricsRegistry()
+
+# Metriche della pipeline, aggiornate da __main__ e dai client
+MESSAGES = REGISTRY.counter("meshtastic_messages", "Messaggi MQTT elaborati per classe di payload",
+                            ["payload_type"])
+IMPORTED = REGISTRY.counter("meshtastic_imported_messages", "Messaggi Meshtastic ricevuti per tipo",
+                            ["message_type"])
+DECODE_FAILURES = REGISTRY.counter("meshtastic_decode_failures",
+                                   "Messaggi non decodificabili o di tipo non gestito", ["payload_type"])
+WRITE_ERRORS = REGISTRY.counter("meshtastic_write_errors", "Errori nell'accodamento dei punti InfluxDB")
+STAGE_SECONDS = REGISTRY.histogram("meshtastic_stage_seconds", "Durata degli stadi di elaborazione",
+                                   ["stage"])
+# Costo di ogni filtro di MQTT_SUBSCRIPTIONS (vedi topic_router.py)
+ROUTE_MESSAGES = REGISTRY.counter("meshtastic_route_messages", "Messaggi ricevuti per filtro MQTT", ["route"])
+ROUTE_BYTES = REGISTRY.counter("meshtastic_route_bytes", "Byte di payload ricevuti per filtro MQTT", ["route"])
+ROUTE_SECONDS = REGISTRY.counter("meshtastic_route_seconds", "Tempo di elaborazione per filtro MQTT", ["route"])
+# Punti scartati dal load shedding per nodo (nodi oltre il limite di serie: "other"), vedi shedding.py
+SHED_NODE_POINTS = REGISTRY.counter("meshtastic_shed_node_points", "Punti scartati per sovraccarico o limite del nodo",
+                                    ["node_id", "class"])
+MQTT_CONNECTS = REGISTRY.counter("meshtastic_mqtt_connects", "Connessioni riuscite al broker MQTT")
+MQTT_DISCONNECTS = REGISTRY.counter("meshtastic_mqtt_disconnects", "Disconnessioni dal broker MQTT",
+                                    ["expected"])
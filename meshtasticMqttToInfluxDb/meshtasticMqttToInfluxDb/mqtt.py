@@ -4,12 +4,16 @@ Modulo per gestire le connessioni e operazioni MQTT.
 Fornisce una classe pulita e riutilizzabile per la gestione di MQTT.
 """
 
-import paho.mqtt.client as mqtt
 import json
+import logging
 import time
 from datetime import datetime, timezone
 from typing import Callable, Optional
 from config import config
+from metrics import MQTT_CONNECTS, MQTT_DISCONNECTS, STAGE_SECONDS
+from topic_router import parse_subscriptions
+
+logger = logging.getLogger(__name__)
 
 
 class MqttClient:
@@ -34,11 +38,18 @@ class MqttClient:
         self.username = config['MQTT_USERNAME']
         self.password = config['MQTT_PASSWORD']
         self.root_topic = config['MQTT_ROOT_TOPIC']
+        # Con un gruppo condiviso il broker distribuisce i messaggi tra i client del gruppo
+        self.shared_group = config['MQTT_SHARED_GROUP']
+        # Filtri sottoscritti (MQTT_SUBSCRIPTIONS), gli stessi instradati dal TopicRouter
+        self.topic_filters = [topic_filter for topic_filter, _ in
+                              parse_subscriptions(config['MQTT_SUBSCRIPTIONS'], self.root_topic)]
         
         self._setup_client()
     
     def _setup_client(self):
         """Configura il client MQTT con callback e credenziali."""
+        # Import ritardato: paho non serve per --help o per i test
+        import paho.mqtt.client as mqtt
         self.client = mqtt.Client()
         
         # Imposta credenziali
@@ -49,30 +60,43 @@ class MqttClient:
         self.client.on_disconnect = self._on_disconnect
         self.client.on_message = self._on_message
         self.client.on_subscribe = self._on_subscribe
-        self.client.on_log = self._on_log
+        # I log di paho arrivano per ogni pacchetto: la callback è registrata solo in DEBUG
+        if logger.isEnabledFor(logging.DEBUG):
+            self.client.on_log = self._on_log
     
     def _on_connect(self, client, userdata, flags, rc):
         """Callback chiamata quando il client si connette al broker MQTT."""
         if rc == 0:
             self.is_connected = True
-            print(f"✅ Connesso al broker MQTT {self.host}:{self.port}")
+            MQTT_CONNECTS.inc()
+            logger.info("✅ Connesso al broker MQTT %s:%s", self.host, self.port)
             
-            # Sottoscriviti a tutti i topic sotto il root
-            topic = f"{self.root_topic}/#"
-            client.subscribe(topic)
-            print(f"📡 Sottoscritto al topic: {topic}")
+            # Sottoscriviti ai filtri configurati con una sola richiesta
+            topics = self.subscription_topics()
+            client.subscribe([(topic, 0) for topic in topics])
+            logger.info("📡 Sottoscritto ai topic: %s", ', '.join(topics))
         else:
             self.is_connected = False
-            print(f"❌ Errore di connessione MQTT. Codice: {rc}")
+            logger.error("❌ Errore di connessione MQTT. Codice: %s", rc)
             self._print_connection_error(rc)
     
+    def subscription_topics(self) -> list:
+        """
+        Topic sottoscritti: i filtri di MQTT_SUBSCRIPTIONS (default {root}/#), con il
+        prefisso $share/{gruppo}/ se è impostato MQTT_SHARED_GROUP.
+        """
+        if self.shared_group:
+            return [f"$share/{self.shared_group}/{topic}" for topic in self.topic_filters]
+        return list(self.topic_filters)
+
     def _on_disconnect(self, client, userdata, rc):
         """Callback chiamata quando il client si disconnette dal broker."""
         self.is_connected = False
-        print(f"🔌 Disconnesso dal broker MQTT. Codice: {rc}")
+        MQTT_DISCONNECTS.inc("true" if rc == 0 else "false")
+        logger.info("🔌 Disconnesso dal broker MQTT. Codice: %s", rc)
         
         if rc != 0:
-            print("⚠️  Disconnessione inattesa! Tentativo di riconnessione...")
+            logger.warning("⚠️  Disconnessione inattesa! Tentativo di riconnessione...")
     
     def _on_message(self, client, userdata, msg):
         # print(f"📨 msg: {msg}")
@@ -85,24 +109,23 @@ class MqttClient:
             # Chiama il callback personalizzato se fornito
             if self.on_message_callback:
                 try:
-                    self.on_message_callback(msg)
+                    with STAGE_SECONDS.time('receive'):
+                        self.on_message_callback(msg)
                 except Exception as e:
-                    print(f"❌ Errore nel callback personalizzato: {e}")
+                    logger.error("❌ Errore nel callback personalizzato: %s", e)
             
         except UnicodeDecodeError:
-            print(f"⚠️  Impossibile decodificare il messaggio su {msg.topic}")
+            logger.warning("⚠️  Impossibile decodificare il messaggio su %s", msg.topic)
         except Exception as e:
-            print(f"❌ Errore nella gestione del messaggio: {e}")
+            logger.error("❌ Errore nella gestione del messaggio: %s", e)
     
     def _on_subscribe(self, client, userdata, mid, granted_qos):
         """Callback chiamata quando la sottoscrizione è confermata."""
-        print(f"✅ Sottoscrizione confermata. QoS: {granted_qos}")
+        logger.info("✅ Sottoscrizione confermata. QoS: %s", granted_qos)
     
     def _on_log(self, client, userdata, level, buf):
-        """Callback per i log del client MQTT (opzionale)."""
-        # Decommentare per debug dettagliato
-        # print(f"🔍 MQTT Log: {buf}")
-        pass
+        """Callback per i log del client MQTT (solo con livello DEBUG)."""
+        logger.debug("🔍 MQTT Log: %s", buf)
     
     def _print_connection_error(self, rc):
         """Stampa dettagli dell'errore di connessione."""
@@ -115,7 +138,7 @@ class MqttClient:
         }
         
         if rc in error_messages:
-            print(f"💡 Dettaglio errore: {error_messages[rc]}")
+            logger.error("💡 Dettaglio errore: %s", error_messages[rc])
     
     def connect(self) -> bool:
         """
@@ -125,46 +148,45 @@ class MqttClient:
             bool: True se la connessione è riuscita, False altrimenti
         """
         try:
-            print("-" * 80)
-            print(f"🔄 Tentativo di connessione a {self.host}:{self.port}...")
+            logger.info("🔄 Tentativo di connessione a %s:%s...", self.host, self.port)
             self.client.connect(self.host, self.port, 60)
 
-            print("🚀 Avvio del client MQTT Meshtastic...")
-            print(f"🌐 Server: {config['MQTT_HOST']}:{config['MQTT_PORT']}")
-            print(f"👤 Username: {config['MQTT_USERNAME']}")
-            print(f"📡 Topic root: {config['MQTT_ROOT_TOPIC']}")
-            print("-" * 80)
+            logger.info("🚀 Avvio del client MQTT Meshtastic...")
+            logger.info("🌐 Server: %s:%s", config['MQTT_HOST'], config['MQTT_PORT'])
+            logger.info("👤 Username: %s", config['MQTT_USERNAME'])
+            logger.info("📡 Topic root: %s", config['MQTT_ROOT_TOPIC'])
+            if self.shared_group:
+                logger.info("👥 Gruppo condiviso: %s", self.shared_group)
 
             return True
         except Exception as e:
-            print(f"❌ Errore durante la connessione MQTT: {e}")
+            logger.error("❌ Errore durante la connessione MQTT: %s", e)
             return False
     
     def disconnect(self):
         """Disconnette dal broker MQTT."""
         if self.client and self.is_connected:
-            print("🔌 Disconnessione dal broker MQTT...")
+            logger.info("🔌 Disconnessione dal broker MQTT...")
             self.client.disconnect()
     
     def start_loop(self):
         """Avvia il loop principale per ricevere messaggi."""
         if not self.client:
-            print("❌ Client MQTT non inizializzato!")
+            logger.error("❌ Client MQTT non inizializzato!")
             return False
         
         try:
-            print("⏳ Avvio del loop di ricezione messaggi...")
-            print("💡 Premi Ctrl+C per interrompere")
-            print("=" * 80)
+            logger.info("⏳ Avvio del loop di ricezione messaggi...")
+            logger.info("💡 Premi Ctrl+C per interrompere")
             
             self.client.loop_forever()
             return True
             
         except KeyboardInterrupt:
-            print("\n\n⏹️  Interruzione da tastiera ricevuta")
+            logger.info("⏹️  Interruzione da tastiera ricevuta")
             self.disconnect()
         except Exception as e:
-            print(f"❌ Errore nel loop MQTT: {e}")
+            logger.error("❌ Errore nel loop MQTT: %s", e)
             return False
     
     def publish(self, topic: str, payload: str, qos: int = 0, retain: bool = False) -> bool:
@@ -181,7 +203,7 @@ class MqttClient:
             bool: True se la pubblicazione è riuscita
         """
         if not self.is_connected:
-            print("❌ Non connesso al broker MQTT!")
+            logger.error("❌ Non connesso al broker MQTT!")
             return False
         
         try:
@@ -190,10 +212,10 @@ class MqttClient:
                 # print(f"📤 Messaggio pubblicato su {topic}")
                 return True
             else:
-                print(f"❌ Errore nella pubblicazione: {result.rc}")
+                logger.error("❌ Errore nella pubblicazione: %s", result.rc)
                 return False
         except Exception as e:
-            print(f"❌ Errore durante la pubblicazione: {e}")
+            logger.error("❌ Errore durante la pubblicazione: %s", e)
             return False
     
     def subscribe(self, topic: str, qos: int = 0) -> bool:
@@ -208,19 +230,19 @@ class MqttClient:
             bool: True se la sottoscrizione è riuscita
         """
         if not self.is_connected:
-            print("❌ Non connesso al broker MQTT!")
+            logger.error("❌ Non connesso al broker MQTT!")
             return False
         
         try:
             result = self.client.subscribe(topic, qos)
             if result[0] == 0:
-                print(f"📡 Sottoscritto al topic: {topic}")
+                logger.info("📡 Sottoscritto al topic: %s", topic)
                 return True
             else:
-                print(f"❌ Errore nella sottoscrizione: {result[0]}")
+                logger.error("❌ Errore nella sottoscrizione: %s", result[0])
                 return False
         except Exception as e:
-            print(f"❌ Errore durante la sottoscrizione: {e}")
+            logger.error("❌ Errore durante la sottoscrizione: %s", e)
             return False
     
     def get_status(self) -> dict:
@@ -235,7 +257,8 @@ class MqttClient:
             'host': self.host,
             'port': self.port,
             'username': self.username,
-            'root_topic': self.root_topic
+            'root_topic': self.root_topic,
+            'shared_group': self.shared_group or None,
         }
     
     def __enter__(self):
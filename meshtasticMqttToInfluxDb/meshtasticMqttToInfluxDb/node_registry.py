@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Registro dei nodi Meshtastic, aggiornato dai pacchetti nodeinfo.
+
+Nome lungo, nome breve e hardware di ogni nodo vengono tenuti in memoria e
+salvati in un piccolo database SQLite, riletto all'avvio: telemetria e
+posizioni possono così essere arricchite con un insieme configurabile di tag
+senza join nelle dashboard.
+
+Per tenere sotto controllo la cardinalità delle serie in InfluxDB ogni chiave
+di tag accetta al massimo `max_values` valori distinti: un valore nuovo oltre il
+limite non viene scritto come tag (il punto resta, senza quel tag) e viene
+conteggiato come overflow. I valori non vengono mai rilasciati, nemmeno quando un
+nodo cambia nome: le serie con il valore precedente restano in InfluxDB, quindi
+anche le rinomine consumano il limite.
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Tag ricavati dal nodeinfo
+NODEINFO_TAGS = ('longname', 'shortname', 'hardware')
+
+
+class NodeRegistry:
+    """
+    Registro in memoria dei nodi con persistenza opzionale su SQLite.
+    """
+
+    def __init__(self, path: str = "", enrich_tags=NODEINFO_TAGS, max_values: int = 1000,
+                 refresh_interval: float = 0):
+        """
+        Args:
+            path: File SQLite ("" = solo in memoria)
+            enrich_tags: Tag aggiunti ai punti degli altri tipi di messaggio
+            max_values: Valori distinti ammessi per ogni chiave di tag (dall'avvio del processo)
+            refresh_interval: Secondi tra due riletture del database (0 = solo all'avvio),
+                utile quando più processi condividono lo stesso file
+        """
+        unknown = set(enrich_tags) - set(NODEINFO_TAGS)
+        if unknown:
+            raise ValueError(f"Tag di arricchimento non supportati: {', '.join(sorted(unknown))}")
+        self.path = path
+        self.enrich_tags = tuple(enrich_tags)
+        self.max_values = max_values
+        self.refresh_interval = refresh_interval
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._db = None
+        self._nodes = {}  # node_id -> {tag: valore} come ricevuti dal nodeinfo
+        self._admitted = {}  # node_id -> {tag: valore} entro il limite di cardinalità
+        self._enrichment = {}  # node_id -> tag di arricchimento già pronti per i punti
+        self._values = {tag: set() for tag in NODEINFO_TAGS}  # tag -> valori già emessi come tag
+        self._last_seq = 0
+        self.stats = {
+            'updates': 0,
+            'unchanged': 0,
+            'enriched': 0,
+            'persist_errors': 0,
+            **{f'overflow_{tag}': 0 for tag in NODEINFO_TAGS},
+        }
+
+    def open(self):
+        """Apre il database (se configurato) e carica i nodi salvati."""
+        if not self.path:
+            return self
+        self._db = sqlite3.connect(self.path, check_same_thread=False, timeout=5.0)
+        # WAL: i processi di ingest possono leggere mentre un altro scrive
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # seq cresce a ogni scrittura (le scritture SQLite sono serializzate): la rilettura
+        # riparte dall'ultimo seq visto senza dipendere dagli orologi dei processi
+        self._db.execute("CREATE TABLE IF NOT EXISTS nodes ("
+                         "node_id TEXT PRIMARY KEY, info TEXT NOT NULL, updated REAL NOT NULL, seq INTEGER NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS nodes_seq ON nodes (seq)")
+        self._db.commit()
+        loaded = self.refresh()
+        logger.info("🗂️  Registro nodi: %d nodi caricati da %s", loaded, self.path)
+        if self.refresh_interval > 0:
+            self._thread = threading.Thread(target=self._refresh_loop, name="node-registry", daemon=True)
+            self._thread.start()
+        return self
+
+    def _refresh_loop(self):
+        while not self._stop_event.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except sqlite3.Error as e:
+                logger.warning("⚠️  Rilettura del registro nodi fallita: %s", e)
+
+    def refresh(self) -> int:
+        """
+        Rilegge i nodi modificati nel database dopo l'ultima lettura
+        (aggiornamenti scritti da altri processi).
+
+        Returns:
+            int: Nodi letti
+        """
+        if self._db is None:
+            return 0
+        with self._lock:
+            rows = self._db.execute("SELECT node_id, info, seq FROM nodes WHERE seq > ? ORDER BY seq",
+                                    (self._last_seq,)).fetchall()
+            for node_id, info, seq in rows:
+                self._last_seq = max(self._last_seq, seq)
+                try:
+                    info = json.loads(info)
+                except ValueError:
+                    continue
+                if self._nodes.get(node_id) != info:
+                    self._apply(node_id, info)
+        return len(rows)
+
+    def update(self, node_id: str, payload: dict) -> dict:
+        """
+        Registra il nodeinfo di un nodo.
+
+        Returns:
+            dict: Tag del nodeinfo ammessi dal limite di cardinalità
+        """
+        info = {tag: str(payload[tag]) for tag in NODEINFO_TAGS if payload.get(tag) not in (None, '')}
+        with self._lock:
+            if self._nodes.get(node_id) == info:
+                self.stats['unchanged'] += 1
+                return self._admitted[node_id]
+            self.stats['updates'] += 1
+            admitted = self._apply(node_id, info)
+            self._persist(node_id, info)
+            return admitted
+
+    def tags_for(self, node_id: str) -> dict:
+        """Tag di arricchimento del nodo (vuoto se il nodo non è ancora noto)."""
+        tags = self._enrichment.get(node_id)
+        if tags:
+            with self._lock:
+                self.stats['enriched'] += 1
+            return tags
+        return {}
+
+    def _apply(self, node_id, info):
+        # Ammette i valori già emessi e quelli nuovi entro il limite; i precedenti restano contati
+        admitted = {}
+        for tag, value in info.items():
+            issued = self._values[tag]
+            if value in issued or len(issued) < self.max_values:
+                issued.add(value)
+                admitted[tag] = value
+            else:
+                self.stats[f'overflow_{tag}'] += 1
+        self._nodes[node_id] = info
+        self._admitted[node_id] = admitted
+        self._enrichment[node_id] = {tag: admitted[tag] for tag in self.enrich_tags if tag in admitted}
+        return admitted
+
+    def _persist(self, node_id, info):
+        if self._db is None:
+            return
+        try:
+            self._db.execute("INSERT INTO nodes (node_id, info, updated, seq) "
+                             "VALUES (?, ?, ?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM nodes)) "
+                             "ON CONFLICT(node_id) DO UPDATE SET info = excluded.info, "
+                             "updated = excluded.updated, seq = excluded.seq",
+                             (node_id, json.dumps(info, ensure_ascii=False), time.time()))
+            self._db.commit()
+        except sqlite3.Error as e:
+            self.stats['persist_errors'] += 1
+            logger.error("❌ Errore nel salvataggio del nodo %s nel registro: %s", node_id, e)
+
+    def close(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+            stats['nodes'] = len(self._nodes)
+            for tag in NODEINFO_TAGS:
+                stats[f'values_{tag}'] = len(self._values[tag])
+        return stats
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Classificazione dei payload MQTT Meshtastic (json, text, protobuf, binary).
+
+Il formato viene ricavato prima dal topic (…/json/…, …/e/…, …/c/…, …/map/, …/stat/…)
+e solo se il topic non lo indica si esamina il contenuto, con un'unica passata sui byte.
+"""
+import re
+
+import proto_decode
+from utils import json_loads
+
+# Un livello del topic indica il formato del payload
+TOPIC_FORMAT_RE = re.compile(r'(?:^|/)(?:(?P<json>json)|(?P<protobuf>e|c|map)|(?P<text>stat))(?:/|$)')
+
+# Byte ammessi in un payload di testo: ASCII stampabile più \t \n \v \f \r
+TEXT_BYTES = bytes(range(0x20, 0x7f)) + b'\t\n\x0b\x0c\r'
+JSON_START_BYTES = b'{['
+WHITESPACE_BYTES = b' \t\n\r'
+
+
+def classify_topic(topic):
+    """
+    Restituisce il formato del payload indicato dal topic ("json", "protobuf", "text") o None.
+    """
+    if not topic:
+        return None
+    match = TOPIC_FORMAT_RE.search(topic)
+    if match is None:
+        return None
+    return match.lastgroup
+
+
+def sniff_payload(payload_bytes):
+    """
+    Classifica il payload guardando solo i byte, senza conoscere il topic.
+
+    Returns:
+        tuple: (tipo, contenuto) con il JSON già decodificato se il tipo è "json"
+    """
+    stripped = payload_bytes.lstrip(WHITESPACE_BYTES)
+    if stripped[:1] and stripped[:1] in JSON_START_BYTES:
+        try:
+            return "json", json_loads(payload_bytes)
+        except ValueError:
+            pass
+
+    # translate rimuove i byte di testo in un'unica passata in C: se non resta nulla è testo
+    if payload_bytes and not payload_bytes.translate(None, TEXT_BYTES):
+        return "text", payload_bytes.decode('ascii')
+
+    if proto_decode.is_likely_protobuf(payload_bytes):
+        return "protobuf", None
+    return "binary", None
+
+
+def classify_payload(payload_bytes, topic=None):
+    """
+    Classifica il payload usando prima il topic e poi il contenuto.
+
+    Returns:
+        tuple: (tipo, contenuto) con il JSON già decodificato se il tipo è "json"
+    """
+    topic_format = classify_topic(topic)
+    if topic_format == "json":
+        try:
+            return "json", json_loads(payload_bytes)
+        except ValueError:
+            pass
+    elif topic_format == "protobuf":
+        return "protobuf", None
+    elif topic_format == "text":
+        try:
+            return "text", payload_bytes.decode('utf-8')
+        except UnicodeDecodeError:
+            pass
+    return sniff_payload(payload_bytes)
+
+
+def parse_mqtt_payload(payload_bytes, topic=None):
+    """
+    Analizza il tipo di payload e restituisce informazioni utili.
+    Il topic, se noto, indica il formato e il tipo di protobuf da decodificare.
+    """
+    payload_type, content = classify_payload(payload_bytes, topic)
+    info = {
+        "size": len(payload_bytes),
+        "type": payload_type,
+    }
+    if payload_type == "protobuf":
+        info["content"] = proto_decode.decode_protobuf(payload_bytes, topic)
+    elif payload_type == "binary":
+        info["content"] = payload_bytes
+    else:
+        info["content"] = content
+    return info
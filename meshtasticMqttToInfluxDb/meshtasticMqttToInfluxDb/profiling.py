@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Profilazione del servizio (--profile).
+
+Il servizio viene eseguito sotto cProfile (profiler deterministico della libreria
+standard) in tutti i thread, cioè loop MQTT, worker di ingest e sink, con
+tracemalloc attivo. Alla fine viene scritto un report di testo con:
+- durata di ogni stadio (istogramma meshtastic_stage_seconds) e quota sul tempo misurato;
+- funzioni più costose per tempo proprio e per tempo cumulativo;
+- righe di codice con più memoria allocata e picco di memoria (tracemalloc).
+
+Accanto al report viene salvato il file .pstats, da aprire con `python -m pstats`
+o snakeviz. Sotto profilazione ogni chiamata costa di più: contano le proporzioni.
+"""
+import cProfile
+import io
+import os
+import platform
+import pstats
+import re
+import sys
+import threading
+import time
+import tracemalloc
+
+# Solo le funzioni dei moduli del servizio: nelle altre classifiche dominano le attese dei thread
+_SERVICE_FUNCTIONS = re.escape(os.path.dirname(os.path.abspath(__file__)) + os.sep)
+
+# Allocazioni dovute al profiler stesso e al caricamento dei moduli, escluse dal report
+_ALLOCATION_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+class ServiceProfiler:
+    """
+    cProfile in ogni thread e tracemalloc, da start() a stop(), con report su file.
+    """
+
+    def __init__(self, report_path: str, top: int = 30, trace_frames: int = 1):
+        """
+        Args:
+            report_path: File del report di testo (il .pstats viene scritto accanto)
+            top: Righe di ogni classifica del report
+            trace_frames: Frame registrati da tracemalloc per ogni allocazione
+        """
+        self.report_path = report_path
+        self.stats_path = os.path.splitext(report_path)[0] + ".pstats"
+        self.top = top
+        self.trace_frames = trace_frames
+        self._lock = threading.Lock()
+        self._profiles = []
+        self._started = None
+        self.elapsed = 0.0
+        self._snapshot = None
+        self._peak_memory = 0
+
+    def start(self):
+        tracemalloc.start(self.trace_frames)
+        self._started = time.monotonic()
+        if sys.version_info < (3, 12):
+            # Fino a Python 3.11 cProfile osserva solo il thread che lo abilita:
+            # ogni thread avviato da qui in poi abilita il proprio al primo evento
+            threading.setprofile(self._profile_thread)
+        # Da Python 3.12 cProfile usa sys.monitoring e vede tutti i thread
+        self._enable_profile()
+        return self
+
+    def _enable_profile(self):
+        profile = cProfile.Profile()
+        with self._lock:
+            self._profiles.append(profile)
+        profile.enable()
+
+    def _profile_thread(self, frame, event, arg):
+        # Chiamata una sola volta per thread: il profiler in C sostituisce questa funzione
+        sys.setprofile(None)
+        self._enable_profile()
+
+    def stop(self):
+        """Ferma la profilazione (dal thread che ha chiamato start())."""
+        self._profiles[0].disable()
+        threading.setprofile(None)
+        self.elapsed = time.monotonic() - self._started
+        self._snapshot = tracemalloc.take_snapshot().filter_traces(_ALLOCATION_FILTERS)
+        self._peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    def _merged_stats(self):
+        stats = None
+        with self._lock:
+            profiles = list(self._profiles)
+        for profile in profiles:
+            profile.create_stats()
+            if not profile.stats:
+                continue
+            if stats is None:
+                stats = pstats.Stats(profile, stream=io.StringIO())
+            else:
+                stats.add(profile)
+        return stats
+
+    def write_report(self, stages: dict, messages: int = 0):
+        """
+        Scrive il report e il file .pstats.
+
+        Args:
+            stages: Snapshot di STAGE_SECONDS: {(stadio,): [bucket, somma, conteggio]}
+            messages: Messaggi elaborati durante la profilazione
+        """
+        lines = [
+            "Profilazione meshtasticMqttToInfluxDb",
+            f"Python {platform.python_version()} | durata {self.elapsed:.1f} s",
+        ]
+        if messages:
+            lines.append(f"Messaggi: {messages} ({messages / max(self.elapsed, 1e-9):.1f} msg/s sotto profilazione)")
+        lines.append(f"Picco di memoria tracciata: {self._peak_memory / 2 ** 20:.1f} MiB")
+
+        lines += ["", "== Stadi (meshtastic_stage_seconds) ==", format_stages(stages)]
+
+        stats = self._merged_stats()
+        if stats is not None:
+            stats.dump_stats(self.stats_path)
+            # Il tempo proprio di lock, socket e sleep è attesa dei thread, non lavoro
+            for title, sort, restrictions in (
+                    ("tempo proprio (moduli del servizio)", pstats.SortKey.TIME, (_SERVICE_FUNCTIONS, self.top)),
+                    ("tempo proprio", pstats.SortKey.TIME, (self.top,)),
+                    ("tempo cumulativo", pstats.SortKey.CUMULATIVE, (self.top,))):
+                stream = io.StringIO()
+                stats.stream = stream
+                stats.sort_stats(sort).print_stats(*restrictions)
+                lines += ["", f"== Funzioni per {title} ==", _strip_pstats_header(stream.getvalue())]
+
+        lines += ["", "== Memoria allocata per riga (ancora in uso alla fine, tracemalloc) =="]
+        if self._snapshot is not None:
+            for statistic in self._snapshot.statistics('lineno')[:self.top]:
+                lines.append(f"{statistic.size / 1024:>10.1f} KiB {statistic.count:>8} blocchi  {statistic.traceback}")
+
+        with open(self.report_path, "w", encoding="utf-8") as report:
+            report.write("\n".join(lines) + "\n")
+
+
+def format_stages(stages: dict) -> str:
+    """Tabella degli stadi ordinata per tempo totale, con la quota sul tempo misurato da tutti gli stadi."""
+    rows = sorted(((key[0], values[1], values[2]) for key, values in stages.items()),
+                  key=lambda row: row[1], reverse=True)
+    total = sum(row[1] for row in rows)
+    if not rows or not total:
+        return "(nessuno stadio misurato: STAGE_TIMERS disattivato o nessun messaggio)"
+    lines = [f"{'stadio':<22} {'chiamate':>10} {'totale s':>10} {'media µs':>10} {'quota':>7}"]
+    for stage, seconds, count in rows:
+        lines.append(f"{stage:<22} {count:>10} {seconds:>10.3f} {seconds / max(count, 1) * 1e6:>10.1f} "
+                     f"{seconds / total:>6.1%}")
+    return "\n".join(lines)
+
+
+def _strip_pstats_header(text: str) -> str:
+    # pstats stampa prima il nome del file e il totale delle chiamate: resta solo la tabella
+    lines = text.strip("\n").splitlines()
+    for index, line in enumerate(lines):
+        if line.lstrip().startswith("ncalls"):
+            return "\n".join(lines[index:])
+    return "\n".join(lines)
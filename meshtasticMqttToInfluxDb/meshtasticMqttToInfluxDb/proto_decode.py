@@ -1,14 +1,16 @@
 import sys
 import os
 import json
-import inspect
 import base64
-from google.protobuf.message import DecodeError
-from google.protobuf import message
-from google.protobuf import message as _message
-from google.protobuf.json_format import MessageToDict, MessageToJson
+import importlib
+import logging
+from collections.abc import Mapping
+
+logger = logging.getLogger(__name__)
+
+# google.protobuf e meshtastic vengono importati solo al primo utilizzo:
+# l'import di meshtastic da solo costa più di 100 ms all'avvio del processo.
 
-import meshtastic
 
 def get_available_protos():
     """
@@ -17,9 +19,9 @@ def get_available_protos():
     Returns:
         dict: Dizionario con formato {nome_protobuf: classe_protobuf}
     """
-    import glob
-    import os
-    import importlib
+    import inspect
+    from google.protobuf import message as _message
+    import meshtastic
     
     protos = {}
     for module_name,module in meshtastic.protobuf.__dict__.items():
@@ -32,41 +34,161 @@ def get_available_protos():
                 protos[attr.__name__] = attr
     
     return protos
-protos_map = get_available_protos()
+
+
+def get_proto_cache_path():
+    """
+    Percorso del file di cache del registro protobuf, legato alla versione di meshtastic.
+
+    La directory si può cambiare con PROTO_CACHE_DIR (default ~/.cache/meshtasticMqttToInfluxDb).
+    """
+    from importlib.metadata import version, PackageNotFoundError
+    try:
+        meshtastic_version = version('meshtastic')
+    except PackageNotFoundError:
+        meshtastic_version = 'unknown'
+    cache_dir = os.environ.get('PROTO_CACHE_DIR') or os.path.join(
+        os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'),
+        'meshtasticMqttToInfluxDb')
+    return os.path.join(cache_dir, f"protos-{meshtastic_version}.json")
+
+
+class ProtoRegistry(Mapping):
+    """
+    Registro {nome_protobuf: classe_protobuf} costruito al primo accesso.
+
+    L'indice nome -> modulo viene salvato su disco, così gli avvii successivi non
+    devono ispezionare tutti i moduli di meshtastic.protobuf; le classi vengono
+    risolte una alla volta, solo quando servono.
+    """
+
+    def __init__(self, cache_path=None):
+        self._cache_path = cache_path
+        self._index = None
+        self._classes = {}
+
+    def _get_index(self):
+        if self._index is None:
+            self._index = self._load_index()
+        return self._index
+
+    def _load_index(self):
+        cache_path = self._cache_path or get_proto_cache_path()
+        try:
+            with open(cache_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            pass
+
+        protos = get_available_protos()
+        self._classes.update(protos)
+        index = {name: cls.__module__ for name, cls in protos.items()}
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            # Scrittura atomica: un processo concorrente non legge mai un file a metà
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(index, f)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            logger.warning("⚠️  Impossibile salvare la cache dei protobuf in %s: %s", cache_path, e)
+        return index
+
+    def __getitem__(self, name):
+        cls = self._classes.get(name)
+        if cls is None:
+            module_name = self._get_index()[name]
+            cls = getattr(importlib.import_module(module_name), name)
+            self._classes[name] = cls
+        return cls
+
+    def __contains__(self, name):
+        return name in self._classes or name in self._get_index()
+
+    def __iter__(self):
+        return iter(self._get_index())
+
+    def __len__(self):
+        return len(self._get_index())
+
+
+protos_map = ProtoRegistry()
+
+# Tipo protobuf del payload di Data per ogni portnum.
+# I portnum testuali sono decodificati come UTF-8, quelli non elencati restano grezzi.
+PORTNUM_PROTOS = {
+    'POSITION_APP': 'Position',
+    'NODEINFO_APP': 'User',
+    'ROUTING_APP': 'Routing',
+    'ADMIN_APP': 'AdminMessage',
+    'WAYPOINT_APP': 'Waypoint',
+    'TELEMETRY_APP': 'Telemetry',
+    'TRACEROUTE_APP': 'RouteDiscovery',
+    'NEIGHBORINFO_APP': 'NeighborInfo',
+    'MAP_REPORT_APP': 'MapReport',
+    'PAXCOUNTER_APP': 'Paxcount',
+    'STORE_FORWARD_APP': 'StoreAndForward',
+    'REMOTE_HARDWARE_APP': 'HardwareMessage',
+}
+TEXT_PORTNUMS = ('TEXT_MESSAGE_APP', 'RANGE_TEST_APP', 'DETECTION_SENSOR_APP', 'ALERT_APP')
+
+# Messaggi pubblicati dai gateway sui topic protobuf (/e/, /c/, /map/)
+ENVELOPE_PROTO = 'ServiceEnvelope'
+# Tipi provati, in ordine, quando non si conosce né il tipo né il topic
+DEFAULT_PROTOS = (ENVELOPE_PROTO, 'MeshPacket')
+
+
+def get_topic_proto(topic):
+    """
+    Restituisce il tipo protobuf atteso per un topic MQTT Meshtastic, o None.
+
+    Es. msh/EU_868/2/e/LongFast/!12345678 -> ServiceEnvelope
+    """
+    if not topic:
+        return None
+    levels = topic.split('/')
+    if 'e' in levels or 'c' in levels or 'map' in levels:
+        return ENVELOPE_PROTO
+    return None
+
 
 def decode_protobuf_single(data, proto_name=None):
     """
-    Decodifica un singolo protobuf usando il tipo specificato o provando tutti i tipi
+    Decodifica un singolo protobuf usando il tipo specificato.
+
+    Senza tipo prova soltanto i messaggi di primo livello in DEFAULT_PROTOS
+    (ServiceEnvelope, poi MeshPacket): il tipo dei payload annidati è dato dal portnum.
     """
-    if proto_name and proto_name in protos_map:
-        # Prova solo il tipo specificato
+    if proto_name:
+        candidates = (proto_name,)
+    else:
+        candidates = DEFAULT_PROTOS
+
+    for name in candidates:
+        if name not in protos_map:
+            logger.error("❌ Tipo protobuf sconosciuto: %s", name)
+            continue
         try:
-            schema = protos_map[proto_name]()
+            schema = protos_map[name]()
             schema.ParseFromString(data)
-            decoded_dict = MessageToDict(schema)
+            decoded_dict = _message_to_dict(schema)
             if decoded_dict:
-                return decoded_dict, proto_name
+                return decoded_dict, name
         except Exception as e:
-            print(f"❌ Errore nella decodifica di {proto_name}: {e}")
-            return None, None
-    else:
-        # Prova tutti i tipi
-        for k, v in protos_map.items():
-            try:
-                schema = v()
-                schema.ParseFromString(data)
-                decoded_dict = MessageToDict(schema)
-                if decoded_dict:
-                    return decoded_dict, k
-            except Exception as e:
-                continue
+            if proto_name:
+                logger.error("❌ Errore nella decodifica di %s: %s", proto_name, e)
+            continue
 
     return None, None
 
-def decode_protobuf_enhanced(data, depth=0, max_depth=3):
+def _message_to_dict(message):
+    from google.protobuf.json_format import MessageToDict
+    return MessageToDict(message)
+
+def decode_protobuf_enhanced(data, depth=0, max_depth=3, proto_name=None):
         
     if depth > max_depth:
-        print(f"⚠️ Massima profondità di ricorsione raggiunta ({max_depth})")
+        logger.warning("⚠️ Massima profondità di ricorsione raggiunta (%s)", max_depth)
         return None
 
     indent = "  " * depth
@@ -76,41 +198,46 @@ def decode_protobuf_enhanced(data, depth=0, max_depth=3):
         try:
             data = base64.b64decode(data)
         except Exception as e:
-            print(f"❌ Errore nel decodificare base64: {e}")
+            logger.error("❌ Errore nel decodificare base64: %s", e)
             return None
 
     # Decodifica il protobuf principale
-    decoded, proto_type = decode_protobuf_single(data)
+    decoded, proto_type = decode_protobuf_single(data, proto_name)
     if not decoded:
-        print(f"❌ Impossibile decodificare i dati")
+        logger.error("❌ Impossibile decodificare i dati")
         return None
     else:
         decoded["__proto_type__"] = proto_type
 
-    result = check_or_decode(decoded)
+    result = check_or_decode(decoded, depth)
     return result
 
-def check_or_decode(data):
+def check_or_decode(data, depth=0):
     if isinstance(data, dict):
         if 'portnum' in data and 'payload' in data:
-            if data['portnum'] in ['TEXT_MESSAGE_APP', 'RANGE_TEST_APP']:
-                payload_decoded = base64.b64decode(data['payload']).decode('utf-8')
+            portnum = data['portnum']
+            if portnum in TEXT_PORTNUMS:
+                payload_decoded = base64.b64decode(data['payload']).decode('utf-8', errors='replace')
+            elif portnum in PORTNUM_PROTOS:
+                payload_decoded = decode_protobuf_enhanced(data['payload'], depth + 1,
+                                                           proto_name=PORTNUM_PROTOS[portnum])
             else:
-                payload_decoded = decode_protobuf_enhanced(data['payload'])
+                payload_decoded = None
             data.update({"payload_decoded": payload_decoded})
             return data
         else:
             for key, value in data.items():
-                data[key] = check_or_decode(value)
+                data[key] = check_or_decode(value, depth)
         return data
     else:
         return data
 
-def decode_protobuf(data):
+def decode_protobuf(data, topic=None):
     """
-    Funzione principale per la decodifica protobuf con navigazione ricorsiva
+    Funzione principale per la decodifica protobuf con navigazione ricorsiva.
+    Se è noto il topic MQTT, il tipo del messaggio esterno viene ricavato dal topic.
     """
-    return decode_protobuf_enhanced(data)
+    return decode_protobuf_enhanced(data, proto_name=get_topic_proto(topic))
 
 def is_likely_protobuf(data):
     """
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Riproduzione di un file di cattura (--replay) attraverso l'intera pipeline,
+contro sink locali finti: un server HTTP che imita InfluxDB nello stesso
+processo e un publisher MQTT che si limita a contare i messaggi.
+
+Al termine viene stampato un report con throughput sostenuto, latenza
+p50/p99 (dall'accodamento alla fine dell'elaborazione) e picco di memoria,
+da confrontare tra versioni diverse.
+"""
+import gzip
+import resource
+import threading
+import time
+
+from capture import read_capture
+
+
+class FakeInfluxServer:
+    """
+    Server HTTP minimale compatibile con /health e /api/v2/write di InfluxDB 2.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        server = self
+        self.points = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                body = b'{"name":"influxdb","message":"ready for queries and writes","status":"pass","version":"replay"}'
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                data = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if self.headers.get("Content-Encoding") == "gzip":
+                    data = gzip.decompress(data)
+                points = data.count(b"\n") + 1 if data.strip() else 0
+                with server._lock:
+                    server.points += points
+                    server.requests += 1
+                self.send_response(204)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def host(self):
+        return f"http://{self._server.server_address[0]}"
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-influxdb", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class FakeMqttPublisher:
+    """Sostituto di MqttClient per il publisher Home Assistant: conta i messaggi pubblicati."""
+
+    def __init__(self):
+        self.is_connected = True
+        self.published = 0
+        self._lock = threading.Lock()
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        with self._lock:
+            self.published += 1
+        return True
+
+    def get_status(self):
+        return {'connected': self.is_connected, 'host': 'replay', 'port': 0, 'username': None, 'root_topic': None}
+
+
+class LatencyRecorder:
+    """
+    Avvolge l'handler della coda di ingest e misura il tempo tra l'accodamento
+    (receive_ts) e la fine dell'elaborazione di ogni messaggio.
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.latencies = []
+
+    def __call__(self, topic, payload, receive_ts):
+        try:
+            self.handler(topic, payload, receive_ts)
+        finally:
+            # list.append è atomica: nessun lock tra i worker
+            self.latencies.append(time.time() - receive_ts)
+
+    def percentile(self, p):
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))
+        return ordered[index]
+
+
+def parse_speed(value: str):
+    """
+    Interpreta --speed: "max" (nessuna attesa) o un moltiplicatore del ritmo registrato.
+
+    Returns:
+        float o None per "max"
+    """
+    if value.lower() == "max":
+        return None
+    speed = float(value)
+    if speed <= 0:
+        raise ValueError("--speed deve essere maggiore di zero oppure 'max'")
+    return speed
+
+
+def feed_capture(path: str, ingest_queue, speed=None) -> int:
+    """
+    Accoda i messaggi del file rispettando gli intervalli registrati divisi per `speed`
+    (nessuna attesa se speed è None). Se la coda è piena si attende invece di scartare.
+
+    Returns:
+        int: Messaggi accodati
+    """
+    count = 0
+    first_ts = None
+    start = time.monotonic()
+    for timestamp, topic, payload in read_capture(path):
+        if speed is not None:
+            if first_ts is None:
+                first_ts = timestamp
+            delay = (timestamp - first_ts) / speed - (time.monotonic() - start)
+            if delay > 0:
+                time.sleep(delay)
+        while ingest_queue.depth() >= ingest_queue.maxsize:
+            time.sleep(0.0005)
+        ingest_queue.put(topic, payload, time.time())
+        count += 1
+    return count
+
+
+def peak_rss_bytes() -> int:
+    """Picco di memoria residente del processo (ru_maxrss è in KiB su Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def format_report(messages, elapsed, recorder, influx_server, publisher) -> str:
+    """Report finale del replay."""
+    rate = messages / elapsed if elapsed > 0 else 0.0
+    lines = [
+        "=" * 80,
+        "📊 Report replay",
+        f"   Messaggi:           {messages} in {elapsed:.2f} s",
+        f"   Throughput:         {rate:.1f} msg/s",
+        f"   Latenza p50 / p99:  {recorder.percentile(50) * 1000:.2f} ms / {recorder.percentile(99) * 1000:.2f} ms",
+        f"   Picco RSS:          {peak_rss_bytes() / (1024 * 1024):.1f} MiB",
+        f"   InfluxDB (finto):   {influx_server.points} punti in {influx_server.requests} richieste",
+        f"   MQTT (finto):       {publisher.published} messaggi pubblicati",
+        "=" * 80,
+    ]
+    return "\n".join(lines)
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Aggregazione dei punti in finestre temporali (rollup) per un bucket a bassa risoluzione.
+
+Per ogni measurement selezionata e per ogni nodo viene tenuta, per ciascuna
+durata (es. 1m, 15m, 1h), una sola finestra aperta con min, max, somma,
+conteggio e ultimo valore di ogni campo numerico. I punti aggiornano solo la
+finestra più breve; quando questa si chiude il suo aggregato viene riversato
+nella successiva (per questo ogni durata è multipla della precedente).
+Quando arriva un punto della finestra successiva, o quando la finestra è
+terminata da più di `grace` secondi, l'aggregato viene emesso come un punto
+
+    <measurement>,node_id=...,window=15m temperature_min=...,temperature_max=...,
+        temperature_mean=...,temperature_count=...,temperature_last=... <inizio finestra>
+
+All'arresto le finestre non ancora terminate vengono emesse con il tag partial=true:
+dopo il riavvio la stessa finestra viene riscritta dal nuovo processo con i punti
+successivi, e senza il tag la seconda scrittura sovrascriverebbe la prima in InfluxDB.
+
+La memoria è limitata da `max_series` (coppie measurement/nodo): oltre il limite
+i punti delle nuove serie non vengono aggregati e sono contati in series_dropped.
+"""
+import re
+import threading
+import time
+from typing import Callable
+
+_DURATION = re.compile(r'^(\d+)([smhd])$')
+_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_windows(value: str):
+    """
+    Interpreta ROLLUP_WINDOWS: "1m,15m,1h".
+
+    Returns:
+        tuple: ((etichetta, secondi), ...) in ordine crescente di durata
+    """
+    windows = {}
+    for item in value.split(','):
+        item = item.strip().lower()
+        if not item:
+            continue
+        match = _DURATION.match(item)
+        if match is None or int(match.group(1)) == 0:
+            raise ValueError(f"ROLLUP_WINDOWS: finestra non valida '{item}' (es. 1m, 15m, 1h)")
+        windows[item] = int(match.group(1)) * _UNITS[match.group(2)]
+    if not windows:
+        raise ValueError("ROLLUP_WINDOWS: nessuna finestra configurata")
+    return tuple(sorted(windows.items(), key=lambda window: window[1]))
+
+
+class RollupAggregator:
+    """
+    Aggregati per (measurement, nodo, finestra) emessi in blocco quando la finestra si chiude.
+    """
+
+    def __init__(self, emit: Callable, windows=(('1m', 60), ('15m', 900), ('1h', 3600)),
+                 measurements=('telemetry', 'custom_metrics'), max_series: int = 10000,
+                 grace: float = 60.0, extra_tags=None, clock=time.time):
+        """
+        Args:
+            emit: Funzione chiamata con la lista dei punti (dict) delle finestre chiuse
+            windows: ((etichetta, secondi), ...), vedi parse_windows()
+            measurements: Measurement da aggregare
+            max_series: Coppie measurement/nodo aggregate contemporaneamente
+            grace: Secondi di attesa dopo la fine di una finestra prima di emetterla
+            extra_tags: Tag aggiunti a tutti i punti emessi (es. il processo di ingest)
+            clock: Funzione che restituisce il tempo corrente in secondi (per i test)
+        """
+        for (_, shorter), (label, longer) in zip(windows, windows[1:]):
+            if longer % shorter:
+                raise ValueError(f"La finestra {label} deve essere un multiplo della precedente")
+        self._emit = emit
+        self.windows = tuple((label, seconds * 1_000_000_000) for label, seconds in windows)
+        self.measurements = frozenset(measurements)
+        self.max_series = max_series
+        self.grace = grace
+        self.extra_tags = dict(extra_tags or {})
+        self._clock = clock
+
+        self._lock = threading.Lock()
+        # (measurement, node_id) -> una finestra per durata: [inizio ns, {campo: [min, max, somma, n, ultimo]}]
+        # Dopo l'emissione gli aggregati diventano None e l'inizio resta, per riconoscere i punti in ritardo
+        self._series = {}
+        self._flush_thread = None
+        self._running = False
+
+        self.stats = {
+            'points': 0,
+            'windows_emitted': 0,
+            'windows_partial': 0,
+            'late': 0,
+            'series_dropped': 0,
+        }
+
+    def add(self, point_dict):
+        """Aggiunge i campi numerici del punto alla finestra più breve aperta del suo nodo."""
+        measurement = point_dict['measurement']
+        if measurement not in self.measurements:
+            return
+        key = (measurement, point_dict['tags']['node_id'])
+        timestamp = point_dict['time']
+        closed = []
+        with self._lock:
+            windows = self._series.get(key)
+            if windows is None:
+                if len(self._series) >= self.max_series:
+                    self.stats['series_dropped'] += 1
+                    return
+                windows = self._series[key] = [None] * len(self.windows)
+            start = timestamp - timestamp % self.windows[0][1]
+            window = windows[0]
+            if window is None or start > window[0]:
+                if window is not None and window[1] is not None:
+                    self._close(key, windows, 0, closed)
+                window = windows[0] = [start, {}]
+            elif start < window[0] or window[1] is None:
+                # Finestra già emessa: riscriverla con un aggregato parziale perderebbe dati
+                self.stats['late'] += 1
+                return
+            self.stats['points'] += 1
+            aggregates = window[1]
+            for field, value in point_dict['fields'].items():
+                if value.__class__ is bool or not isinstance(value, (int, float)):
+                    continue
+                aggregate = aggregates.get(field)
+                if aggregate is None:
+                    aggregates[field] = [value, value, value, 1, value]
+                    continue
+                if value < aggregate[0]:
+                    aggregate[0] = value
+                if value > aggregate[1]:
+                    aggregate[1] = value
+                aggregate[2] += value
+                aggregate[3] += 1
+                aggregate[4] = value
+        if closed:
+            self._send(closed)
+
+    def _close(self, key, windows, level, closed, partial=False):
+        """
+        Emette la finestra `level` e la riversa nella finestra successiva, più lunga
+        (chiamata con il lock): i punti grezzi aggiornano solo la finestra più breve.
+        """
+        window = windows[level]
+        closed.append(self._to_point(key, self.windows[level][0], window, partial))
+        if level + 1 < len(self.windows):
+            start = window[0] - window[0] % self.windows[level + 1][1]
+            parent = windows[level + 1]
+            if parent is None or start > parent[0]:
+                if parent is not None and parent[1] is not None:
+                    self._close(key, windows, level + 1, closed)
+                parent = windows[level + 1] = [start, {}]
+            if start == parent[0] and parent[1] is not None:
+                aggregates = parent[1]
+                for field, (minimum, maximum, total, count, last) in window[1].items():
+                    aggregate = aggregates.get(field)
+                    if aggregate is None:
+                        aggregates[field] = [minimum, maximum, total, count, last]
+                        continue
+                    if minimum < aggregate[0]:
+                        aggregate[0] = minimum
+                    if maximum > aggregate[1]:
+                        aggregate[1] = maximum
+                    aggregate[2] += total
+                    aggregate[3] += count
+                    aggregate[4] = last
+        window[1] = None
+
+    def flush(self, force: bool = False):
+        """
+        Emette le finestre terminate da più di `grace` secondi (tutte, anche quelle aperte, se force).
+        Con force le finestre non ancora terminate sono emesse come parziali.
+        """
+        now = int(self._clock() * 1_000_000_000)
+        horizon = None if force else now - int(self.grace * 1_000_000_000)
+        closed = []
+        with self._lock:
+            for key in list(self._series):
+                windows = self._series[key]
+                idle = True
+                # Dalla più breve alla più lunga, così ogni finestra riceve prima quelle che contiene
+                for level, (label, duration) in enumerate(self.windows):
+                    window = windows[level]
+                    if window is None:
+                        continue
+                    if horizon is not None and window[0] + duration > horizon:
+                        idle = False
+                        continue
+                    if window[1] is not None:
+                        self._close(key, windows, level, closed, partial=window[0] + duration > now)
+                if idle:
+                    # Nessuna finestra aperta: la serie non occupa più posto
+                    del self._series[key]
+        if closed:
+            self._send(closed)
+
+    def _to_point(self, key, label, window, partial=False):
+        # Chiamata con il lock
+        measurement, node_id = key
+        fields = {}
+        for field, (minimum, maximum, total, count, last) in window[1].items():
+            fields[f"{field}_min"] = float(minimum)
+            fields[f"{field}_max"] = float(maximum)
+            fields[f"{field}_mean"] = total / count
+            fields[f"{field}_count"] = count
+            fields[f"{field}_last"] = float(last)
+        self.stats['windows_emitted'] += 1
+        tags = {'node_id': node_id, 'window': label, **self.extra_tags}
+        if partial:
+            # Serie distinta: la finestra completata dopo il riavvio non la sovrascrive
+            tags['partial'] = 'true'
+            self.stats['windows_partial'] += 1
+        return {
+            'measurement': measurement,
+            'time': window[0],
+            'tags': tags,
+            'fields': fields,
+        }
+
+    def _send(self, points):
+        points = [point for point in points if point['fields']]
+        if points:
+            self._emit(points)
+
+    def start(self):
+        """Avvia il thread che emette le finestre dei nodi che non inviano più punti."""
+        if self._running:
+            return
+        self._running = True
+        self._flush_thread = threading.Thread(target=self._flush_loop, name="rollup", daemon=True)
+        self._flush_thread.start()
+
+    def close(self):
+        """Ferma il thread ed emette tutte le finestre, quelle non ancora terminate come parziali."""
+        self._running = False
+        self.flush(force=True)
+
+    def _flush_loop(self):
+        interval = max(1.0, min(self.grace, 10.0))
+        while self._running:
+            time.sleep(interval)
+            self.flush()
+
+    def get_stats(self) -> dict:
+        """Restituisce i contatori dell'aggregazione."""
+        with self._lock:
+            return {**self.stats, 'series': len(self._series)}
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Classi di priorità e riduzione del carico (load shedding).
+
+Ogni punto preparato appartiene a una classe di priorità in base alla sua
+measurement, cioè al tipo Meshtastic del pacchetto (PRIORITY_CLASSES, dalla
+più importante alla meno importante):
+
+    "high=telemetry,custom_metrics,nodeinfo; normal=*; low=position,mapreport"
+
+Senza carico ogni punto passa. Quando la coda di ingest supera LOAD_SHED_START
+prima di rollup e sink ogni punto passa da due controlli:
+- campionamento: le classi meno importanti vengono campionate, a partire dalla
+  più bassa, fino a essere scartate del tutto con la coda piena;
+- limite per nodo: un token bucket per (nodo, classe), ricaricato con il
+  timestamp del pacchetto, ferma per primi i nodi bloccati che trasmettono di
+  continuo. Le copie dello stesso pacchetto ricevute da più gateway consumano
+  un solo token.
+La classe più importante passa sempre e non è mai limitata.
+"""
+import threading
+import time
+from collections import deque
+
+from metrics import SHED_NODE_POINTS
+
+# Ultimi pacchetti che hanno consumato un token, per nodo e classe: le copie degli altri gateway li riusano
+RECENT_PACKETS = 8
+
+
+def parse_priority_classes(value: str):
+    """
+    Interpreta PRIORITY_CLASSES. Le measurement non elencate vanno nella classe con `*`
+    (o, se manca, nella meno importante).
+
+    Returns:
+        tuple: (nomi delle classi dalla più importante, {measurement: classe}, classe di default)
+    """
+    names = []
+    classes = {}
+    default = None
+    for item in value.split(';'):
+        item = item.strip()
+        if not item:
+            continue
+        name, separator, members = item.partition('=')
+        name = name.strip()
+        if not separator or not name or name in names:
+            raise ValueError(f"PRIORITY_CLASSES: classe non valida '{item}' (es. high=telemetry,nodeinfo)")
+        names.append(name)
+        for member in members.split(','):
+            member = member.strip()
+            if member == '*':
+                default = name
+            elif member:
+                classes[member] = name
+    if not names:
+        raise ValueError("PRIORITY_CLASSES: nessuna classe configurata")
+    return tuple(names), classes, default or names[-1]
+
+
+class LoadShedder:
+    """
+    Ammissione dei punti per classe di priorità, con limiti per nodo e campionamento sotto carico.
+    """
+
+    def __init__(self, class_names=('high', 'normal', 'low'), classes=None, default_class='normal',
+                 shed_start: float = 0.5, rate_per_minute: float = 30.0, burst: int = 30,
+                 max_buckets: int = 10000, max_node_series: int = 500, load=None):
+        """
+        Args:
+            class_names: Classi dalla più importante alla meno importante
+            classes: {measurement: classe}
+            default_class: Classe delle measurement non elencate
+            shed_start: Riempimento della coda di ingest (0-1) oltre il quale si campiona la classe più bassa
+            rate_per_minute: Punti al minuto ammessi per nodo e classe sotto carico (0 = nessun limite)
+            burst: Punti ammessi di seguito prima che intervenga il limite
+            max_buckets: Token bucket ricordati (oltre il limite si eliminano quelli pieni)
+            max_node_series: Nodi distinti nel contatore degli scarti per nodo (gli altri sono "other")
+            load: Funzione che restituisce il carico corrente (0-1), es. il riempimento della coda
+        """
+        self.class_names = tuple(class_names)
+        self.classes = dict(classes or {})
+        self.default_class = default_class
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.max_buckets = max_buckets
+        self.max_node_series = max_node_series
+        self._load = load
+        self.shed_start = shed_start
+        # Soglia di carico di ogni classe: la più bassa da shed_start, le altre a intervalli regolari fino a 1
+        levels = len(self.class_names) - 1
+        self._step = (1.0 - shed_start) / levels if levels else 1.0
+        self._thresholds = {
+            name: shed_start + self._step * (levels - index)
+            for index, name in enumerate(self.class_names) if index > 0
+        }
+        self._credit = {name: 0.0 for name in self.class_names}
+
+        self._lock = threading.Lock()
+        self._buckets = {}  # (node_id, classe) -> [token, ultimo timestamp, id dei pacchetti recenti]
+        self._node_series = set()
+        self.stats = {}
+        for name in self.class_names:
+            self.stats[f'admitted_{name}'] = 0
+            self.stats[f'shed_{name}'] = 0
+            self.stats[f'rate_limited_{name}'] = 0
+
+    def set_load(self, load):
+        """Imposta la funzione del carico (la coda di ingest viene creata dopo lo shedder)."""
+        self._load = load
+
+    def class_of(self, measurement: str) -> str:
+        return self.classes.get(measurement, self.default_class)
+
+    def admit(self, point_dict, packet_id=None) -> bool:
+        """
+        Args:
+            point_dict: Punto preparato
+            packet_id: Id del pacchetto Meshtastic, per non contare due volte le copie dei gateway
+
+        Returns:
+            bool: True se il punto va scritto, False se viene scartato
+        """
+        priority = self.class_of(point_dict['measurement'])
+        if priority == self.class_names[0]:
+            with self._lock:
+                self.stats[f'admitted_{priority}'] += 1
+            return True
+
+        node_id = point_dict['tags'].get('node_id')
+        load = self._load() if self._load is not None else 0.0
+        with self._lock:
+            if load <= self.shed_start:
+                self.stats[f'admitted_{priority}'] += 1
+                return True
+            threshold = self._thresholds[priority]
+            if load > threshold:
+                # Campionamento: la quota ammessa scende linearmente fino a zero in un intervallo di soglia
+                self._credit[priority] += max(0.0, 1.0 - (load - threshold) / self._step)
+                if self._credit[priority] < 1.0:
+                    return self._drop(priority, 'shed', node_id)
+                self._credit[priority] -= 1.0
+            if self.rate and node_id is not None and not self._take_token(node_id, priority, point_dict, packet_id):
+                return self._drop(priority, 'rate_limited', node_id)
+            self.stats[f'admitted_{priority}'] += 1
+        return True
+
+    def _take_token(self, node_id, priority, point_dict, packet_id):
+        # Chiamata con il lock. Ricarica con il timestamp del pacchetto: replay e backfill si comportano come dal vivo
+        timestamp = point_dict.get('time')
+        now = timestamp / 1_000_000_000 if isinstance(timestamp, int) else time.time()
+        key = (node_id, priority)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_buckets:
+                self._prune(now)
+            bucket = self._buckets[key] = [float(self.burst), now, deque(maxlen=RECENT_PACKETS)]
+        else:
+            if packet_id and packet_id in bucket[2]:
+                # Copia da un altro gateway di un pacchetto già ammesso
+                return True
+            bucket[0] = min(float(self.burst), bucket[0] + max(0.0, now - bucket[1]) * self.rate)
+            bucket[1] = max(bucket[1], now)
+        if bucket[0] < 1.0:
+            return False
+        bucket[0] -= 1.0
+        if packet_id:
+            bucket[2].append(packet_id)
+        return True
+
+    def _prune(self, now):
+        # Un bucket che si sarebbe già ricaricato del tutto equivale a uno nuovo
+        refill = self.burst / self.rate
+        for key in [key for key, (_, last, _) in self._buckets.items() if now - last >= refill]:
+            del self._buckets[key]
+        if len(self._buckets) >= self.max_buckets:
+            self._buckets.clear()
+
+    def _drop(self, priority, reason, node_id):
+        # Chiamata con il lock
+        self.stats[f'{reason}_{priority}'] += 1
+        if node_id is not None:
+            if node_id not in self._node_series and len(self._node_series) < self.max_node_series:
+                self._node_series.add(node_id)
+            SHED_NODE_POINTS.inc(node_id if node_id in self._node_series else 'other', priority)
+        return False
+
+    def get_stats(self) -> dict:
+        """Punti ammessi, campionati via (shed) e limitati per classe."""
+        load = self._load() if self._load is not None else 0.0
+        with self._lock:
+            return {**self.stats, 'load': round(load, 3), 'buckets': len(self._buckets)}
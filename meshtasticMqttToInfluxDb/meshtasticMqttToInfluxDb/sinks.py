@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Destinazioni dei punti (sink) con code indipendenti.
+
+Ogni punto preparato viene consegnato a tutti i sink configurati in SINKS.
+Ogni sink ha una propria coda limitata e un proprio thread che invia i punti
+in batch, con retry a backoff esponenziale e uno stato di salute: un sink
+lento o in errore riempie solo la propria coda (scartando i punti più vecchi)
+e non rallenta l'elaborazione né gli altri sink.
+
+    SINKS="influxdb; home_assistant; file:path=points.lp,max_mb=100; influxdb:name=archivio,bucket=archivio"
+
+Tipi disponibili: influxdb, home_assistant, file (line protocol o JSONL a
+rotazione), log (scrive i punti nel log, come --dry-run).
+"""
+import json
+import logging
+import os
+import re
+import threading
+from collections import deque
+
+from metrics import STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+SINK_TYPES = ('influxdb', 'home_assistant', 'file', 'log')
+# Opzioni valide per tutti i tipi: politica della coda e dei batch
+POLICY_OPTIONS = ('queue', 'batch', 'flush_ms', 'retries')
+TYPE_OPTIONS = {
+    'influxdb': ('bucket', 'host', 'port', 'token', 'org', 'spool'),
+    'home_assistant': (),
+    'file': ('path', 'format', 'max_mb', 'backups'),
+    'log': (),
+}
+_NAME = re.compile(r'^[a-z][a-z0-9_]*$')
+
+
+def parse_sinks(value: str):
+    """
+    Interpreta SINKS: "tipo[:opzione=valore,...]; ...". Il nome del sink (opzione `name`,
+    default il tipo) identifica le sue statistiche e deve essere unico.
+
+    Returns:
+        list: [(nome, tipo, {opzione: valore}), ...]
+    """
+    sinks = []
+    names = set()
+    for item in value.split(';'):
+        item = item.strip()
+        if not item:
+            continue
+        sink_type, _, raw_options = item.partition(':')
+        sink_type = sink_type.strip().lower()
+        if sink_type not in SINK_TYPES:
+            raise ValueError(f"SINKS: tipo '{sink_type}' non valido (ammessi: {', '.join(SINK_TYPES)})")
+        options = {}
+        for option in raw_options.split(','):
+            if not option.strip():
+                continue
+            key, separator, option_value = option.partition('=')
+            key = key.strip().lower()
+            if not separator or key not in ('name',) + POLICY_OPTIONS + TYPE_OPTIONS[sink_type]:
+                raise ValueError(f"SINKS: opzione '{option.strip()}' non valida per {sink_type}")
+            options[key] = option_value.strip()
+        name = options.pop('name', sink_type).lower()
+        if not _NAME.match(name):
+            raise ValueError(f"SINKS: nome '{name}' non valido (lettere minuscole, cifre e _)")
+        if name in names:
+            raise ValueError(f"SINKS: nome '{name}' duplicato, usa l'opzione name=")
+        if sink_type == 'file' and not options.get('path'):
+            raise ValueError(f"SINKS: il sink file '{name}' richiede path=")
+        names.add(name)
+        sinks.append((name, sink_type, options))
+    return sinks
+
+
+class Sink:
+    """
+    Coda limitata e thread di invio comuni a tutti i sink.
+
+    Le sottoclassi implementano send(points), che solleva un'eccezione se l'invio
+    fallisce: il batch viene ritentato fino a max_retries volte, poi scartato.
+    Con queue_size=0 non c'è coda né thread: write() invia subito nel thread del
+    chiamante (es. nel backfill, dove l'ordine di scrittura serve al checkpoint).
+    """
+
+    def __init__(self, name: str, queue_size: int = 10000, batch_size: int = 500, flush_interval: float = 1.0,
+                 max_retries: int = 5, max_backoff: float = 30.0):
+        """
+        Args:
+            name: Nome del sink, per log e statistiche
+            queue_size: Punti in attesa oltre i quali si scartano i più vecchi (0 = invio sincrono)
+            batch_size: Punti per invio
+            flush_interval: Secondi massimi di attesa prima di inviare un batch incompleto
+            max_retries: Tentativi aggiuntivi per ogni batch
+            max_backoff: Attesa massima tra due tentativi
+        """
+        self.name = name
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.max_backoff = max_backoff
+        self.health = 'ok'  # ok | retrying | failing
+        self._stage = f"sink_{name}"
+
+        self._buffer = deque()
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+        self._abort_retries = threading.Event()
+        self.stats = {
+            'queued': 0,
+            'dropped': 0,
+            'batches_sent': 0,
+            'batches_retried': 0,
+            'batches_failed': 0,
+            'points_sent': 0,
+            'points_failed': 0,
+        }
+
+    def write(self, point_dict) -> bool:
+        """
+        Accoda un punto senza mai bloccare il chiamante.
+
+        Returns:
+            bool: False se per fare spazio è stato scartato un punto
+        """
+        if not self.queue_size:
+            self._send_with_retries([point_dict])
+            return True
+        with self._cond:
+            dropped = len(self._buffer) >= self.queue_size
+            if dropped:
+                # Come la coda di ingest: i dati più recenti sono i più utili
+                self._buffer.popleft()
+                self.stats['dropped'] += 1
+            self._buffer.append(point_dict)
+            self.stats['queued'] += 1
+            if len(self._buffer) >= self.batch_size:
+                self._cond.notify()
+        return not dropped
+
+    def start(self):
+        if self._running or not self.queue_size:
+            return self
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=f"sink-{self.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._running and len(self._buffer) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+                if not self._buffer:
+                    if not self._running:
+                        return
+                    continue
+                batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+            self._send_with_retries(batch)
+
+    def _send_with_retries(self, points):
+        for attempt in range(self.max_retries + 1):
+            try:
+                with STAGE_SECONDS.time(self._stage):
+                    self.send(points)
+            except Exception as e:
+                if attempt < self.max_retries and not self._abort_retries.is_set():
+                    self.health = 'retrying'
+                    with self._cond:
+                        self.stats['batches_retried'] += 1
+                    logger.warning("⚠️  Sink %s: nuovo tentativo di invio (%d punti): %s", self.name, len(points), e)
+                    self._abort_retries.wait(min(2 ** attempt, self.max_backoff))
+                    continue
+                self.health = 'failing'
+                with self._cond:
+                    self.stats['batches_failed'] += 1
+                    self.stats['points_failed'] += len(points)
+                logger.error("❌ Sink %s: %d punti scartati: %s", self.name, len(points), e)
+                return
+            if self.health != 'ok':
+                logger.info("✅ Sink %s di nuovo disponibile", self.name)
+            self.health = 'ok'
+            with self._cond:
+                self.stats['batches_sent'] += 1
+                self.stats['points_sent'] += len(points)
+            return
+
+    def send(self, points):
+        raise NotImplementedError
+
+    def close(self, timeout: float = 30.0):
+        """Invia i punti in coda (al massimo per `timeout` secondi) e ferma il thread."""
+        if self._thread is not None:
+            with self._cond:
+                self._running = False
+                self._cond.notify()
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                logger.warning("⚠️  Sink %s: punti non inviati entro il tempo massimo di chiusura", self.name)
+                # I retry in corso rinunciano al prossimo tentativo
+                self._abort_retries.set()
+                self._thread.join()
+            self._thread = None
+        self.on_close()
+
+    def on_close(self):
+        """Rilascia le risorse del sink dopo l'invio dei punti rimasti."""
+
+    def get_stats(self) -> dict:
+        with self._cond:
+            return {
+                **self.stats,
+                'depth': len(self._buffer),
+                'healthy': int(self.health == 'ok'),
+                'health': self.health,
+            }
+
+
+class InfluxSink(Sink):
+    """
+    Punti in line protocol verso un client InfluxDB (InfluxdbClient, AsyncInfluxWriter
+    o BackfillWriter), che li raccoglie a sua volta nei propri batch HTTP.
+    """
+
+    def __init__(self, name, client, serializer, wrap_write=None, **policy):
+        """
+        Args:
+            client: Client con write(riga)
+            serializer: LineProtocolSerializer
+            wrap_write: Funzione che adatta write_lines al thread del sink (es. per eseguirla
+                nell'event loop asyncio una volta per batch)
+        """
+        super().__init__(name, **policy)
+        self.client = client
+        self._serializer = serializer
+        self._write_lines = wrap_write(self.write_lines) if wrap_write is not None else self.write_lines
+
+    def write_lines(self, lines) -> bool:
+        """Passa le righe al client; False se il client ne rifiuta una."""
+        for line in lines:
+            if self.client.write(line) is False:
+                return False
+        return True
+
+    def send(self, points):
+        lines = []
+        for point_dict in points:
+            line = self._serializer.serialize(point_dict)
+            if line is None:
+                logger.warning("⚠️  Punto senza campi validi, ignorato: %s", point_dict['measurement'])
+                continue
+            lines.append(line)
+        if lines and self._write_lines(lines) is False:
+            raise IOError(f"InfluxDB {self.client.bucket} non inizializzato")
+
+    def get_stats(self) -> dict:
+        stats = super().get_stats()
+        # InfluxDB non raggiungibile: i punti finiscono nello spool del client, il sink non è sano
+        if getattr(self.client, 'healthy', True) is False and stats['health'] == 'ok':
+            stats['health'] = 'spooling'
+            stats['healthy'] = 0
+        stats.update({f"influxdb_{key}": value for key, value in self.client.get_stats().items()})
+        return stats
+
+
+class HomeAssistantSink(Sink):
+    """
+    Campi di telemetria e metriche personalizzate verso HomeAssistantPublisher, che li
+    raccoglie per nodo e pubblica uno stato JSON solo quando cambiano.
+    """
+
+    MEASUREMENTS = ('telemetry', 'custom_metrics')
+
+    def __init__(self, name, publisher, **policy):
+        super().__init__(name, **policy)
+        self.publisher = publisher
+
+    def write(self, point_dict) -> bool:
+        # Gli altri punti non interessano Home Assistant: non occupano la coda
+        if point_dict['measurement'] not in self.MEASUREMENTS:
+            return True
+        return super().write(point_dict)
+
+    def send(self, points):
+        for point_dict in points:
+            self.publisher.update(point_dict['tags']['node_id'], point_dict['fields'])
+
+
+class FileSink(Sink):
+    """
+    Punti in un file locale, in line protocol o JSONL, con rotazione per dimensione
+    (file.1, file.2, ... fino a `backups` file precedenti).
+    """
+
+    def __init__(self, name, path, serializer, file_format='line', max_bytes=100 * 1024 * 1024, backups=5, **policy):
+        super().__init__(name, **policy)
+        if file_format not in ('line', 'jsonl'):
+            raise ValueError(f"Sink {name}: formato '{file_format}' non valido (line o jsonl)")
+        self.path = path
+        self.format = file_format
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._serializer = serializer
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "ab")
+        self.stats['rotations'] = 0
+
+    def _format(self, point_dict):
+        if self.format == 'jsonl':
+            return json.dumps(point_dict, separators=(',', ':')).encode('utf-8')
+        return self._serializer.serialize(point_dict)
+
+    def send(self, points):
+        lines = [line for line in map(self._format, points) if line is not None]
+        if not lines:
+            return
+        self._file.write(b"\n".join(lines) + b"\n")
+        self._file.flush()
+        if self.max_bytes and self._file.tell() >= self.max_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        self._file.close()
+        if self.backups:
+            for index in range(self.backups - 1, 0, -1):
+                if os.path.exists(f"{self.path}.{index}"):
+                    os.replace(f"{self.path}.{index}", f"{self.path}.{index + 1}")
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._file = open(self.path, "ab")
+        with self._cond:
+            self.stats['rotations'] += 1
+
+    def on_close(self):
+        self._file.close()
+
+
+class LogSink(Sink):
+    """Punti scritti nel log, senza salvarli (--dry-run)."""
+
+    def send(self, points):
+        for point_dict in points:
+            logger.info("🚀 dry-run -> point_dict: %s", point_dict)
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+Spool su disco per i punti line protocol che non è stato possibile scrivere in InfluxDB.
+
+I punti vengono aggiunti in coda a file segmento (rotazione per dimensione, gzip
+opzionale) e riletti in batch grandi quando InfluxDB torna disponibile. La posizione
+di lettura viene salvata in modo atomico solo dopo che il batch è stato scritto:
+dopo un crash il batch non confermato viene riletto, e poiché un punto con stessa
+measurement, tag e timestamp sovrascrive quello esistente la riscrittura non crea
+duplicati in InfluxDB.
+"""
+import gzip
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PREFIX = "segment-"
+OFFSETS_FILE = "offsets.json"
+
+
+class DiskSpool:
+    """
+    Coda append-only su disco divisa in segmenti, con limite di occupazione.
+
+    Quando lo spazio supera `max_bytes` vengono eliminati i segmenti più vecchi
+    (i dati più vecchi sono i primi a essere scartati).
+    """
+
+    def __init__(self, directory: str, segment_bytes: int = 16 * 1024 * 1024,
+                 max_bytes: int = 1024 * 1024 * 1024, compress: bool = False):
+        """
+        Args:
+            directory: Directory dei segmenti (creata se non esiste)
+            segment_bytes: Dimensione oltre la quale si apre un nuovo segmento
+            max_bytes: Occupazione massima su disco di tutti i segmenti
+            compress: Se True i segmenti sono scritti in gzip
+        """
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self._lock = threading.Lock()
+        self._writer = None
+        self._writer_seq = None
+        self._writer_bytes = 0
+        # Lettore del segmento in rilettura, tenuto aperto tra un batch e l'altro:
+        # riaprire un segmento gzip e fare seek lo decomprime ogni volta dall'inizio
+        self._reader = None
+        self._reader_seq = None
+        self._reader_offset = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._segments = self._list_segments()
+        self._offset = self._load_offsets()
+        # Occupazione su disco aggiornata a ogni scrittura ed eliminazione, senza stat dei segmenti
+        self._disk_bytes = self._disk_usage()
+
+        self.stats = {
+            'appended_points': 0,
+            'replayed_points': 0,
+            'dropped_segments': 0,
+            'dropped_bytes': 0,
+        }
+
+    # Segmenti e offset
+
+    def _segment_name(self, seq):
+        suffix = ".lp.gz" if self.compress else ".lp"
+        return f"{SEGMENT_PREFIX}{seq:012d}{suffix}"
+
+    def _segment_path(self, seq):
+        for suffix in (".lp", ".lp.gz"):
+            path = os.path.join(self.directory, f"{SEGMENT_PREFIX}{seq:012d}{suffix}")
+            if os.path.exists(path):
+                return path
+        return os.path.join(self.directory, self._segment_name(seq))
+
+    def _list_segments(self):
+        segments = []
+        for name in os.listdir(self.directory):
+            if name.startswith(SEGMENT_PREFIX):
+                try:
+                    segments.append(int(name[len(SEGMENT_PREFIX):].split(".")[0]))
+                except ValueError:
+                    continue
+        return sorted(segments)
+
+    def _load_offsets(self):
+        # {"segment": seq, "offset": byte non compressi già confermati nel segmento}
+        try:
+            with open(os.path.join(self.directory, OFFSETS_FILE), "r") as f:
+                data = json.load(f)
+                return data["segment"], data["offset"]
+        except (OSError, ValueError, KeyError):
+            return (self._segments[0] if self._segments else 0), 0
+
+    def _save_offsets(self):
+        path = os.path.join(self.directory, OFFSETS_FILE)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"segment": self._offset[0], "offset": self._offset[1]}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _disk_usage(self):
+        total = 0
+        for seq in self._segments:
+            try:
+                total += os.path.getsize(self._segment_path(seq))
+            except OSError:
+                pass
+        return total
+
+    # Scrittura
+
+    def _open_writer(self):
+        seq = (self._segments[-1] + 1) if self._segments else 0
+        path = os.path.join(self.directory, self._segment_name(seq))
+        self._writer = gzip.open(path, "ab") if self.compress else open(path, "ab")
+        self._writer_seq = seq
+        self._writer_bytes = os.fstat(self._writer.fileno()).st_size
+        self._segments.append(seq)
+
+    def _close_writer(self):
+        if self._writer is not None:
+            self._writer.close()
+            # La chiusura di un segmento gzip aggiunge il trailer
+            try:
+                self._disk_bytes += os.path.getsize(self._segment_path(self._writer_seq)) - self._writer_bytes
+            except OSError:
+                pass
+            self._writer = None
+            self._writer_seq = None
+            self._writer_bytes = 0
+
+    def append(self, data) -> int:
+        """
+        Aggiunge righe line protocol allo spool, con un solo fsync per chiamata:
+        i chiamanti passano batch interi, non singoli punti.
+
+        Args:
+            data: bytes o str con uno o più punti separati da newline
+
+        Returns:
+            int: Numero di punti aggiunti
+        """
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        data = data.strip(b"\n")
+        if not data:
+            return 0
+        points = data.count(b"\n") + 1
+        with self._lock:
+            if self._writer is None:
+                self._open_writer()
+            self._writer.write(data + b"\n")
+            self._writer.flush()
+            os.fsync(self._writer.fileno())
+            size = os.fstat(self._writer.fileno()).st_size
+            self._disk_bytes += size - self._writer_bytes
+            self._writer_bytes = size
+            if size >= self.segment_bytes:
+                self._close_writer()
+            self.stats['appended_points'] += points
+            self._enforce_limit()
+        return points
+
+    def _enforce_limit(self):
+        # Elimina i segmenti più vecchi finché l'occupazione rientra nel limite
+        while len(self._segments) > 1 and self._disk_bytes > self.max_bytes:
+            seq = self._segments.pop(0)
+            if seq == self._reader_seq:
+                self._close_reader()
+            path = self._segment_path(seq)
+            size = os.path.getsize(path)
+            os.remove(path)
+            self._disk_bytes -= size
+            self.stats['dropped_segments'] += 1
+            self.stats['dropped_bytes'] += size
+            if self._offset[0] <= seq:
+                self._offset = (self._segments[0], 0)
+                self._save_offsets()
+            logger.warning("⚠️  Spool pieno: eliminato il segmento %s (%s byte)", seq, size)
+
+    # Lettura
+
+    def _reader_at(self, seq, offset):
+        # Riusa il lettore se è già nella posizione richiesta (caso normale: batch confermato)
+        if self._reader is None or self._reader_seq != seq or self._reader_offset != offset:
+            self._close_reader()
+            path = self._segment_path(seq)
+            self._reader = gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")
+            self._reader.seek(offset)
+            self._reader_seq = seq
+            self._reader_offset = offset
+        return self._reader
+
+    def _close_reader(self):
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+            self._reader_seq = None
+
+    def read_batch(self, max_points: int = 5000):
+        """
+        Legge il prossimo batch di punti non ancora confermati.
+
+        Returns:
+            tuple: (bytes con i punti, posizione da passare a commit) oppure (None, None) se vuoto
+        """
+        with self._lock:
+            while self._segments:
+                seq, offset = self._offset
+                if seq not in self._segments:
+                    seq, offset = self._segments[0], 0
+                if seq == self._writer_seq and self.compress:
+                    # Un segmento gzip aperto non si può leggere fino in fondo (manca il trailer):
+                    # lo si chiude, le prossime scritture vanno in un nuovo segmento
+                    self._close_writer()
+                lines = []
+                size = 0
+                reader = self._reader_at(seq, offset)
+                try:
+                    while len(lines) < max_points:
+                        line = reader.readline()
+                        if not line.endswith(b"\n"):
+                            if line:
+                                # Riga incompleta (scrittura interrotta o in corso): si riprova più tardi
+                                self._close_reader()
+                            break
+                        lines.append(line)
+                        size += len(line)
+                except EOFError:
+                    # Segmento gzip non chiuso (in scrittura o dopo un crash): si usa quanto letto
+                    self._close_reader()
+                if self._reader is not None:
+                    self._reader_offset = offset + size
+                if lines:
+                    return b"".join(lines).rstrip(b"\n"), (seq, offset + size)
+                if seq == self._writer_seq or seq == self._segments[-1]:
+                    return None, None
+                # Segmento completamente confermato: si passa al successivo
+                self._remove_segment(seq)
+                self._offset = (self._segments[0], 0) if self._segments else (seq + 1, 0)
+                self._save_offsets()
+            return None, None
+
+    def commit(self, position, points: int = 0):
+        """
+        Conferma che i punti fino a `position` sono stati scritti nel sink.
+        """
+        with self._lock:
+            self._offset = position
+            self._save_offsets()
+            self.stats['replayed_points'] += points
+
+    def _remove_segment(self, seq):
+        if seq == self._writer_seq:
+            self._close_writer()
+        if seq == self._reader_seq:
+            self._close_reader()
+        path = self._segment_path(seq)
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+            self._disk_bytes -= size
+        except OSError:
+            pass
+        if seq in self._segments:
+            self._segments.remove(seq)
+
+    def is_empty(self) -> bool:
+        """True se non ci sono punti da rileggere."""
+        batch, _ = self.read_batch(max_points=1)
+        return batch is None
+
+    def close(self):
+        """Chiude il segmento in scrittura e quello in rilettura."""
+        with self._lock:
+            self._close_writer()
+            self._close_reader()
+
+    def get_stats(self) -> dict:
+        """Restituisce i contatori e l'occupazione su disco."""
+        with self._lock:
+            return {**self.stats, 'segments': len(self._segments), 'disk_bytes': self._disk_bytes}
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Supervisore dei processi di ingest (--workers N).
+
+Ogni processo ha le proprie connessioni MQTT e InfluxDB e si iscrive allo stesso
+gruppo di sottoscrizione condivisa ($share/<gruppo>/...): il broker consegna ogni
+messaggio a un solo processo del gruppo, così l'ingest scala su più core (e su più
+repliche) senza scritture duplicate.
+
+Il supervisore riavvia i processi terminati in modo inatteso, con attesa crescente
+se continuano a fallire, e raccoglie le statistiche che i processi inviano
+periodicamente su una multiprocessing.Queue per esporle sull'endpoint delle metriche.
+"""
+import importlib.util
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+
+from metrics import merge_snapshots
+
+logger = logging.getLogger(__name__)
+
+# Un processo che termina prima di questo tempo dall'avvio è considerato instabile
+STABLE_AFTER_S = 30.0
+
+
+class WorkerSupervisor:
+    """
+    Avvia e sorveglia `processes` processi che eseguono target(index, stats_queue, *args).
+    """
+
+    def __init__(self, target, processes: int, args=(), restart_delay: float = 1.0,
+                 max_restart_delay: float = 60.0, stop_timeout: float = 60.0):
+        """
+        Args:
+            target: Funzione eseguita in ogni processo (importabile: i processi sono avviati con spawn)
+            processes: Numero di processi
+            args: Argomenti aggiuntivi per target
+            restart_delay: Attesa prima di riavviare un processo terminato
+            max_restart_delay: Attesa massima tra riavvii consecutivi di un processo instabile
+            stop_timeout: Secondi concessi ai processi per svuotare code e batch in chiusura
+        """
+        if processes < 1:
+            raise ValueError("processes deve essere almeno 1")
+        self.target = target
+        self.processes = processes
+        self.args = tuple(args)
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.stop_timeout = stop_timeout
+
+        # spawn: nessun lock o thread ereditato dal supervisore (endpoint metriche, feeder della Queue)
+        self._context = multiprocessing.get_context("spawn")
+        self.stats_queue = self._context.Queue()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._workers = [None] * processes
+        self._started_at = [0.0] * processes
+        self._next_start = [0.0] * processes
+        self._delays = [restart_delay] * processes
+        self._reports = {}  # indice -> ultimo report del processo
+        self._retired_metrics = {}  # metriche dei processi terminati, per contatori monotoni
+        self.restarts = [0] * processes
+
+    def start(self):
+        for index in range(self.processes):
+            self._spawn(index)
+        logger.info("👥 Avviati %d processi di ingest", self.processes)
+
+    def _spawn(self, index):
+        process = self._context.Process(target=self.target, args=(index, self.stats_queue) + self.args,
+                                        name=f"ingest-worker-{index}")
+        process.start()
+        self._workers[index] = process
+        self._started_at[index] = time.monotonic()
+        logger.info("🚀 Processo di ingest %d avviato (pid %d)", index, process.pid)
+
+    def run(self):
+        """Sorveglia i processi fino a stop(); da chiamare nel thread principale."""
+        while not self._stop.is_set():
+            self._drain_reports(timeout=0.5)
+            self._check_workers()
+
+    def stop(self):
+        """Richiede l'arresto: run() termina e i processi ricevono SIGTERM."""
+        self._stop.set()
+
+    def install_signal_handlers(self):
+        """SIGTERM e SIGINT fermano il supervisore (e di conseguenza i processi)."""
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.stop())
+        signal.signal(signal.SIGINT, lambda signum, frame: self.stop())
+
+    def shutdown(self):
+        """
+        Invia SIGTERM ai processi e attende che scrivano i dati in sospeso;
+        oltre stop_timeout i processi rimasti vengono terminati con SIGKILL.
+        """
+        logger.info("⏹️  Arresto dei processi di ingest...")
+        for process in self._workers:
+            if process is not None and process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + self.stop_timeout
+        for index, process in enumerate(self._workers):
+            if process is None:
+                continue
+            while process.is_alive() and time.monotonic() < deadline:
+                self._drain_reports(timeout=0.1)
+                process.join(0.1)
+            if process.is_alive():
+                logger.warning("⚠️  Processo di ingest %d non terminato entro %.0f s, SIGKILL", index, self.stop_timeout)
+                process.kill()
+                process.join()
+        self._drain_reports(timeout=0)
+        logger.info("📊 Statistiche supervisore: %s", self.get_stats())
+
+    def _check_workers(self):
+        now = time.monotonic()
+        for index, process in enumerate(self._workers):
+            if process is None:
+                if now >= self._next_start[index] and not self._stop.is_set():
+                    self.restarts[index] += 1
+                    self._spawn(index)
+                continue
+            if process.is_alive():
+                continue
+            process.join()
+            logger.error("💥 Processo di ingest %d terminato (exit code %s)", index, process.exitcode)
+            self._retire(index)
+            # Riavvii ravvicinati di un processo che fallisce subito: attesa raddoppiata
+            if now - self._started_at[index] < STABLE_AFTER_S:
+                delay = self._delays[index]
+                self._delays[index] = min(delay * 2, self.max_restart_delay)
+            else:
+                delay = self._delays[index] = self.restart_delay
+            logger.info("🔄 Riavvio del processo %d tra %.0f s", index, delay)
+            self._workers[index] = None
+            self._next_start[index] = now + delay
+
+    def _retire(self, index):
+        # Le metriche del processo terminato restano nei totali: i contatori non ripartono da zero
+        with self._lock:
+            report = self._reports.pop(index, None)
+            if report is not None:
+                self._retired_metrics = merge_snapshots([self._retired_metrics, report['metrics']])
+
+    def _drain_reports(self, timeout):
+        try:
+            item = self.stats_queue.get(timeout=timeout) if timeout else self.stats_queue.get_nowait()
+            while True:
+                index, pid, report = item
+                process = self._workers[index]
+                # Report arrivati dopo la fine del processo sono già conteggiati in _retired_metrics
+                if process is not None and process.pid == pid:
+                    with self._lock:
+                        self._reports[index] = report
+                item = self.stats_queue.get_nowait()
+        except queue.Empty:
+            pass
+
+    def metrics_snapshot(self) -> dict:
+        """Somma delle metriche di tutti i processi, compresi quelli già terminati."""
+        with self._lock:
+            snapshots = [self._retired_metrics] + [report['metrics'] for report in self._reports.values()]
+        return merge_snapshots(snapshots)
+
+    def component_stats(self, name) -> dict:
+        """Somma dei valori numerici di get_stats() di un componente sui processi attivi."""
+        with self._lock:
+            reports = list(self._reports.values())
+        total = {}
+        for report in reports:
+            for key, value in report['stats'].get(name, {}).items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    total[key] = total.get(key, 0) + value
+        return total
+
+    def worker_values(self, key) -> dict:
+        """Valore `key` dei report, per processo: {(indice,): valore}."""
+        with self._lock:
+            return {(str(index),): report.get(key) for index, report in self._reports.items()}
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            mqtt_connected = sum(1 for report in self._reports.values() if report.get('mqtt_connected'))
+        return {
+            'processes': self.processes,
+            'alive': sum(1 for process in self._workers if process is not None and process.is_alive()),
+            'restarts': sum(self.restarts),
+            'mqtt_connected': mqtt_connected,
+        }
+
+
+def run_script_function(path, function_name, *args):
+    """
+    Esegue function_name(*args) dallo script `path` nel processo corrente.
+
+    Con spawn le funzioni di __main__ non sono importabili nei processi figli quando il
+    servizio è avviato come directory (python meshtasticMqttToInfluxDb): lo script viene
+    caricato come modulo. Da usare con functools.partial come target del supervisore.
+    """
+    spec = importlib.util.spec_from_file_location("meshtastic_ingest_main", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return getattr(module, function_name)(*args)
+
+
+class StatsReporter:
+    """
+    Thread del processo di ingest che invia periodicamente al supervisore
+    (index, pid, report) con le statistiche raccolte da collect().
+    """
+
+    def __init__(self, stats_queue, index: int, interval: float = 5.0):
+        self.stats_queue = stats_queue
+        self.index = index
+        self.interval = interval
+        self.collect = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, collect):
+        """
+        Args:
+            collect: Funzione senza argomenti che restituisce il report del processo
+        """
+        self.collect = collect
+        self._thread = threading.Thread(target=self._run, name="worker-stats", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Ferma il thread e invia un ultimo report con i valori finali."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self.report()
+
+    def report(self):
+        try:
+            self.stats_queue.put_nowait((self.index, os.getpid(), self.collect()))
+        except Exception as e:
+            logger.error("❌ Errore nell'invio delle statistiche al supervisore: %s", e)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.report()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Sottoscrizioni MQTT configurabili e instradamento dei messaggi per topic.
+
+MQTT_SUBSCRIPTIONS elenca i filtri da sottoscrivere e, per ciascuno, come
+elaborare i messaggi ricevuti:
+
+    "{root}/+/2/json/#=json; {root}/+/2/e/#=protobuf; {root}/+/2/map/#=ignore"
+
+I filtri (con i caratteri jolly MQTT `+` e `#`, `{root}` = MQTT_ROOT_TOPIC)
+sono compilati in un trie: il topic di ogni messaggio viene confrontato un
+livello alla volta, con una cache dei topic già visti. Se più filtri
+corrispondono vince il più specifico (livello esatto prima di `+`, `+` prima
+di `#`). Ogni route conta messaggi, byte e tempo di elaborazione.
+"""
+import threading
+import time
+
+# Oltre questo numero di topic distinti la cache viene svuotata
+CACHE_SIZE = 10000
+
+
+def parse_subscriptions(value: str, root_topic: str):
+    """
+    Interpreta MQTT_SUBSCRIPTIONS ("filtro=handler; filtro2=handler2"; handler di default "auto").
+    Vuota = tutto il traffico sotto MQTT_ROOT_TOPIC.
+
+    Returns:
+        list: [(filtro, handler), ...]
+    """
+    if not value.strip():
+        value = "{root}/#=auto"
+    subscriptions = []
+    for item in value.split(';'):
+        item = item.strip()
+        if not item:
+            continue
+        topic_filter, _, handler = item.partition('=')
+        topic_filter = topic_filter.strip()
+        if root_topic:
+            topic_filter = topic_filter.replace('{root}', root_topic)
+        else:
+            # Senza MQTT_ROOT_TOPIC (es. --replay) il livello {root} viene omesso
+            topic_filter = topic_filter.replace('{root}/', '').replace('{root}', '')
+        validate_filter(topic_filter)
+        subscriptions.append((topic_filter, handler.strip() or 'auto'))
+    if not subscriptions:
+        raise ValueError("MQTT_SUBSCRIPTIONS: nessun filtro configurato")
+    return subscriptions
+
+
+def validate_filter(topic_filter: str):
+    """Solleva ValueError se il filtro non è un topic filter MQTT valido."""
+    if not topic_filter:
+        raise ValueError("MQTT_SUBSCRIPTIONS: filtro vuoto")
+    if topic_filter.startswith('$share/'):
+        raise ValueError(f"MQTT_SUBSCRIPTIONS: '{topic_filter}' - per la sottoscrizione condivisa usa MQTT_SHARED_GROUP")
+    levels = topic_filter.split('/')
+    for index, level in enumerate(levels):
+        if '#' in level and (level != '#' or index != len(levels) - 1):
+            raise ValueError(f"MQTT_SUBSCRIPTIONS: '#' ammesso solo come ultimo livello in '{topic_filter}'")
+        if '+' in level and level != '+':
+            raise ValueError(f"MQTT_SUBSCRIPTIONS: '+' deve occupare un intero livello in '{topic_filter}'")
+
+
+class Route:
+    """Un filtro con il suo handler e i contatori di costo."""
+    __slots__ = ("topic_filter", "handler", "handler_name", "messages", "bytes", "seconds")
+
+    def __init__(self, topic_filter, handler, handler_name):
+        self.topic_filter = topic_filter
+        self.handler = handler
+        self.handler_name = handler_name
+        self.messages = 0
+        self.bytes = 0
+        self.seconds = 0.0
+
+
+class _Node:
+    __slots__ = ("children", "plus", "hash", "route")
+
+    def __init__(self):
+        self.children = {}
+        self.plus = None
+        self.hash = None  # route del filtro che termina con '#' a questo livello
+        self.route = None  # route del filtro che termina esattamente qui
+
+
+class TopicRouter:
+    """
+    Trie dei filtri MQTT configurati.
+    """
+
+    def __init__(self):
+        self._root = _Node()
+        self.routes = []
+        self._cache = {}
+        self._lock = threading.Lock()
+        self.unmatched = 0
+
+    def add(self, topic_filter: str, handler, handler_name: str = ""):
+        validate_filter(topic_filter)
+        route = Route(topic_filter, handler, handler_name)
+        node = self._root
+        levels = topic_filter.split('/')
+        for level in levels:
+            if level == '#':
+                if node.hash is None:
+                    node.hash = route
+                break
+            if level == '+':
+                if node.plus is None:
+                    node.plus = _Node()
+                node = node.plus
+            else:
+                node = node.children.setdefault(level, _Node())
+        else:
+            if node.route is None:
+                node.route = route
+        self.routes.append(route)
+        self._cache.clear()
+        return route
+
+    def match(self, topic: str):
+        """Route del filtro più specifico che corrisponde al topic, o None."""
+        route = self._cache.get(topic, False)
+        if route is not False:
+            return route
+        levels = topic.split('/')
+        # I topic che iniziano con '$' (es. $SYS) non corrispondono ai filtri con jolly al primo livello
+        route = self._match(self._root, levels, 0, not topic.startswith('$'))
+        if len(self._cache) >= CACHE_SIZE:
+            self._cache.clear()
+        self._cache[topic] = route
+        return route
+
+    def _match(self, node, levels, index, wildcards):
+        if index == len(levels):
+            # "a/#" corrisponde anche ad "a"
+            return node.route or node.hash
+        child = node.children.get(levels[index])
+        if child is not None:
+            route = self._match(child, levels, index + 1, True)
+            if route is not None:
+                return route
+        if wildcards and node.plus is not None:
+            route = self._match(node.plus, levels, index + 1, True)
+            if route is not None:
+                return route
+        return node.hash if wildcards else None
+
+    def dispatch(self, topic, payload, receive_ts):
+        """Elabora il messaggio con l'handler della sua route e ne conta il costo."""
+        route = self.match(topic)
+        if route is None:
+            with self._lock:
+                self.unmatched += 1
+            return
+        start = time.perf_counter()
+        try:
+            route.handler(topic, payload, receive_ts)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                route.messages += 1
+                route.bytes += len(payload)
+                route.seconds += elapsed
+
+    def get_stats(self) -> dict:
+        """Messaggi senza route, topic in cache e contatori per filtro (in 'routes')."""
+        with self._lock:
+            return {
+                'unmatched': self.unmatched,
+                'cached_topics': len(self._cache),
+                'routes': {
+                    route.topic_filter: {'handler': route.handler_name, 'messages': route.messages,
+                                         'bytes': route.bytes, 'seconds': round(route.seconds, 6)}
+                    for route in self.routes
+                },
+            }
@@ -1,5 +1,16 @@
 import json
 from datetime import datetime, timezone
+
+# Backend JSON veloce se disponibile (orjson accetta direttamente bytes)
+try:
+    import orjson
+    json_loads = orjson.loads
+    JSON_BACKEND = "orjson"
+except ImportError:
+    json_loads = json.loads
+    JSON_BACKEND = "json"
+
+
 class JSONSerializerWithDatetime(json.JSONEncoder):
     """
     Serializzatore JSON personalizzato che gestisce anche i datetime.
@@ -58,3 +69,19 @@ def timestamp_to_utc_datetime(timestamp):
     else:
         # Se non è un formato riconosciuto, usa il timestamp corrente
         return get_utc_timestamp()
+
+def timestamp_to_ns(timestamp):
+    """
+    Converte un timestamp Unix (secondi) o un datetime in nanosecondi interi,
+    la precisione di default del line protocol.
+    """
+    if isinstance(timestamp, int):
+        return timestamp * 1_000_000_000
+    if isinstance(timestamp, float):
+        return int(round(timestamp * 1_000_000)) * 1000
+    if isinstance(timestamp, datetime):
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        delta = timestamp - datetime(1970, 1, 1, tzinfo=timezone.utc)
+        return (delta.days * 86_400 + delta.seconds) * 1_000_000_000 + delta.microseconds * 1000
+    return timestamp_to_ns(get_utc_timestamp())
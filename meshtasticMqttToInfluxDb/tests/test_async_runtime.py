@@ -0,0 +1,165 @@
+"""
+Test per il modulo async_runtime.py
+"""
+import asyncio
+import socket
+import threading
+import time
+
+import pytest
+
+from async_runtime import AsyncIngestQueue, AsyncInfluxWriter, AsyncMqttClient
+from config import config
+from replay import FakeInfluxServer
+
+
+class TestAsyncIngestQueue:
+    """Test per la coda di ingest del runtime asyncio"""
+
+    def test_messages_are_processed_and_drained_on_stop(self):
+        received = []
+
+        async def run():
+            queue = AsyncIngestQueue(handler=lambda topic, payload, ts: received.append(topic), maxsize=100)
+            queue.start()
+            for i in range(10):
+                queue.put(f"msh/{i}", b"x")
+            await queue.stop()
+            return queue.get_stats()
+
+        stats = asyncio.run(run())
+        assert received == [f"msh/{i}" for i in range(10)]
+        assert stats['workers'][0]['processed'] == 10
+
+    def test_oldest_message_is_dropped_when_full(self):
+        received = []
+
+        async def run():
+            queue = AsyncIngestQueue(handler=lambda topic, payload, ts: received.append(topic), maxsize=2)
+            queue.start()
+            for i in range(3):
+                queue.put(f"msh/{i}", b"x")
+            await queue.stop()
+            return queue.get_stats()
+
+        stats = asyncio.run(run())
+        assert received == ["msh/1", "msh/2"]
+        assert stats['dropped'] == 1
+
+
+class TestAsyncMqttClient:
+    """Test per la connessione MQTT senza bloccare l'event loop"""
+
+    @pytest.fixture
+    def mqtt_config(self, monkeypatch):
+        for key, value in (('MQTT_HOST', '127.0.0.1'), ('MQTT_PORT', 1883), ('MQTT_USERNAME', 'u'),
+                           ('MQTT_PASSWORD', 'p'), ('MQTT_ROOT_TOPIC', 'msh')):
+            monkeypatch.setitem(config, key, value)
+
+    def test_connect_runs_outside_the_loop(self, mqtt_config):
+        async def run():
+            client = AsyncMqttClient(asyncio.get_running_loop())
+            # connect() bloccante (DNS, timeout TCP) e socket registrato da paho nel thread della connessione
+            reader, writer = socket.socketpair()
+            registered = []
+
+            def blocking_connect(host, port, keepalive):
+                time.sleep(0.3)
+                client.client.on_socket_register_write(client.client, None, reader)
+
+            client.client.connect = blocking_connect
+            client.loop.add_writer = lambda sock, callback: registered.append(threading.get_ident())
+            ticks = 0
+
+            async def ticker():
+                nonlocal ticks
+                while True:
+                    await asyncio.sleep(0.01)
+                    ticks += 1
+
+            task = asyncio.get_running_loop().create_task(ticker())
+            assert await client.connect_async()
+            await asyncio.sleep(0)
+            task.cancel()
+            reader.close()
+            writer.close()
+            return ticks, registered
+
+        ticks, registered = asyncio.run(run())
+        assert ticks >= 10
+        assert registered == [threading.get_ident()]
+
+    def test_publish_from_other_thread_runs_in_the_loop(self, mqtt_config):
+        class Result:
+            rc = 0
+
+        async def run():
+            client = AsyncMqttClient(asyncio.get_running_loop())
+            client.is_connected = True
+            published = []
+            client.client.publish = lambda *args: published.append(threading.get_ident()) or Result()
+            # Come il sink Home Assistant: publish dal proprio thread
+            result = await asyncio.to_thread(client.publish, 'ha/state', '{}')
+            return result, published
+
+        result, published = asyncio.run(run())
+        assert result is True
+        assert published == [threading.get_ident()]
+
+
+class TestAsyncInfluxWriter:
+    """Test per la scrittura batch asincrona"""
+
+    def test_batches_are_flushed_on_close(self, monkeypatch):
+        pytest.importorskip("aiohttp")
+        server = FakeInfluxServer().start()
+        monkeypatch.setitem(config, 'INFLUXDB_HOST', server.host)
+        monkeypatch.setitem(config, 'INFLUXDB_PORT', server.port)
+        monkeypatch.setitem(config, 'INFLUXDB_TOKEN', 'test')
+        monkeypatch.setitem(config, 'INFLUXDB_ORG', 'test')
+        monkeypatch.setitem(config, 'INFLUXDB_BUCKET', 'test')
+        monkeypatch.setitem(config, 'INFLUXDB_BATCH_SIZE', 10)
+        monkeypatch.setitem(config, 'SPOOL_DIR', '')
+
+        async def run():
+            writer = AsyncInfluxWriter()
+            assert await writer.init_influxdb()
+            for i in range(25):
+                writer.write(f"telemetry,node_id=!ba6a665c voltage={i} {i}".encode())
+            await writer.close()
+            return writer.get_stats()
+
+        try:
+            stats = asyncio.run(run())
+        finally:
+            server.stop()
+        assert stats['batches_written'] == 3
+        assert stats['points_written'] == 25
+        assert server.points == 25
+
+    def test_batches_left_at_close_timeout_are_spooled(self, tmp_path, monkeypatch):
+        for key in ('INFLUXDB_HOST', 'INFLUXDB_PORT', 'INFLUXDB_TOKEN', 'INFLUXDB_ORG', 'INFLUXDB_BUCKET'):
+            monkeypatch.setitem(config, key, 'test')
+        monkeypatch.setitem(config, 'INFLUXDB_BATCH_SIZE', 10)
+        monkeypatch.setitem(config, 'INFLUXDB_MAX_CLOSE_WAIT_MS', 100)
+
+        class HangingWriteApi:
+            async def write(self, bucket, org, record):
+                await asyncio.sleep(60)
+
+        async def run():
+            writer = AsyncInfluxWriter(spool_dir=str(tmp_path))
+            writer.write_api = HangingWriteApi()
+            writer.healthy = True
+            writer._semaphore = asyncio.Semaphore(1)
+            for i in range(25):
+                writer.write(f"telemetry,node_id=!ba6a665c voltage={i} {i}".encode())
+            await writer.close()
+            return writer
+
+        writer = asyncio.run(run())
+        stats = writer.get_stats()
+        assert stats['batches_failed'] == 3
+        assert stats['points_failed'] == 25
+        assert stats['points_spooled'] == 25
+        assert writer.spool.get_stats()['appended_points'] == 25
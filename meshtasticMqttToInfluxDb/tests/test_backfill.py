@@ -0,0 +1,94 @@
+"""
+Test per il modulo backfill.py
+"""
+import gzip
+import json
+
+import pytest
+
+from backfill import BackfillWriter, Checkpoint, open_records, run_backfill
+from capture import CaptureWriter
+
+
+def read_all(path):
+    with open_records(path) as (_, records):
+        return list(records)
+
+
+class TestOpenRecords:
+    """Test per la lettura dei formati di archivio"""
+
+    def test_capture_file(self, tmp_path):
+        path = str(tmp_path / "traffico.cap.gz")
+        writer = CaptureWriter(path)
+        writer.write(1.5, "msh/EU_868/2/json/LongFast/!gw", b'{"a": 1}')
+        writer.close()
+        assert read_all(path) == [(1.5, "msh/EU_868/2/json/LongFast/!gw", b'{"a": 1}')]
+
+    def test_jsonl_messages_and_mqtt_dumps(self, tmp_path):
+        path = tmp_path / "archivio.jsonl.gz"
+        with gzip.open(path, "wt") as f:
+            f.write(json.dumps({'type': 'telemetry', 'from': 1}) + "\n")
+            f.write("\n")
+            f.write("non json\n")
+            f.write(json.dumps({'tst': 10.0, 'topic': "msh/json", 'payload': {'type': 'position'}}) + "\n")
+            f.write(json.dumps({'topic': "msh/text", 'payload': "ciao"}) + "\n")
+        records = read_all(str(path))
+        assert len(records) == 5
+        assert records[0][1:] == ("", b'{"type": "telemetry", "from": 1}')
+        assert records[1] is None and records[2] is None
+        assert records[3] == (10.0, "msh/json", b'{"type": "position"}')
+        assert records[4][1:] == ("msh/text", b"ciao")
+
+
+class TestBackfillWriter:
+    """Test per la scrittura in batch e l'avanzamento del checkpoint"""
+
+    def test_batches_and_checkpoint(self):
+        written, positions = [], []
+        writer = BackfillWriter(written.append, batch_size=2, parallel=2, on_checkpoint=positions.append)
+        for i in range(5):
+            writer.write(f"m v={i}")
+            writer.mark(('f', i + 1, False))
+        writer.close()
+        assert sorted(b"\n".join(written).split(b"\n")) == [f"m v={i}".encode() for i in range(5)]
+        assert positions[-1] == ('f', 5, False)
+        assert writer.get_stats()['points_written'] == 5
+
+    def test_failed_batch_stops_the_checkpoint(self):
+        positions = []
+
+        def write_batch(data):
+            if b"v=2" in data:
+                raise IOError("InfluxDB non raggiungibile")
+
+        writer = BackfillWriter(write_batch, batch_size=1, parallel=1, max_retries=0,
+                                on_checkpoint=positions.append)
+        with pytest.raises(IOError):
+            for i in range(5):
+                writer.write(f"m v={i}")
+                writer.mark(('f', i + 1, False))
+            writer.close()
+        assert positions[-1] == ('f', 2, False)
+
+
+class TestRunBackfill:
+    """Test per la ripresa dal checkpoint"""
+
+    def test_resume_from_checkpoint(self, tmp_path):
+        path = tmp_path / "archivio.jsonl"
+        path.write_text("".join(json.dumps({'n': i}) + "\n" for i in range(10)))
+        checkpoint = Checkpoint(str(tmp_path / "checkpoint.json"))
+        checkpoint.update((str(path), 6, False))
+
+        written = []
+        writer = BackfillWriter(written.append, batch_size=3,
+                                on_checkpoint=Checkpoint(checkpoint.path).update)
+        handler = lambda topic, payload, receive_ts: writer.write(payload)
+        assert run_backfill([str(path)], handler, writer, Checkpoint(checkpoint.path)) == 4
+        assert b"\n".join(written).split(b"\n") == [json.dumps({'n': i}).encode() for i in range(6, 10)]
+        assert Checkpoint(checkpoint.path).get(str(path)) == {'records': 10, 'done': True}
+
+        # File completato: una nuova esecuzione non lo rilegge
+        writer = BackfillWriter(written.append)
+        assert run_backfill([str(path)], handler, writer, Checkpoint(checkpoint.path)) == 0
@@ -0,0 +1,78 @@
+"""
+Test per i moduli capture.py e replay.py
+"""
+import pytest
+
+from capture import CaptureWriter, read_capture, is_capture_file
+from ingest_queue import IngestQueue
+from replay import feed_capture, parse_speed, LatencyRecorder
+
+MESSAGES = [
+    (1000.0, "msh/EU_868/2/json/MeshPodere/!ba6a665c", b'{"type": "telemetry"}'),
+    (1000.5, "msh/EU_868/2/e/MeshPodere/!ba6a665c", b"\x00\x01\x02"),
+    (1002.0, "msh/EU_868/2/stat/!ba6a665c", b"online"),
+]
+
+
+class TestCapture:
+    """Test per la registrazione del traffico"""
+
+    @pytest.mark.parametrize("name", ["traffic.cap", "traffic.cap.gz"])
+    def test_roundtrip_and_append(self, tmp_path, name):
+        path = str(tmp_path / name)
+        writer = CaptureWriter(path)
+        for message in MESSAGES[:2]:
+            writer.write(*message)
+        writer.close()
+        # Riaprendo il file i nuovi messaggi vengono aggiunti in coda
+        writer = CaptureWriter(path)
+        writer.write(*MESSAGES[2])
+        writer.close()
+
+        assert is_capture_file(path)
+        assert list(read_capture(path)) == MESSAGES
+
+    def test_truncated_record_is_ignored(self, tmp_path):
+        path = str(tmp_path / "traffic.cap")
+        writer = CaptureWriter(path)
+        for message in MESSAGES:
+            writer.write(*message)
+        writer.close()
+        with open(path, "r+b") as f:
+            f.truncate(f.seek(0, 2) - 3)
+        assert list(read_capture(path)) == MESSAGES[:2]
+
+    def test_invalid_file_is_rejected(self, tmp_path):
+        path = tmp_path / "other.jsonl"
+        path.write_bytes(b'{"a": 1}\n')
+        assert not is_capture_file(str(path))
+        with pytest.raises(ValueError):
+            list(read_capture(str(path)))
+
+
+class TestReplay:
+    """Test per la riproduzione di una cattura"""
+
+    def test_parse_speed(self):
+        assert parse_speed("max") is None
+        assert parse_speed("10") == 10.0
+        with pytest.raises(ValueError):
+            parse_speed("0")
+
+    def test_feed_waits_instead_of_dropping(self, tmp_path):
+        path = str(tmp_path / "traffic.cap")
+        writer = CaptureWriter(path)
+        for i in range(200):
+            writer.write(1000.0 + i, f"msh/test/{i}", b"x")
+        writer.close()
+
+        received = []
+        recorder = LatencyRecorder(lambda topic, payload, receive_ts: received.append(topic))
+        queue = IngestQueue(handler=recorder, maxsize=5, workers=2)
+        queue.start()
+        assert feed_capture(path, queue) == 200
+        queue.stop()
+
+        assert len(received) == 200
+        assert queue.get_stats()['dropped'] == 0
+        assert 0 <= recorder.percentile(50) <= recorder.percentile(99)
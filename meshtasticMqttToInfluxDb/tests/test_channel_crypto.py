@@ -0,0 +1,73 @@
+"""
+Test per la decifratura dei pacchetti (channel_crypto.py, meshpacket.py)
+"""
+import base64
+import json
+
+from meshtastic.protobuf import mesh_pb2, mqtt_pb2, portnums_pb2, telemetry_pb2
+
+from channel_crypto import ChannelKeyring, DEFAULT_KEY, channel_hash, expand_psk
+from meshpacket import envelope_to_json_message
+
+
+def make_envelope(keyring, channel_name, key, data, packet_id=618060111, from_node=0xba0c76e8):
+    """Costruisce un ServiceEnvelope con il Data cifrato come farebbe un nodo"""
+    envelope = mqtt_pb2.ServiceEnvelope(channel_id=channel_name, gateway_id="!ba6a665c")
+    packet = envelope.packet
+    setattr(packet, "from", from_node)
+    packet.to = 0xffffffff
+    packet.id = packet_id
+    packet.channel = channel_hash(channel_name, key)
+    packet.rx_time = 1757432919
+    packet.hop_start = 3
+    packet.hop_limit = 2
+    packet.encrypted = keyring.decrypt(key, packet_id, from_node, data.SerializeToString())
+    return envelope.SerializeToString()
+
+
+class TestChannelCrypto:
+    """Test per chiavi e hash dei canali"""
+
+    def test_default_psk(self):
+        assert expand_psk("AQ==") == DEFAULT_KEY
+        assert expand_psk("Ag==")[-1] == DEFAULT_KEY[-1] + 1
+        assert expand_psk("AA==") == b""
+
+    def test_longfast_channel_hash(self):
+        # Hash noto del canale LongFast con la chiave di default
+        assert channel_hash("LongFast", expand_psk("AQ==")) == 8
+
+    def test_encrypted_telemetry_is_converted(self):
+        keyring = ChannelKeyring([("LongFast", "AQ==")])
+        telemetry = telemetry_pb2.Telemetry(time=26899)
+        telemetry.device_metrics.battery_level = 101
+        telemetry.device_metrics.voltage = 4.25
+        data = mesh_pb2.Data(portnum=portnums_pb2.TELEMETRY_APP, payload=telemetry.SerializeToString())
+
+        message = envelope_to_json_message(make_envelope(keyring, "LongFast", DEFAULT_KEY, data), keyring)
+
+        assert message["type"] == "telemetry"
+        assert message["sender"] == "!ba6a665c"
+        assert message["from"] == 0xba0c76e8
+        assert message["timestamp"] == 1757432919
+        assert message["hops_away"] == 1
+        assert message["payload"] == {"battery_level": 101, "voltage": 4.25}
+
+    def test_text_custom_metrics_payload(self):
+        keyring = ChannelKeyring([("LongFast", "AQ==")])
+        text = json.dumps({"type": "custom_metrics", "metrics": [{"name": "pump", "value": 1}]})
+        data = mesh_pb2.Data(portnum=portnums_pb2.TEXT_MESSAGE_APP, payload=text.encode())
+
+        message = envelope_to_json_message(make_envelope(keyring, "LongFast", DEFAULT_KEY, data), keyring)
+
+        assert message["type"] == "text"
+        assert message["payload"]["type"] == "custom_metrics"
+
+    def test_unknown_key_is_skipped(self):
+        other_key = base64.b64encode(bytes(range(16))).decode()
+        keyring = ChannelKeyring([("LongFast", "AQ==")])
+        data = mesh_pb2.Data(portnum=portnums_pb2.TEXT_MESSAGE_APP, payload=b"ciao")
+        envelope = make_envelope(keyring, "Privato", expand_psk(other_key), data)
+
+        assert envelope_to_json_message(envelope, keyring) is None
+        assert envelope_to_json_message(envelope, ChannelKeyring([("Privato", other_key)]))["payload"] == {"text": "ciao"}
@@ -0,0 +1,144 @@
+"""
+Test per il modulo compression.py
+"""
+import pytest
+
+from compression import PointCompressor, distance_m, parse_compression
+
+
+def point(seconds, measurement='telemetry', node_id='!00000001', **fields):
+    return {'measurement': measurement, 'time': (1_700_000_000 + seconds) * 1_000_000_000,
+            'tags': {'node_id': node_id}, 'fields': fields}
+
+
+def written(compressor, points):
+    """Punti scritti come (secondi, campi), inclusi i valori trattenuti alla chiusura."""
+    out = [p for source in points for p in compressor.compress(source)] + compressor.flush()
+    return [(p['time'] // 1_000_000_000 - 1_700_000_000, p['fields']) for p in out]
+
+
+class TestParseCompression:
+    """Test per il parsing di COMPRESSION"""
+
+    def test_rules_and_options(self):
+        rules = parse_compression("telemetry=deadband:abs=0.01,rel=0.02; telemetry.uptime_seconds=swinging_door:"
+                                  "abs=300,heartbeat=60; position=distance:meters=25; telemetry.iaq=off", heartbeat=900)
+        assert rules[('telemetry', None)].absolute == 0.01 and rules[('telemetry', None)].relative == 0.02
+        assert rules[('telemetry', None)].heartbeat == 900
+        assert rules[('telemetry', 'uptime_seconds')].mode == 'swinging_door'
+        assert rules[('telemetry', 'uptime_seconds')].heartbeat == 60
+        assert rules[('position', None)].meters == 25
+        assert rules[('telemetry', 'iaq')].mode == 'off'
+
+    @pytest.mark.parametrize("value", ["telemetry", "telemetry=zip", "telemetry=deadband:meters=3",
+                                       "position.latitude=distance", "telemetry=deadband:abs=x",
+                                       "telemetry=deadband:abs=-1", "telemetry=off;telemetry=deadband"])
+    def test_invalid_rules(self, value):
+        with pytest.raises(ValueError):
+            parse_compression(value)
+
+
+class TestDeadband:
+    """Test per deadband assoluta e relativa e per l'heartbeat"""
+
+    def test_absolute_deadband_per_field(self):
+        compressor = PointCompressor(parse_compression("telemetry=deadband:abs=0.05"))
+        out = written(compressor, [point(0, voltage=4.10, battery_level=90.0),
+                                   point(60, voltage=4.12, battery_level=90.0),
+                                   point(120, voltage=4.20, battery_level=90.0),
+                                   point(180, voltage=4.18, battery_level=90.0)])
+        assert out == [(0, {'voltage': 4.10, 'battery_level': 90.0}), (120, {'voltage': 4.20})]
+        stats = compressor.get_stats()
+        assert stats['points_in'] == 4 and stats['points_dropped'] == 2 and stats['fields_out'] == 3
+
+    def test_relative_deadband(self):
+        compressor = PointCompressor(parse_compression("telemetry=deadband:rel=0.1"))
+        out = written(compressor, [point(0, lux=1000.0), point(1, lux=1090.0), point(2, lux=1200.0)])
+        assert [seconds for seconds, _ in out] == [0, 2]
+
+    def test_heartbeat_uses_packet_time(self):
+        compressor = PointCompressor(parse_compression("telemetry=deadband:abs=1,heartbeat=600"))
+        out = written(compressor, [point(seconds, temperature=20.0) for seconds in range(0, 1300, 100)])
+        assert [seconds for seconds, _ in out] == [0, 600, 1200]
+
+    def test_unmatched_measurements_and_off_fields_pass(self):
+        compressor = PointCompressor(parse_compression("telemetry=deadband:abs=1;telemetry.iaq=off"))
+        routing = point(0, measurement='routing', hops=1.0)
+        assert compressor.compress(routing) == [routing]
+        out = written(compressor, [point(0, iaq=50.0, voltage=4.0), point(1, iaq=50.0, voltage=4.0)])
+        assert out == [(0, {'iaq': 50.0, 'voltage': 4.0}), (1, {'iaq': 50.0})]
+
+    def test_different_nodes_have_separate_state(self):
+        compressor = PointCompressor(parse_compression("telemetry=deadband:abs=1"))
+        out = written(compressor, [point(0, voltage=4.0), point(0, node_id='!00000002', voltage=4.0)])
+        assert len(out) == 2
+
+
+class TestSwingingDoor:
+    """Test per lo swinging door: le rampe lineari si riducono agli estremi"""
+
+    def test_linear_ramp_keeps_only_corners(self):
+        compressor = PointCompressor(parse_compression("telemetry=swinging_door:abs=0.2"))
+        # Sale di 1 al secondo fino a 10, poi resta fermo
+        values = [min(seconds, 10) * 1.0 for seconds in range(21)]
+        out = written(compressor, [point(seconds, uptime=value) for seconds, value in enumerate(values)])
+        assert out == [(0, {'uptime': 0.0}), (10, {'uptime': 10.0}), (20, {'uptime': 10.0})]
+
+    def test_flush_keeps_held_values_of_each_node(self):
+        compressor = PointCompressor(parse_compression("telemetry=swinging_door:abs=1"))
+        for node_id, value in (('!a', 1.0), ('!b', 5.0), ('!c', 9.0)):
+            compressor.compress(point(0, node_id=node_id, voltage=value))
+            assert compressor.compress(point(10, node_id=node_id, voltage=value + 0.5)) == []
+        flushed = compressor.flush()
+        assert sorted((p['tags']['node_id'], p['time'], p['fields']) for p in flushed) == [
+            ('!a', 1_700_000_010_000_000_000, {'voltage': 1.5}),
+            ('!b', 1_700_000_010_000_000_000, {'voltage': 5.5}),
+            ('!c', 1_700_000_010_000_000_000, {'voltage': 9.5}),
+        ]
+        assert compressor.get_stats()['held_written'] == 3
+
+    def test_reconstruction_stays_within_tolerance(self):
+        compressor = PointCompressor(parse_compression("telemetry=swinging_door:abs=0.3"))
+        values = [((seconds * 37) % 11) / 10 + seconds * 0.05 for seconds in range(200)]
+        out = written(compressor, [point(seconds, temperature=value) for seconds, value in enumerate(values)])
+        assert len(out) < len(values)
+        kept = [(seconds, fields['temperature']) for seconds, fields in out]
+        for (t1, v1), (t2, v2) in zip(kept, kept[1:]):
+            for seconds in range(t1, t2 + 1):
+                interpolated = v1 + (v2 - v1) * (seconds - t1) / (t2 - t1)
+                assert abs(values[seconds] - interpolated) <= 0.3 + 1e-9
+
+
+class TestDistance:
+    """Test per il filtro delle posizioni per distanza minima"""
+
+    def test_distance(self):
+        assert distance_m(45.0, 9.0, 45.0, 9.0) == 0
+        assert distance_m(45.0, 9.0, 45.001, 9.0) == pytest.approx(111.2, abs=0.5)
+
+    def test_positions_filtered_by_distance_moved(self):
+        compressor = PointCompressor(parse_compression("position=distance:meters=50,heartbeat=3600"))
+        out = written(compressor, [point(0, measurement='position', latitude=45.0, longitude=9.0),
+                                   point(60, measurement='position', latitude=45.0001, longitude=9.0),
+                                   point(120, measurement='position', latitude=45.0006, longitude=9.0),
+                                   point(3720, measurement='position', latitude=45.0006, longitude=9.0)])
+        assert [seconds for seconds, _ in out] == [0, 120, 3720]
+
+
+class TestBoundedState:
+    """Test per il limite delle serie in memoria"""
+
+    def test_stale_series_are_pruned_and_new_ones_pass_when_full(self):
+        compressor = PointCompressor(parse_compression("telemetry=swinging_door:abs=1,heartbeat=100"),
+                                     max_series=2)
+        compressor.compress(point(0, node_id='!a', voltage=1.0))
+        compressor.compress(point(10, node_id='!a', voltage=1.5))
+        compressor.compress(point(0, node_id='!b', voltage=1.0))
+        # Mappa piena e nessuna serie ferma: la nuova serie passa senza compressione
+        assert len(compressor.compress(point(50, node_id='!c', voltage=1.0))) == 1
+        assert compressor.get_stats()['series_uncompressed'] == 1
+        # Dopo un heartbeat le serie ferme vengono eliminate, scrivendo il valore trattenuto di !a
+        out = compressor.compress(point(200, node_id='!c', voltage=1.0))
+        assert out[0]['tags']['node_id'] == '!a' and out[0]['fields'] == {'voltage': 1.5}
+        stats = compressor.get_stats()
+        assert stats['series_pruned'] == 2 and stats['series'] == 1
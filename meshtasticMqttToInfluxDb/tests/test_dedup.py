@@ -0,0 +1,42 @@
+"""
+Test per il modulo dedup.py
+"""
+from dedup import SeenPacketCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestSeenPacketCache:
+    """Test per l'indice dei pacchetti visti"""
+
+    def test_duplicates_are_detected(self):
+        cache = SeenPacketCache(max_size=10, ttl=60)
+        assert cache.check(1, 100) is False
+        assert cache.check(1, 100) is True
+        assert cache.check(2, 100) is False
+        assert cache.get_stats() == {'unique': 2, 'duplicates': 1, 'expired': 0, 'evicted': 0, 'size': 2}
+
+    def test_entries_expire_after_ttl(self):
+        clock = FakeClock()
+        cache = SeenPacketCache(max_size=10, ttl=60, clock=clock)
+        cache.check(1, 100)
+        clock.now = 59
+        assert cache.check(1, 100) is True
+        clock.now = 61
+        assert cache.check(1, 100) is False
+        assert cache.get_stats()['expired'] == 1
+
+    def test_oldest_entry_is_evicted_when_full(self):
+        cache = SeenPacketCache(max_size=2, ttl=60)
+        cache.check(1, 1)
+        cache.check(1, 2)
+        cache.check(1, 3)
+        assert len(cache) == 2
+        assert cache.check(1, 1) is False
+        assert cache.get_stats()['evicted'] == 2
@@ -0,0 +1,62 @@
+"""
+Test per il modulo home_assistant.py
+"""
+import json
+
+from home_assistant import HomeAssistantPublisher
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestHomeAssistantPublisher:
+    """Test per il publisher con cache, deadband e rate limit"""
+
+    def make_publisher(self, **kwargs):
+        messages = []
+        clock = FakeClock()
+        publisher = HomeAssistantPublisher(
+            publish=lambda topic, payload, qos, retain: messages.append((topic, payload, retain)),
+            clock=clock, **kwargs)
+        return publisher, messages, clock
+
+    def test_discovery_once_and_coalesced_state(self):
+        publisher, messages, clock = self.make_publisher()
+        publisher.update("!ba0c76e8", {"voltage": 4.2, "battery_level": 101.0})
+
+        discovery = [m for m in messages if m[0].endswith("/config")]
+        states = [m for m in messages if m[0].endswith("/state")]
+        assert len(discovery) == 2
+        assert all(retain for _, _, retain in discovery)
+        assert states == [("homeassitant/sensor/!ba0c76e8/state",
+                           json.dumps({"voltage": 4.2, "battery_level": 101.0}), False)]
+
+        messages.clear()
+        clock.now += 60
+        publisher.update("!ba0c76e8", {"voltage": 4.1, "battery_level": 101.0})
+        assert [m[0] for m in messages] == ["homeassitant/sensor/!ba0c76e8/state"]
+
+    def test_unchanged_values_within_deadband_are_suppressed(self):
+        publisher, messages, clock = self.make_publisher(deadband=0.05)
+        publisher.update("!ba0c76e8", {"voltage": 4.20})
+        messages.clear()
+        clock.now += 60
+        publisher.update("!ba0c76e8", {"voltage": 4.22})
+        assert messages == []
+        assert publisher.get_stats()['suppressed'] == 1
+
+    def test_rate_limit_defers_state_until_flush(self):
+        publisher, messages, clock = self.make_publisher(min_interval=30)
+        publisher.update("!ba0c76e8", {"voltage": 4.2})
+        messages.clear()
+        clock.now += 5
+        publisher.update("!ba0c76e8", {"voltage": 3.9})
+        assert messages == []
+        clock.now += 30
+        publisher.flush()
+        assert json.loads(messages[0][1]) == {"voltage": 3.9}
@@ -0,0 +1,76 @@
+"""
+Test per il modulo influxdb.py
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from config import config
+from influxdb import InfluxdbClient
+
+
+@pytest.fixture(autouse=True)
+def influx_config(monkeypatch):
+    for key, value in (('INFLUXDB_HOST', 'http://127.0.0.1'), ('INFLUXDB_PORT', '8086'), ('INFLUXDB_TOKEN', 'test'),
+                       ('INFLUXDB_ORG', 'test'), ('INFLUXDB_BUCKET', 'test'), ('INFLUXDB_JITTER_INTERVAL_MS', 0)):
+        monkeypatch.setitem(config, key, value)
+
+
+class BlockingWriteApi:
+    """write_api finto: ogni scrittura attende `release`, poi fallisce."""
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def write(self, bucket, org, record):
+        self.release.wait(5)
+        raise IOError("InfluxDB non raggiungibile")
+
+
+class TestCloseTimeout:
+    """Test per i batch ancora in sospeso quando scade il tempo di chiusura"""
+
+    def test_pending_batches_are_spooled_and_counted(self, tmp_path, monkeypatch):
+        monkeypatch.setitem(config, 'INFLUXDB_MAX_RETRIES', 0)
+        client = InfluxdbClient(spool_dir=str(tmp_path))
+        client.healthy = True
+        client.write_api = BlockingWriteApi()
+        client._executor = ThreadPoolExecutor(max_workers=1)
+        # Il primo batch occupa l'unico writer, il secondo resta in coda
+        client._submit([b"m f=1 1", b"m f=2 2"])
+        client._submit([b"m f=3 3"])
+        threading.Timer(0.3, client.write_api.release.set).start()
+
+        client._wait_writers(0.2)
+
+        stats = client.get_stats()
+        assert stats['batches_failed'] == 2
+        assert stats['points_failed'] == 3
+        assert stats['points_spooled'] == 3
+        data, _ = client.spool.read_batch()
+        assert sorted(data.split(b"\n")) == [b"m f=1 1", b"m f=2 2", b"m f=3 3"]
+        client.spool.close()
+
+
+class TestSpoolWhileUnhealthy:
+    """Test per lo spool dei punti ricevuti con InfluxDB non raggiungibile"""
+
+    def test_points_are_spooled_per_batch(self, tmp_path, monkeypatch):
+        monkeypatch.setitem(config, 'INFLUXDB_BATCH_SIZE', 50)
+        client = InfluxdbClient(spool_dir=str(tmp_path))
+        client.healthy = False
+        client.write_api = BlockingWriteApi()
+        client._executor = ThreadPoolExecutor(max_workers=1)
+        appends = []
+        append = client.spool.append
+        monkeypatch.setattr(client.spool, "append", lambda data: appends.append(data) or append(data))
+
+        for i in range(120):
+            client.write(f"m f={i} {i}")
+        client.flush()
+        client._executor.shutdown(wait=True)
+
+        assert len(appends) == 3
+        assert client.get_stats()['points_spooled'] == 120
+        client.spool.close()
@@ -0,0 +1,60 @@
+"""
+Test per il modulo ingest_queue.py
+"""
+import threading
+
+from ingest_queue import IngestQueue
+
+
+class TestIngestQueue:
+    """Test per la coda di ingest con worker"""
+
+    def test_workers_process_all_messages(self):
+        """Tutti i messaggi accodati vengono elaborati dai worker"""
+        received = []
+        lock = threading.Lock()
+
+        def handler(topic, payload, receive_ts):
+            with lock:
+                received.append((topic, payload))
+
+        queue = IngestQueue(handler, maxsize=100, workers=3)
+        queue.start()
+        for i in range(50):
+            queue.put("msh/test", str(i).encode(), 0.0)
+        queue.stop()
+
+        assert len(received) == 50
+        stats = queue.get_stats()
+        assert stats['enqueued'] == 50
+        assert stats['dropped'] == 0
+        assert sum(worker['processed'] for worker in stats['workers']) == 50
+
+    def test_full_buffer_drops_oldest(self):
+        """Con il buffer pieno viene scartato il messaggio più vecchio"""
+        received = []
+        queue = IngestQueue(lambda topic, payload, ts: received.append(payload), maxsize=2, workers=1)
+
+        assert queue.put("t", b"1", 0.0)
+        assert queue.put("t", b"2", 0.0)
+        assert not queue.put("t", b"3", 0.0)
+        assert queue.depth() == 2
+
+        queue.start()
+        queue.stop()
+        assert received == [b"2", b"3"]
+        assert queue.get_stats()['dropped'] == 1
+
+    def test_handler_errors_are_counted(self):
+        """Un'eccezione nel handler non ferma il worker"""
+        def handler(topic, payload, receive_ts):
+            if payload == b"bad":
+                raise ValueError("payload non valido")
+
+        queue = IngestQueue(handler, maxsize=10, workers=1)
+        queue.start()
+        queue.put("t", b"bad", 0.0)
+        queue.put("t", b"good", 0.0)
+        queue.stop()
+
+        assert queue.get_stats()['workers'] == [{'processed': 1, 'errors': 1}]
@@ -0,0 +1,64 @@
+"""
+Test per il modulo line_protocol.py
+"""
+from datetime import datetime, timezone
+
+import pytest
+
+from line_protocol import LineProtocolSerializer
+from utils import timestamp_to_ns
+
+POINTS = [
+    {
+        'measurement': 'telemetry',
+        'time': 1757432919000000000,
+        'tags': {'gateway': '!ba6a665c', 'node_id': '!ba6a665c', 'to_node_id': '!ffffffff'},
+        'fields': {'voltage': 4.221, 'battery_level': 101.0, 'air_util_tx': 2.41},
+    },
+    {
+        'measurement': 'nodeinfo',
+        'time': 1757432919000000000,
+        'tags': {'longname': 'Nodo, con=spazi\\', 'shortname': '', 'hardware': 43, 'role': None},
+        'fields': {'packet_id': 618060111, 'online': True, 'text': 'ciao "mondo" \\'},
+    },
+    {
+        'measurement': 'custom metrics',
+        'time': 1757432919000000000,
+        'tags': {},
+        'fields': {'nan': float('nan'), 'value': 1.5e-7},
+    },
+]
+
+
+class TestLineProtocolSerializer:
+    """Test per il serializzatore line protocol"""
+
+    @pytest.mark.parametrize("point_dict", POINTS)
+    def test_matches_influxdb_client(self, point_dict):
+        from influxdb_client import Point
+        expected = Point.from_dict(point_dict).to_line_protocol().encode('utf-8')
+        assert LineProtocolSerializer().serialize(point_dict) == expected
+
+    def test_point_without_valid_fields_is_skipped(self):
+        serializer = LineProtocolSerializer()
+        point_dict = {'measurement': 'telemetry', 'tags': {}, 'fields': {'x': float('inf'), 'y': None}}
+        assert serializer.serialize(point_dict) is None
+        assert serializer.serialize_many([point_dict, POINTS[0]]).count(b"\n") == 0
+
+    def test_field_type_change_is_handled(self):
+        serializer = LineProtocolSerializer()
+        point_dict = {'measurement': 'custom_metrics', 'fields': {'value': 1.0}}
+        assert serializer.serialize(point_dict) == b"custom_metrics value=1"
+        point_dict['fields']['value'] = "alto"
+        assert serializer.serialize(point_dict) == b'custom_metrics value="alto"'
+
+
+class TestTimestampToNs:
+    """Test per la conversione dei timestamp in nanosecondi"""
+
+    def test_seconds_and_datetime_agree(self):
+        dt = datetime.fromtimestamp(1757432919, tz=timezone.utc)
+        assert timestamp_to_ns(1757432919) == 1757432919000000000
+        assert timestamp_to_ns(dt) == 1757432919000000000
+        assert timestamp_to_ns(dt.replace(tzinfo=None)) == 1757432919000000000
+        assert timestamp_to_ns(1757432919.25) == 1757432919250000000
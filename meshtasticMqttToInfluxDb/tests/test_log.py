@@ -0,0 +1,109 @@
+"""
+Test per il modulo log.py
+"""
+import io
+import json
+import logging
+import queue
+
+import pytest
+
+from log import (JsonFormatter, LazyJson, NonBlockingQueueHandler, RateLimitFilter,
+                 get_stats, parse_levels, setup_logging, shutdown_logging)
+
+
+def _record(msg, *args, level=logging.INFO, name="test"):
+    return logging.LogRecord(name, level, __file__, 1, msg, args, None)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestRateLimitFilter:
+    """Test per il rate limit per modello di messaggio"""
+
+    def test_limit_per_template(self):
+        clock = FakeClock()
+        rate_limit = RateLimitFilter(limit=2, interval=10, clock=clock)
+        results = [rate_limit.filter(_record("skip %s", i)) for i in range(5)]
+        assert results == [True, True, False, False, False]
+        # Un modello diverso ha la propria finestra
+        assert rate_limit.filter(_record("altro %s", 1))
+        assert rate_limit.suppressed == 3
+
+    def test_new_window_reports_suppressed(self):
+        clock = FakeClock()
+        rate_limit = RateLimitFilter(limit=1, interval=10, clock=clock)
+        rate_limit.filter(_record("skip %s", 1))
+        rate_limit.filter(_record("skip %s", 2))
+        rate_limit.filter(_record("skip %s", 3))
+        clock.now = 10
+        record = _record("skip %s", 4)
+        assert rate_limit.filter(record)
+        assert record.suppressed == 2
+
+    def test_disabled(self):
+        rate_limit = RateLimitFilter(limit=0)
+        assert all(rate_limit.filter(_record("skip")) for _ in range(100))
+
+
+class TestFormattersAndHandler:
+    """Test per il formato JSON e la coda non bloccante"""
+
+    def test_json_formatter(self):
+        record = _record("📦 %d punti", 5, level=logging.WARNING, name="influxdb")
+        record.suppressed = 3
+        entry = json.loads(JsonFormatter().format(record))
+        assert entry['level'] == "WARNING"
+        assert entry['logger'] == "influxdb"
+        assert entry['msg'] == "📦 5 punti"
+        assert entry['suppressed'] == 3
+        assert entry['ts'].endswith("+00:00")
+
+    def test_queue_handler_drops_when_full(self):
+        handler = NonBlockingQueueHandler(queue.Queue(maxsize=1))
+        handler.handle(_record("uno"))
+        handler.handle(_record("due"))
+        assert handler.dropped == 1
+
+    def test_lazy_json_only_on_format(self):
+        lazy = LazyJson({'a': 1})
+        assert json.loads(str(lazy)) == {'a': 1}
+
+
+class TestSetupLogging:
+    """Test per la configurazione del logging"""
+
+    def test_parse_levels(self):
+        assert parse_levels("mqtt=debug, influxdb=WARNING;") == {'mqtt': 'DEBUG', 'influxdb': 'WARNING'}
+        assert parse_levels("") == {}
+        with pytest.raises(ValueError):
+            parse_levels("mqtt")
+        with pytest.raises(ValueError):
+            parse_levels("mqtt=verbose")
+
+    def test_text_output_and_module_levels(self):
+        root = logging.getLogger()
+        old_level, old_handlers = root.level, list(root.handlers)
+        stream = io.StringIO()
+        try:
+            setup_logging(level="INFO", levels="test.quiet=ERROR", fmt="text", rate_limit=1, stream=stream)
+            logging.getLogger("test.loud").info("✅ visibile %s", 1)
+            logging.getLogger("test.loud").info("✅ visibile %s", 2)
+            logging.getLogger("test.quiet").warning("⚠️  nascosto")
+            logging.getLogger("test.loud").debug("🔍 nascosto")
+            assert get_stats()['suppressed'] == 1
+        finally:
+            shutdown_logging()
+            logging.getLogger("test.quiet").setLevel(logging.NOTSET)
+            root.setLevel(old_level)
+            root.handlers = old_handlers
+        output = stream.getvalue()
+        assert "INFO [test.loud] ✅ visibile 1" in output
+        assert "visibile 2" not in output
+        assert "nascosto" not in output
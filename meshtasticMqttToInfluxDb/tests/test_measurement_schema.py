@@ -0,0 +1,89 @@
+"""
+Test per il modulo measurement_schema.py
+"""
+import json
+
+import pytest
+
+from measurement_schema import MeasurementSchema
+
+
+class TestMeasurementSchema:
+    """Test per la compilazione e l'applicazione dello schema delle measurement"""
+
+    def test_only_declared_fields_are_copied(self):
+        schema = MeasurementSchema({'telemetry': {'fields': {'battery_level': 'float', 'voltage': 'float'}}})
+        measurement, tags, fields = schema.convert('telemetry', {'battery_level': 90, 'voltage': 4.1, 'other': 1})
+        assert measurement == 'telemetry'
+        assert tags == {}
+        assert fields == {'battery_level': 90.0, 'voltage': 4.1}
+        assert isinstance(fields['battery_level'], float)
+
+    def test_extra_fields_keeps_undeclared_numbers_as_float(self):
+        schema = MeasurementSchema({'telemetry': {'fields': {'voltage': 'float'}, 'extra_fields': 'float'}})
+        _, _, fields = schema.convert('telemetry', {'voltage': 4, 'lux': 12, 'label': "x"})
+        assert fields == {'voltage': 4.0, 'lux': 12.0}
+
+    def test_rename_scale_and_types(self):
+        schema = MeasurementSchema({'position': {
+            'measurement': 'gps',
+            'tags': {'source': 'location_source'},
+            'fields': {
+                'latitude': {'source': 'latitude_i', 'scale': 1e-7},
+                'latitude_i': 'float',
+                'sats': {'source': 'sats_in_view', 'type': 'int'},
+                'valid': {'source': 'fix', 'type': 'bool'},
+            },
+        }})
+        measurement, tags, fields = schema.convert('position', {
+            'latitude_i': 455000000, 'location_source': 1, 'sats_in_view': '7', 'fix': 'true'})
+        assert measurement == 'gps'
+        assert tags == {'source': '1'}
+        assert fields['latitude'] == pytest.approx(45.5)
+        assert fields['latitude_i'] == 455000000.0
+        assert fields['sats'] == 7
+        assert fields['valid'] is True
+
+    def test_invalid_values_are_skipped_and_counted(self):
+        schema = MeasurementSchema({'telemetry': {'fields': {'voltage': 'float', 'battery_level': 'float'}}})
+        _, _, fields = schema.convert('telemetry', {'voltage': "n/a", 'battery_level': 50})
+        assert fields == {'battery_level': 50.0}
+        assert schema.get_stats()['invalid_values'] == 1
+
+    def test_payload_types_and_metric_list(self):
+        schema = MeasurementSchema({'text': {'payload_types': {'custom_metrics': {
+            'measurement': 'custom_metrics',
+            'metric_list': {'source': 'metrics', 'name': 'name', 'value': 'value'},
+        }}}})
+        payload = {'type': 'custom_metrics', 'metrics': [{'name': 'pump', 'value': 1}, {'name': 'bad'}]}
+        assert schema.convert('text', payload) == ('custom_metrics', {}, {'pump': 1.0})
+        assert schema.convert('text', {'text': "ciao"}) is None
+        assert schema.get_stats() == {'converted': 1, 'skipped': 1, 'invalid_values': 1}
+
+    def test_unknown_type_is_skipped(self):
+        schema = MeasurementSchema({})
+        assert schema.convert('routing', {}) is None
+
+    @pytest.mark.parametrize("schema", [
+        {'telemetry': {'fields': {'voltage': 'decimal'}}},
+        {'telemetry': {'fields': {'voltage': {'type': 'string', 'scale': 10}}}},
+        {'telemetry': {'unknown': True}},
+        {'telemetry': {'extra_fields': 'string'}},
+        {'text': {'payload_types': {}, 'fields': {}}},
+    ])
+    def test_invalid_schema_is_rejected(self, schema):
+        with pytest.raises(ValueError):
+            MeasurementSchema(schema)
+
+    def test_default_schema(self, tmp_path):
+        schema = MeasurementSchema.from_file()
+        assert set(schema.message_types) >= {'telemetry', 'position', 'nodeinfo', 'text'}
+        _, _, fields = schema.convert('position', {'latitude_i': 455000000, 'longitude_i': 91000000, 'altitude': 120})
+        assert fields['latitude'] == pytest.approx(45.5)
+        assert fields['longitude'] == pytest.approx(9.1)
+        assert fields['latitude_i'] == 455000000.0
+        assert fields['altitude'] == 120.0
+
+        path = tmp_path / "schema.json"
+        path.write_text(json.dumps({'telemetry': {'fields': {'voltage': 'float'}}}))
+        assert MeasurementSchema.from_file(str(path)).message_types == ('telemetry',)
@@ -0,0 +1,70 @@
+"""
+Test per la conversione tipizzata dei protobuf (meshpacket.py)
+"""
+import random
+
+from google.protobuf.json_format import MessageToDict
+from meshtastic.protobuf import mesh_pb2, mqtt_pb2, portnums_pb2, telemetry_pb2
+
+from measurement_schema import MeasurementSchema
+from meshpacket import envelope_to_json_message, message_to_payload
+
+
+def message_to_dict(message):
+    return MessageToDict(message, preserving_proto_field_name=True, use_integers_for_enums=True)
+
+
+def make_envelope(portnum, message):
+    envelope = mqtt_pb2.ServiceEnvelope(channel_id="LongFast", gateway_id="!ba6a665c")
+    setattr(envelope.packet, "from", 0xba0c76e8)
+    envelope.packet.to = 0xffffffff
+    envelope.packet.rx_time = 1757432919
+    envelope.packet.decoded.portnum = portnum
+    envelope.packet.decoded.payload = message.SerializeToString()
+    return envelope.SerializeToString()
+
+
+class TestMessageToPayload:
+    """Test per la lettura diretta dei campi al posto di MessageToDict"""
+
+    def test_float32_values_match_message_to_dict(self):
+        rng = random.Random(7)
+        for _ in range(500):
+            metrics = telemetry_pb2.EnvironmentMetrics(
+                temperature=rng.uniform(-40, 60), relative_humidity=rng.uniform(0, 100),
+                barometric_pressure=rng.uniform(900, 1100), iaq=rng.randrange(0, 500))
+            assert message_to_payload(metrics) == message_to_dict(metrics)
+
+    def test_position_enums_and_zero_values(self):
+        position = mesh_pb2.Position(latitude_i=437612345, longitude_i=-112345678, altitude=0,
+                                     location_source=mesh_pb2.Position.LOC_INTERNAL, precision_bits=13)
+        payload = message_to_payload(position)
+        assert payload == message_to_dict(position)
+        assert payload['location_source'] == 2
+
+    def test_repeated_and_nested_fields(self):
+        routing = mesh_pb2.RouteDiscovery(route=[1, 2, 3], snr_towards=[10, -4])
+        assert message_to_payload(routing) == message_to_dict(routing)
+        user = mesh_pb2.User(id="!ba0c76e8", long_name="Podere", public_key=b"\x01\x02")
+        assert message_to_payload(user) == message_to_dict(user)
+
+
+class TestEnvelopePoints:
+    """Test per l'equivalenza dei punti preparati dai payload tipizzati"""
+
+    def test_telemetry_and_position_points(self):
+        schema = MeasurementSchema.from_file("")
+        telemetry = telemetry_pb2.Telemetry(time=1757432919)
+        telemetry.device_metrics.voltage = 4.221
+        telemetry.device_metrics.channel_utilization = 3.79
+        telemetry.device_metrics.uptime_seconds = 26899
+        position = mesh_pb2.Position(latitude_i=437612345, longitude_i=112345678, altitude=112, sats_in_view=9)
+
+        for portnum, message, variant in ((portnums_pb2.TELEMETRY_APP, telemetry, telemetry.device_metrics),
+                                          (portnums_pb2.POSITION_APP, position, position)):
+            converted = envelope_to_json_message(make_envelope(portnum, message))
+            assert schema.convert(converted['type'], converted['payload']) == \
+                schema.convert(converted['type'], message_to_dict(variant))
+
+        converted = envelope_to_json_message(make_envelope(portnums_pb2.TELEMETRY_APP, telemetry))
+        assert converted['payload'] == {'voltage': 4.221, 'channel_utilization': 3.79, 'uptime_seconds': 26899}
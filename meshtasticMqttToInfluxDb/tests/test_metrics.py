@@ -0,0 +1,97 @@
+"""
+Test per il modulo metrics.py
+"""
+import urllib.request
+
+from metrics import MetricsRegistry, merge_snapshots, start_http_server, CONTENT_TYPE, NULL_TIMER
+
+
+class TestMetricsRegistry:
+    """Test per il registro delle metriche OpenMetrics"""
+
+    def test_counter_and_histogram_render(self):
+        registry = MetricsRegistry()
+        messages = registry.counter("messages", "Messaggi", ["payload_type"])
+        latency = registry.histogram("stage_seconds", "Durata", ["stage"], buckets=(0.01, 0.1))
+        messages.inc("json")
+        messages.inc("json")
+        latency.observe(0.05, "parse")
+        latency.observe(0.5, "parse")
+
+        text = registry.render()
+        assert 'messages_total{payload_type="json"} 2' in text
+        assert 'stage_seconds_bucket{stage="parse",le="0.01"} 0' in text
+        assert 'stage_seconds_bucket{stage="parse",le="0.1"} 1' in text
+        assert 'stage_seconds_bucket{stage="parse",le="+Inf"} 2' in text
+        assert 'stage_seconds_count{stage="parse"} 2' in text
+        assert text.endswith("# EOF\n")
+
+    def test_disabled_histogram_timer(self):
+        registry = MetricsRegistry()
+        latency = registry.histogram("stage_seconds", "Durata", ["stage"])
+        with latency.time("parse"):
+            pass
+        latency.enabled = False
+        assert latency.time("parse") is NULL_TIMER
+        with latency.time("write"):
+            pass
+        snapshot = latency.snapshot()
+        assert list(snapshot) == [("parse",)]
+        assert snapshot[("parse",)][2] == 1
+
+    def test_stats_are_exported(self):
+        registry = MetricsRegistry()
+        registry.gauge("queue_depth", "Profondità", function=lambda: 7)
+        registry.register_stats("ingest", lambda: {'depth': 3, 'dropped': 1, 'host': 'x',
+                                                   'workers': [{'processed': 5}]}, gauges=('depth',))
+        text = registry.render()
+        assert "queue_depth 7" in text
+        assert "ingest_depth 3" in text
+        assert "ingest_dropped_total 1" in text
+        assert 'ingest_workers_processed_total{index="0"} 5' in text
+        assert "host" not in text
+
+    def test_http_endpoint(self):
+        registry = MetricsRegistry()
+        registry.counter("requests", "Richieste").inc()
+        server = start_http_server(0, "127.0.0.1", registry=registry)
+        try:
+            url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+            with urllib.request.urlopen(url, timeout=5) as response:
+                assert response.headers["Content-Type"] == CONTENT_TYPE
+                assert "requests_total 1" in response.read().decode()
+        finally:
+            server.shutdown()
+
+
+class TestSnapshots:
+    """Test per la somma delle metriche di più processi"""
+
+    def _registry(self):
+        registry = MetricsRegistry()
+        messages = registry.counter("messages", "Messaggi", ["payload_type"])
+        latency = registry.histogram("stage_seconds", "Durata", ["stage"], buckets=(0.01, 0.1))
+        return registry, messages, latency
+
+    def test_merge_and_load(self):
+        first, messages, latency = self._registry()
+        messages.inc("json", amount=3)
+        latency.observe(0.05, "parse")
+        second, messages, latency = self._registry()
+        messages.inc("json")
+        messages.inc("binary")
+        latency.observe(0.5, "parse")
+
+        merged = merge_snapshots([first.snapshot(), second.snapshot()])
+        target, messages, latency = self._registry()
+        target.load_snapshot(merged)
+        assert messages.value("json") == 4
+        assert messages.value("binary") == 1
+        text = target.render()
+        assert 'stage_seconds_bucket{stage="parse",le="0.1"} 1' in text
+        assert 'stage_seconds_count{stage="parse"} 2' in text
+
+    def test_render_hook_runs_before_render(self):
+        registry, messages, _ = self._registry()
+        registry.on_render(lambda: registry.load_snapshot({"messages": {("json",): 9}}))
+        assert 'messages_total{payload_type="json"} 9' in registry.render()
@@ -0,0 +1,96 @@
+"""
+Test per il modulo node_registry.py
+"""
+import threading
+
+import pytest
+
+from node_registry import NodeRegistry
+
+
+def nodeinfo(longname, shortname="ABCD", hardware="HELTEC_V3"):
+    return {'longname': longname, 'shortname': shortname, 'hardware': hardware}
+
+
+class TestNodeRegistry:
+    """Test per il registro dei nodi e il limite di cardinalità"""
+
+    def test_unknown_node_has_no_tags(self):
+        registry = NodeRegistry()
+        assert registry.tags_for('!00000001') == {}
+
+    def test_nodeinfo_enriches_other_points(self):
+        registry = NodeRegistry(enrich_tags=('longname', 'hardware'))
+        assert registry.update('!00000001', nodeinfo("Nodo uno")) == nodeinfo("Nodo uno")
+        assert registry.tags_for('!00000001') == {'longname': "Nodo uno", 'hardware': "HELTEC_V3"}
+        assert registry.get_stats()['enriched'] == 1
+
+    def test_enriched_counter_from_several_workers(self):
+        registry = NodeRegistry(enrich_tags=('longname',))
+        registry.update('!00000001', nodeinfo("Nodo uno"))
+        workers = [threading.Thread(target=lambda: [registry.tags_for('!00000001') for _ in range(5000)])
+                   for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        assert registry.get_stats()['enriched'] == 20000
+
+    def test_unknown_enrich_tag_is_rejected(self):
+        with pytest.raises(ValueError):
+            NodeRegistry(enrich_tags=('firmware',))
+
+    def test_repeated_nodeinfo_is_not_an_update(self):
+        registry = NodeRegistry()
+        registry.update('!00000001', nodeinfo("Nodo uno"))
+        registry.update('!00000001', nodeinfo("Nodo uno"))
+        stats = registry.get_stats()
+        assert stats['updates'] == 1
+        assert stats['unchanged'] == 1
+
+    def test_values_over_the_limit_are_omitted(self):
+        registry = NodeRegistry(max_values=2)
+        registry.update('!00000001', nodeinfo("uno"))
+        registry.update('!00000002', nodeinfo("due"))
+        admitted = registry.update('!00000003', nodeinfo("tre"))
+        # Il nome oltre il limite non diventa tag, hardware e nome breve già in uso sì
+        assert admitted == {'shortname': "ABCD", 'hardware': "HELTEC_V3"}
+        assert 'longname' not in registry.tags_for('!00000003')
+        stats = registry.get_stats()
+        assert stats['overflow_longname'] == 1
+        assert stats['values_longname'] == 2
+        assert stats['values_hardware'] == 1
+
+    def test_rename_keeps_the_old_value_counted(self):
+        registry = NodeRegistry(max_values=2)
+        registry.update('!00000001', nodeinfo("uno"))
+        registry.update('!00000002', nodeinfo("due"))
+        # Le serie con "due" restano in InfluxDB: il nuovo nome non ha posto
+        assert 'longname' not in registry.update('!00000002', nodeinfo("due bis"))
+        assert registry.get_stats()['values_longname'] == 2
+        assert registry.get_stats()['overflow_longname'] == 1
+        # Un valore già emesso resta ammesso, anche per un altro nodo
+        assert registry.update('!00000003', nodeinfo("due"))['longname'] == "due"
+
+    def test_registry_is_restored_from_file(self, tmp_path):
+        path = str(tmp_path / "nodes.sqlite3")
+        registry = NodeRegistry(path).open()
+        registry.update('!00000001', nodeinfo("Nodo uno"))
+        registry.close()
+
+        restored = NodeRegistry(path).open()
+        assert restored.tags_for('!00000001')['longname'] == "Nodo uno"
+        assert restored.get_stats()['nodes'] == 1
+        restored.close()
+
+    def test_refresh_reads_updates_from_other_processes(self, tmp_path):
+        path = str(tmp_path / "nodes.sqlite3")
+        first = NodeRegistry(path).open()
+        second = NodeRegistry(path).open()
+        second.update('!00000002', nodeinfo("Nodo due"))
+        assert first.tags_for('!00000002') == {}
+        assert first.refresh() == 1
+        assert first.tags_for('!00000002')['longname'] == "Nodo due"
+        assert first.refresh() == 0
+        first.close()
+        second.close()
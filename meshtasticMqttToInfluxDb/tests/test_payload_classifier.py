@@ -0,0 +1,53 @@
+"""
+Test per il modulo payload_classifier.py
+"""
+from payload_classifier import classify_topic, classify_payload, parse_mqtt_payload
+
+JSON_PAYLOAD = b'{"type": "telemetry", "from": 1, "to": 2, "timestamp": 3, "sender": "!ba6a665c", "payload": {}}'
+PROTOBUF_PAYLOAD = b'\nS\r\xe8v\x0c\xba\x15\xff\xff\xff\xff""\x08C\x12\x1c\r\x13i\x00\x00\x12\x15\x08e\x15o\x12\x87@\x1d\xfa\xc5r@%\x0fy\x1a@(\x93\xd2\x01H\x015O\xd9\xd6$=WL\xc0hE\x00\x00\xe8@H\x03`\xfb\xff\xff\xff\xff\xff\xff\xff\xff\x01x\x03\x98\x01\xe8\x01\xa8\x01\x01\x12\nMeshPodere\x1a\t!ba6a665c'
+
+
+class TestClassifyTopic:
+    """Test per il router dei topic"""
+
+    def test_topic_formats(self):
+        assert classify_topic("msh/EU_868/2/json/LongFast/!ba6a665c") == "json"
+        assert classify_topic("msh/EU_868/2/e/LongFast/!ba6a665c") == "protobuf"
+        assert classify_topic("msh/EU_868/2/c/LongFast/!ba6a665c") == "protobuf"
+        assert classify_topic("msh/EU_868/2/map/") == "protobuf"
+        assert classify_topic("msh/EU_868/2/stat/!ba6a665c") == "text"
+        assert classify_topic("msh/EU_868/other") is None
+        assert classify_topic(None) is None
+
+
+class TestClassifyPayload:
+    """Test per la classificazione del contenuto"""
+
+    def test_json_by_topic_and_by_sniff(self):
+        topic = "msh/EU_868/2/json/LongFast/!ba6a665c"
+        assert classify_payload(JSON_PAYLOAD, topic)[0] == "json"
+        payload_type, content = classify_payload(JSON_PAYLOAD)
+        assert payload_type == "json"
+        assert content["type"] == "telemetry"
+
+    def test_utf8_json_is_json(self):
+        payload = '{"longname": "Nodo 🏠"}'.encode('utf-8')
+        assert classify_payload(payload) == ("json", {"longname": "Nodo 🏠"})
+
+    def test_text(self):
+        assert classify_payload(b"online") == ("text", "online")
+        assert classify_payload(b"riga 1\nriga 2\t") == ("text", "riga 1\nriga 2\t")
+
+    def test_protobuf_and_binary(self):
+        assert classify_payload(PROTOBUF_PAYLOAD)[0] == "protobuf"
+        assert classify_payload(b"\xff\xfe")[0] == "protobuf"
+        assert classify_payload(b"\x07")[0] == "binary"
+
+    def test_invalid_json_on_json_topic_falls_back(self):
+        assert classify_payload(b"offline", "msh/EU_868/2/json/LongFast/!ba6a665c") == ("text", "offline")
+
+    def test_parse_mqtt_payload_decodes_protobuf(self):
+        info = parse_mqtt_payload(PROTOBUF_PAYLOAD, "msh/EU_868/2/e/MeshPodere/!ba6a665c")
+        assert info["type"] == "protobuf"
+        assert info["size"] == len(PROTOBUF_PAYLOAD)
+        assert info["content"]["__proto_type__"] == "ServiceEnvelope"
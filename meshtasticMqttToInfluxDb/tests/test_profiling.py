@@ -0,0 +1,52 @@
+"""
+Test per il modulo profiling.py
+"""
+import os
+import pstats
+import threading
+
+from profiling import ServiceProfiler, format_stages
+
+
+def busy_worker():
+    return sum(index * index for index in range(20_000))
+
+
+class TestServiceProfiler:
+    """Test per il report di profilazione"""
+
+    def test_report_covers_threads_stages_and_allocations(self, tmp_path):
+        report_path = str(tmp_path / "profile.txt")
+        profiler = ServiceProfiler(report_path, top=10).start()
+        try:
+            worker = threading.Thread(target=busy_worker)
+            worker.start()
+            worker.join()
+            data = [bytearray(1024) for _ in range(100)]
+        finally:
+            profiler.stop()
+        profiler.write_report({("parse",): [[], 0.3, 100], ("write",): [[], 0.1, 10]}, messages=100)
+
+        report = open(report_path, encoding="utf-8").read()
+        assert "Messaggi: 100" in report
+        assert "== Stadi (meshtastic_stage_seconds) ==" in report
+        assert "== Funzioni per tempo proprio ==" in report
+        assert "== Memoria allocata per riga" in report
+        assert os.path.exists(profiler.stats_path)
+        # Il worker è stato profilato anche se il profiler è stato avviato da un altro thread
+        functions = {name for _, _, name in pstats.Stats(profiler.stats_path).stats}
+        assert "busy_worker" in functions
+        assert len(data) == 100
+
+
+class TestFormatStages:
+    """Test per la tabella degli stadi"""
+
+    def test_shares_sorted_by_total(self):
+        table = format_stages({("parse",): [[], 0.1, 10], ("write",): [[], 0.3, 10]})
+        lines = table.splitlines()
+        assert lines[1].startswith("write") and lines[1].endswith("75.0%")
+        assert lines[2].startswith("parse") and lines[2].endswith("25.0%")
+
+    def test_no_stages(self):
+        assert "nessuno stadio" in format_stages({})
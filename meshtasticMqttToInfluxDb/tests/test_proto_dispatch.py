@@ -0,0 +1,40 @@
+"""
+Test per la decodifica protobuf guidata da topic e portnum (proto_decode.py)
+"""
+import proto_decode
+
+# ServiceEnvelope con un pacchetto TELEMETRY_APP ricevuto dal gateway !ba6a665c
+ENVELOPE = b'\nS\r\xe8v\x0c\xba\x15\xff\xff\xff\xff""\x08C\x12\x1c\r\x13i\x00\x00\x12\x15\x08e\x15o\x12\x87@\x1d\xfa\xc5r@%\x0fy\x1a@(\x93\xd2\x01H\x015O\xd9\xd6$=WL\xc0hE\x00\x00\xe8@H\x03`\xfb\xff\xff\xff\xff\xff\xff\xff\xff\x01x\x03\x98\x01\xe8\x01\xa8\x01\x01\x12\nMeshPodere\x1a\t!ba6a665c'
+
+
+class TestProtoDispatch:
+    """Test per la scelta deterministica del tipo protobuf"""
+
+    def test_topic_proto(self):
+        """I topic /e/, /c/ e /map/ contengono ServiceEnvelope"""
+        assert proto_decode.get_topic_proto("msh/EU_868/2/e/LongFast/!12345678") == "ServiceEnvelope"
+        assert proto_decode.get_topic_proto("msh/EU_868/2/c/LongFast/!12345678") == "ServiceEnvelope"
+        assert proto_decode.get_topic_proto("msh/EU_868/2/map/") == "ServiceEnvelope"
+        assert proto_decode.get_topic_proto("msh/EU_868/2/json/LongFast/!12345678") is None
+        assert proto_decode.get_topic_proto(None) is None
+
+    def test_portnum_protos_are_known(self):
+        """Ogni tipo della tabella portnum esiste nel registro dei protobuf"""
+        for portnum, proto_name in proto_decode.PORTNUM_PROTOS.items():
+            assert proto_name in proto_decode.protos_map, f"{portnum}: {proto_name} mancante"
+
+    def test_decode_envelope_dispatches_payload_by_portnum(self):
+        """Il payload di Data viene decodificato con il tipo associato al portnum"""
+        res = proto_decode.decode_protobuf(ENVELOPE, "msh/EU_868/2/e/MeshPodere/!ba6a665c")
+
+        assert res["__proto_type__"] == "ServiceEnvelope"
+        assert res["gatewayId"] == "!ba6a665c"
+        decoded = res["packet"]["decoded"]
+        assert decoded["portnum"] == "TELEMETRY_APP"
+        assert decoded["payload_decoded"]["__proto_type__"] == "Telemetry"
+        assert decoded["payload_decoded"]["deviceMetrics"]["batteryLevel"] == 101
+
+    def test_decode_without_topic_is_deterministic(self):
+        """Senza topic viene provato per primo ServiceEnvelope"""
+        _, proto_name = proto_decode.decode_protobuf_single(ENVELOPE)
+        assert proto_name == "ServiceEnvelope"
@@ -0,0 +1,112 @@
+"""
+Test per il modulo rollup.py
+"""
+import pytest
+
+from rollup import RollupAggregator, parse_windows
+
+S = 1_000_000_000
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def point(seconds, node_id='!00000001', measurement='telemetry', **fields):
+    return {'measurement': measurement, 'time': int(seconds * S), 'tags': {'node_id': node_id}, 'fields': fields}
+
+
+class TestParseWindows:
+    """Test per il parsing di ROLLUP_WINDOWS"""
+
+    def test_windows_are_sorted(self):
+        assert parse_windows("1h, 1m,15m") == (('1m', 60), ('15m', 900), ('1h', 3600))
+
+    @pytest.mark.parametrize("value", ["", "0m", "5x", "m"])
+    def test_invalid_windows(self, value):
+        with pytest.raises(ValueError):
+            parse_windows(value)
+
+
+class TestRollupAggregator:
+    """Test per l'aggregazione in finestre"""
+
+    def setup_method(self):
+        self.emitted = []
+        self.clock = FakeClock()
+        self.rollup = RollupAggregator(self.emitted.extend, windows=(('1m', 60),), grace=10, clock=self.clock)
+
+    def test_window_is_emitted_when_the_next_one_starts(self):
+        self.rollup.add(point(0, voltage=4.0))
+        self.rollup.add(point(20, voltage=3.0))
+        self.rollup.add(point(40, voltage=5.0))
+        assert self.emitted == []
+        self.rollup.add(point(61, voltage=4.2))
+        assert self.emitted == [{
+            'measurement': 'telemetry',
+            'time': 0,
+            'tags': {'node_id': '!00000001', 'window': '1m'},
+            'fields': {'voltage_min': 3.0, 'voltage_max': 5.0, 'voltage_mean': 4.0,
+                       'voltage_count': 3, 'voltage_last': 5.0},
+        }]
+
+    def test_idle_series_is_flushed_after_grace(self):
+        self.rollup.add(point(0, voltage=4.0))
+        self.clock.now = 65
+        self.rollup.flush()
+        assert self.emitted == []
+        self.clock.now = 71
+        self.rollup.flush()
+        assert len(self.emitted) == 1
+        assert self.rollup.get_stats()['series'] == 0
+
+    def test_late_points_do_not_rewrite_emitted_windows(self):
+        self.rollup.add(point(0, voltage=4.0))
+        self.rollup.add(point(61, voltage=4.0))
+        self.rollup.add(point(30, voltage=1.0))
+        assert self.rollup.get_stats()['late'] == 1
+        self.rollup.close()
+        assert [p['fields']['voltage_min'] for p in self.emitted] == [4.0, 4.0]
+
+    def test_other_measurements_and_non_numeric_fields_are_ignored(self):
+        self.rollup.add(point(0, measurement='position', latitude=45.0))
+        self.rollup.add(point(0, voltage=4.0, flag=True, label="x"))
+        self.rollup.close()
+        assert len(self.emitted) == 1
+        assert set(self.emitted[0]['fields']) == {'voltage_min', 'voltage_max', 'voltage_mean',
+                                                  'voltage_count', 'voltage_last'}
+
+    def test_series_over_the_limit_are_dropped(self):
+        rollup = RollupAggregator(self.emitted.extend, windows=(('1m', 60),), max_series=1)
+        rollup.add(point(0, node_id='!00000001', voltage=4.0))
+        rollup.add(point(0, node_id='!00000002', voltage=4.0))
+        assert rollup.get_stats()['series_dropped'] == 1
+        assert rollup.get_stats()['series'] == 1
+
+    def test_every_window_is_aggregated_with_extra_tags(self):
+        rollup = RollupAggregator(self.emitted.extend, windows=(('1m', 60), ('1h', 3600)),
+                                  extra_tags={'worker': '0'})
+        for second in range(0, 180, 30):
+            rollup.add(point(second, voltage=float(second)))
+        rollup.close()
+        by_window = {}
+        for p in self.emitted:
+            by_window.setdefault(p['tags']['window'], []).append(p)
+        assert len(by_window['1m']) == 3
+        assert by_window['1h'][0]['fields']['voltage_count'] == 6
+        assert by_window['1h'][0]['tags']['worker'] == '0'
+
+    def test_open_windows_are_tagged_partial_at_close(self):
+        rollup = RollupAggregator(self.emitted.extend, windows=(('1m', 60), ('1h', 3600)), clock=self.clock)
+        self.clock.now = 90
+        rollup.add(point(0, voltage=4.0))
+        rollup.add(point(70, voltage=4.2))
+        rollup.close()
+        tags = {(p['tags']['window'], p['time'] // S): p['tags'].get('partial') for p in self.emitted}
+        # La finestra 0-60 s è terminata, la 60-120 s e l'ora in corso no
+        assert tags == {('1m', 0): None, ('1m', 60): 'true', ('1h', 0): 'true'}
+        assert rollup.get_stats()['windows_partial'] == 2
@@ -0,0 +1,100 @@
+"""
+Test per il modulo shedding.py
+"""
+import pytest
+
+from shedding import LoadShedder, parse_priority_classes
+
+CLASSES = "high=telemetry,custom_metrics,nodeinfo; normal=*; low=position,mapreport"
+
+
+def point(measurement, node_id='!00000001', seconds=0):
+    return {'measurement': measurement, 'time': (1_700_000_000 + seconds) * 1_000_000_000,
+            'tags': {'node_id': node_id}, 'fields': {'value': 1.0}}
+
+
+def shedder(load=0.0, **options):
+    names, classes, default = parse_priority_classes(CLASSES)
+    options.setdefault('rate_per_minute', 0)
+    return LoadShedder(names, classes, default, load=lambda: load, **options)
+
+
+class TestParsePriorityClasses:
+    """Test per il parsing di PRIORITY_CLASSES"""
+
+    def test_classes_and_default(self):
+        names, classes, default = parse_priority_classes(CLASSES)
+        assert names == ('high', 'normal', 'low')
+        assert classes['telemetry'] == 'high' and classes['position'] == 'low'
+        assert default == 'normal'
+
+    def test_default_is_lowest_class_without_star(self):
+        assert parse_priority_classes("a=telemetry;b=position")[2] == 'b'
+
+    @pytest.mark.parametrize("value", ["", "telemetry", "a=x;a=y", "=telemetry"])
+    def test_invalid_classes(self, value):
+        with pytest.raises(ValueError):
+            parse_priority_classes(value)
+
+
+class TestLoadShedder:
+    """Test per il campionamento sotto carico e i limiti per nodo"""
+
+    def test_no_shedding_below_threshold(self):
+        shed = shedder(load=0.4)
+        assert all(shed.admit(point(m)) for m in ('telemetry', 'routing', 'position'))
+
+    def test_top_class_is_never_shed(self):
+        shed = shedder(load=1.0, rate_per_minute=1, burst=1)
+        assert all(shed.admit(point('telemetry', seconds=0)) for _ in range(100))
+        assert shed.get_stats()['admitted_high'] == 100
+
+    def test_lowest_class_is_shed_first(self):
+        # Soglie: low da 0.5, normal da 0.75; con carico 0.7 low passa per circa il 20%
+        shed = shedder(load=0.7)
+        low = sum(shed.admit(point('position')) for _ in range(1000))
+        normal = sum(shed.admit(point('routing')) for _ in range(1000))
+        assert 150 <= low <= 250
+        assert normal == 1000
+        stats = shed.get_stats()
+        assert stats['shed_low'] == 1000 - low and stats['shed_normal'] == 0
+
+    def test_full_queue_drops_everything_but_top_class(self):
+        shed = shedder(load=1.0)
+        assert not any(shed.admit(point(m)) for m in ('position', 'routing') for _ in range(50))
+        assert shed.admit(point('nodeinfo'))
+
+    def test_stuck_node_is_rate_limited_by_packet_time(self):
+        # Carico oltre LOAD_SHED_START ma sotto la soglia di campionamento di normal
+        shed = shedder(load=0.6, rate_per_minute=6, burst=3)
+        admitted = [shed.admit(point('routing', seconds=0)) for _ in range(5)]
+        assert admitted == [True, True, True, False, False]
+        # Un altro nodo ha il proprio bucket
+        assert shed.admit(point('routing', node_id='!00000002'))
+        # Dopo 10 s di tempo del pacchetto si ricarica un token
+        assert shed.admit(point('routing', seconds=10))
+        assert not shed.admit(point('routing', seconds=10))
+        assert shed.get_stats()['rate_limited_normal'] == 3
+
+    def test_no_rate_limit_without_load(self):
+        # Quattro gateway, una posizione al minuto per nodo per un'ora: nessun punto scartato
+        shed = shedder(load=0.0, rate_per_minute=6, burst=10)
+        admitted = [shed.admit(point('position', node_id=f'!{node:08x}', seconds=minute * 60), packet_id=minute)
+                    for minute in range(60) for node in range(5) for _ in range(4)]
+        assert all(admitted)
+        stats = shed.get_stats()
+        assert stats['admitted_low'] == len(admitted) and stats['buckets'] == 0
+
+    def test_gateway_copies_use_one_token(self):
+        shed = shedder(load=0.6, rate_per_minute=6, burst=2)
+        copies = [shed.admit(point('routing', seconds=0), packet_id=packet_id)
+                  for packet_id in (101, 102, 103) for _ in range(4)]
+        assert copies == [True] * 8 + [False] * 4
+        assert shed.get_stats()['rate_limited_normal'] == 4
+
+    def test_bucket_pruning(self):
+        shed = shedder(load=0.6, rate_per_minute=60, burst=1, max_buckets=2)
+        shed.admit(point('routing', node_id='!a', seconds=0))
+        shed.admit(point('routing', node_id='!b', seconds=0))
+        shed.admit(point('routing', node_id='!c', seconds=10))
+        assert shed.get_stats()['buckets'] == 1
@@ -0,0 +1,180 @@
+"""
+Test per il modulo sinks.py
+"""
+import json
+import threading
+import time
+
+import pytest
+
+from line_protocol import LineProtocolSerializer
+from sinks import FileSink, HomeAssistantSink, InfluxSink, Sink, parse_sinks
+
+
+def point(value, measurement='telemetry', node_id='!00000001'):
+    return {'measurement': measurement, 'time': 1_000_000_000 + int(value),
+            'tags': {'node_id': node_id}, 'fields': {'voltage': float(value)}}
+
+
+class RecordingSink(Sink):
+    def __init__(self, name="test", fail=0, block=None, **policy):
+        super().__init__(name, **policy)
+        self.received = []
+        self.fail = fail
+        self.block = block
+
+    def send(self, points):
+        if self.block is not None:
+            self.block.wait()
+        if self.fail:
+            self.fail -= 1
+            raise IOError("non raggiungibile")
+        self.received.extend(points)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condizione non verificata")
+        time.sleep(0.01)
+
+
+class TestParseSinks:
+    """Test per il parsing di SINKS"""
+
+    def test_types_names_and_options(self):
+        value = "influxdb; home_assistant ;file:path=/tmp/p.lp,format=jsonl; influxdb:name=archivio,bucket=old,queue=5"
+        assert parse_sinks(value) == [
+            ('influxdb', 'influxdb', {}),
+            ('home_assistant', 'home_assistant', {}),
+            ('file', 'file', {'path': '/tmp/p.lp', 'format': 'jsonl'}),
+            ('archivio', 'influxdb', {'bucket': 'old', 'queue': '5'}),
+        ]
+
+    @pytest.mark.parametrize("value", ["kafka", "influxdb;influxdb", "file", "log:bucket=x",
+                                       "influxdb:name=Nome-Non-Valido"])
+    def test_invalid_sinks(self, value):
+        with pytest.raises(ValueError):
+            parse_sinks(value)
+
+
+class TestSink:
+    """Test per code, batch, retry e stato di salute"""
+
+    def test_batches_are_sent_from_the_sink_thread(self):
+        sink = RecordingSink(batch_size=2, flush_interval=0.05).start()
+        for i in range(5):
+            sink.write(point(i))
+        sink.close()
+        assert [p['fields']['voltage'] for p in sink.received] == [0.0, 1.0, 2.0, 3.0, 4.0]
+        assert sink.get_stats()['batches_sent'] == 3
+
+    def test_slow_sink_does_not_block_the_others(self):
+        release = threading.Event()
+        slow = RecordingSink("lento", block=release, queue_size=3, batch_size=1, flush_interval=0.01).start()
+        fast = RecordingSink("veloce", batch_size=1, flush_interval=0.01).start()
+        for i in range(10):
+            slow.write(point(i))
+            fast.write(point(i))
+        wait_for(lambda: len(fast.received) == 10)
+        assert slow.get_stats()['dropped'] > 0
+        release.set()
+        slow.close()
+        fast.close()
+        # Scartati i punti più vecchi, non i più recenti
+        assert slow.received[-1]['fields']['voltage'] == 9.0
+
+    def test_retries_then_failing_health(self):
+        sink = RecordingSink(fail=3, max_retries=1, queue_size=0, max_backoff=0)
+        sink.write(point(1))
+        assert sink.get_stats()['health'] == 'failing'
+        assert sink.get_stats()['points_failed'] == 1
+        sink.write(point(2))
+        assert sink.get_stats()['health'] == 'ok'
+        assert sink.get_stats()['batches_retried'] == 2
+
+    def test_synchronous_sink_without_queue(self):
+        sink = RecordingSink(queue_size=0).start()
+        sink.write(point(1))
+        assert len(sink.received) == 1
+        assert sink.get_stats()['depth'] == 0
+
+
+class TestConcreteSinks:
+    """Test per i sink InfluxDB, Home Assistant e file"""
+
+    def test_influx_sink_writes_line_protocol(self):
+        class Client:
+            bucket = 'b'
+            healthy = False
+
+            def __init__(self):
+                self.lines = []
+
+            def write(self, line):
+                self.lines.append(line)
+                return True
+
+            def get_stats(self):
+                return {'points_written': len(self.lines)}
+
+        client = Client()
+        sink = InfluxSink('influxdb', client, LineProtocolSerializer(), queue_size=0)
+        sink.write(point(4))
+        assert client.lines == [b"telemetry,node_id=!00000001 voltage=4 1000000004"]
+        stats = sink.get_stats()
+        assert stats['health'] == 'spooling' and stats['influxdb_points_written'] == 1
+
+    def test_influx_sink_rejected_batch_is_failed(self):
+        class Client:
+            bucket = 'b'
+
+            def write(self, line):
+                return False
+
+            def get_stats(self):
+                return {}
+
+        calls = []
+
+        def wrap_write(write_lines):
+            # Come nel runtime asyncio: un solo passaggio per batch, con l'esito del client
+            return lambda lines: calls.append(len(lines)) or write_lines(lines)
+
+        sink = InfluxSink('influxdb', Client(), LineProtocolSerializer(), wrap_write=wrap_write,
+                          batch_size=3, flush_interval=0.05, max_retries=0).start()
+        for i in range(3):
+            sink.write(point(i))
+        sink.close()
+        stats = sink.get_stats()
+        assert calls == [3]
+        assert stats['points_sent'] == 0 and stats['points_failed'] == 3
+        assert stats['health'] == 'failing'
+
+    def test_home_assistant_sink_only_queues_telemetry(self):
+        class Publisher:
+            def __init__(self):
+                self.updates = []
+
+            def update(self, node_id, fields):
+                self.updates.append((node_id, fields))
+
+        publisher = Publisher()
+        sink = HomeAssistantSink('home_assistant', publisher, queue_size=0)
+        sink.write(point(1, measurement='position'))
+        sink.write(point(2))
+        assert publisher.updates == [('!00000001', {'voltage': 2.0})]
+
+    def test_file_sink_rotates(self, tmp_path):
+        path = str(tmp_path / "punti.jsonl")
+        sink = FileSink('file', path, LineProtocolSerializer(), file_format='jsonl', max_bytes=200, backups=1,
+                        queue_size=0)
+        for i in range(6):
+            sink.write(point(i))
+        sink.close()
+        assert sink.get_stats()['rotations'] >= 1
+        assert (tmp_path / "punti.jsonl.1").exists()
+        assert not (tmp_path / "punti.jsonl.2").exists()
+        first = (tmp_path / "punti.jsonl.1").read_text().splitlines()[0]
+        assert json.loads(first)['measurement'] == 'telemetry'
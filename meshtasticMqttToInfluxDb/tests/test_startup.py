@@ -0,0 +1,68 @@
+"""
+Test sul tempo di avvio del processo e sul registro protobuf lazy
+"""
+import os
+import subprocess
+import sys
+
+import proto_decode
+
+PACKAGE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "meshtasticMqttToInfluxDb")
+
+# Budget per l'import dei moduli del progetto (cumulativo, dipendenze incluse)
+STARTUP_BUDGET_MS = 300
+# Librerie che non devono essere importate solo per avviare il processo
+HEAVY_MODULES = ("meshtastic", "influxdb_client", "paho", "google.protobuf")
+
+
+def run_with_importtime(*args):
+    """Esegue il pacchetto con -X importtime e restituisce {modulo: tempo_cumulativo_us}"""
+    env = {"PATH": os.environ.get("PATH", ""), "HOME": os.environ.get("HOME", "/tmp")}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", PACKAGE_DIR, *args],
+        capture_output=True, text=True, env=env, timeout=30,
+    )
+    assert result.returncode == 0, result.stderr
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = int(cumulative_us)
+    return modules
+
+
+class TestStartup:
+    """Test sul costo di avvio"""
+
+    def test_heavy_modules_not_imported(self):
+        """--version non deve importare meshtastic, influxdb_client, paho o protobuf"""
+        modules = run_with_importtime("--version")
+        heavy = [name for name in modules if name.startswith(HEAVY_MODULES)]
+        assert heavy == [], f"Moduli pesanti importati all'avvio: {heavy}"
+
+    def test_startup_import_budget(self):
+        """L'import dei moduli del progetto resta sotto il budget"""
+        modules = run_with_importtime("--version")
+        project = ("config", "proto_decode", "mqtt", "influxdb", "ingest_queue", "utils")
+        total_ms = sum(modules[name] for name in project if name in modules) / 1000
+        assert total_ms < STARTUP_BUDGET_MS, f"Import del progetto: {total_ms:.1f} ms"
+
+
+class TestProtoRegistry:
+    """Test per il registro protobuf lazy con cache su disco"""
+
+    def test_registry_writes_and_reuses_cache(self, tmp_path, monkeypatch):
+        """Il secondo registro legge l'indice dalla cache senza ispezionare i moduli"""
+        cache_path = str(tmp_path / "protos.json")
+        registry = proto_decode.ProtoRegistry(cache_path=cache_path)
+        assert "ServiceEnvelope" in registry
+        assert os.path.exists(cache_path)
+
+        def fail():
+            raise AssertionError("get_available_protos non deve essere chiamata")
+
+        monkeypatch.setattr(proto_decode, "get_available_protos", fail)
+        cached = proto_decode.ProtoRegistry(cache_path=cache_path)
+        assert cached["Telemetry"].DESCRIPTOR.full_name == "meshtastic.protobuf.Telemetry"
+        assert len(cached) == len(registry)
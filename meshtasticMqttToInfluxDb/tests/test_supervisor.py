@@ -0,0 +1,82 @@
+"""
+Test per il modulo supervisor.py
+"""
+import os
+import time
+
+from mqtt import MqttClient
+from supervisor import WorkerSupervisor, StatsReporter
+
+
+def _crash_once_worker(index, stats_queue, marker):
+    """Invia un report e termina con errore al primo avvio, poi resta attivo."""
+    first_run = not os.path.exists(marker)
+    reporter = StatsReporter(stats_queue, index, interval=0.05)
+    reporter.start(lambda: {'metrics': {'messages': {('json',): 2}},
+                            'stats': {'ingest': {'enqueued': 2, 'host': 'x'}}, 'mqtt_connected': True})
+    if first_run:
+        time.sleep(0.3)
+        open(marker, 'w').close()
+        os._exit(1)
+    while True:
+        time.sleep(0.1)
+
+
+def _wait_for(condition, timeout=15.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+class TestSharedSubscription:
+    """Test per i topic della sottoscrizione condivisa"""
+
+    def _client(self, shared_group, topic_filters=("msh/#",)):
+        client = MqttClient.__new__(MqttClient)
+        client.root_topic = "msh"
+        client.shared_group = shared_group
+        client.topic_filters = list(topic_filters)
+        return client
+
+    def test_plain_subscription(self):
+        assert self._client('').subscription_topics() == ["msh/#"]
+
+    def test_shared_subscription(self):
+        assert self._client('ingest').subscription_topics() == ["$share/ingest/msh/#"]
+
+    def test_every_filter_is_shared(self):
+        client = self._client('ingest', ("msh/+/2/json/#", "msh/+/2/e/#"))
+        assert client.subscription_topics() == ["$share/ingest/msh/+/2/json/#", "$share/ingest/msh/+/2/e/#"]
+
+
+class TestWorkerSupervisor:
+    """Test per il supervisore dei processi di ingest"""
+
+    def test_invalid_process_count(self):
+        try:
+            WorkerSupervisor(_crash_once_worker, 0)
+            assert False, "ValueError atteso"
+        except ValueError:
+            pass
+
+    def test_restart_and_aggregation(self, tmp_path):
+        supervisor = WorkerSupervisor(_crash_once_worker, 1, args=(str(tmp_path / "crashed"),),
+                                      restart_delay=0.1, stop_timeout=5)
+        supervisor.start()
+        try:
+            def restarted_and_reported():
+                supervisor._drain_reports(timeout=0.05)
+                supervisor._check_workers()
+                return supervisor.restarts[0] == 1 and 0 in supervisor._reports
+            assert _wait_for(restarted_and_reported)
+        finally:
+            supervisor.shutdown()
+
+        # Le metriche del processo terminato restano nel totale
+        assert supervisor.metrics_snapshot() == {'messages': {('json',): 4}}
+        assert supervisor.component_stats('ingest') == {'enqueued': 2}
+        assert supervisor.get_stats()['restarts'] == 1
+        assert supervisor.get_stats()['alive'] == 0
@@ -0,0 +1,67 @@
+"""
+Test per il modulo topic_router.py
+"""
+import pytest
+
+from topic_router import TopicRouter, parse_subscriptions
+
+
+class TestParseSubscriptions:
+    """Test per il parsing di MQTT_SUBSCRIPTIONS"""
+
+    def test_default_is_everything_under_root(self):
+        assert parse_subscriptions("", "msh") == [("msh/#", "auto")]
+        assert parse_subscriptions("", None) == [("#", "auto")]
+
+    def test_filters_and_handlers(self):
+        value = "{root}/+/2/json/#=json; {root}/+/2/map/# = ignore ;{root}/+/2/e/#"
+        assert parse_subscriptions(value, "msh") == [
+            ("msh/+/2/json/#", "json"), ("msh/+/2/map/#", "ignore"), ("msh/+/2/e/#", "auto")]
+
+    @pytest.mark.parametrize("value", ["msh/#/json", "msh/a#", "msh/+x/json", "$share/g/msh/#", ";"])
+    def test_invalid_filters(self, value):
+        with pytest.raises(ValueError):
+            parse_subscriptions(value, "msh")
+
+
+class TestTopicRouter:
+    """Test per il trie dei filtri e i contatori per route"""
+
+    def setup_method(self):
+        self.calls = []
+        self.router = TopicRouter()
+        for topic_filter, name in (("msh/#", "all"), ("msh/+/2/json/#", "json"),
+                                   ("msh/EU_868/2/json/LongFast/+", "longfast"), ("msh/+/2/map", "map")):
+            self.router.add(topic_filter, lambda topic, payload, ts, name=name: self.calls.append(name), name)
+
+    def route_name(self, topic):
+        route = self.router.match(topic)
+        return route.handler_name if route is not None else None
+
+    def test_most_specific_filter_wins(self):
+        assert self.route_name("msh/EU_868/2/json/LongFast/!abcd1234") == "longfast"
+        assert self.route_name("msh/EU_868/2/json/MediumFast/!abcd1234") == "json"
+        assert self.route_name("msh/EU_868/2/map") == "map"
+        assert self.route_name("msh/EU_868/2/e/LongFast/!abcd1234") == "all"
+
+    def test_hash_matches_parent_level_and_not_other_roots(self):
+        assert self.route_name("msh") == "all"
+        assert self.route_name("other/EU_868/2/json/x") is None
+
+    def test_wildcards_do_not_match_dollar_topics(self):
+        router = TopicRouter()
+        router.add("#", None, "all")
+        router.add("$SYS/#", None, "sys")
+        assert router.match("$SYS/broker/uptime").handler_name == "sys"
+        assert router.match("$other/x") is None
+
+    def test_dispatch_counts_messages_bytes_and_unmatched(self):
+        self.router.dispatch("msh/EU_868/2/json/MediumFast/!gw", b'{"a": 1}', 0.0)
+        self.router.dispatch("msh/EU_868/2/json/MediumFast/!gw", b'{}', 0.0)
+        self.router.dispatch("other/topic", b'x', 0.0)
+        assert self.calls == ["json", "json"]
+        stats = self.router.get_stats()
+        assert stats['unmatched'] == 1
+        assert stats['routes']["msh/+/2/json/#"]['messages'] == 2
+        assert stats['routes']["msh/+/2/json/#"]['bytes'] == 10
+        assert stats['routes']["msh/#"]['messages'] == 0